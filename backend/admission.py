@@ -0,0 +1,299 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """Classic token bucket: refills `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, now, tokens=1):
+        """Seconds until `tokens` are available (0 if they already are)"""
+        self._refill(now)
+        if self.tokens >= tokens:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (tokens - self.tokens) / self.rate
+
+    def take(self, tokens=1):
+        self.tokens -= tokens
+
+    def idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted; carries a retry-after hint"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class AdmissionTicket:
+    """Held while a request runs; releases its slot when the block exits"""
+
+    def __init__(self, controller, user_key, admitted_at):
+        self.controller = controller
+        self.user_key = user_key
+        self.admitted_at = admitted_at
+        self.released = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Bounded queue plus token buckets in front of the /message handler.
+
+    A request is admitted if its user is under the per-user concurrency limit
+    and every bucket it touches (each configured Apps Script endpoint and the
+    LLM key) has a token. It then either takes a free worker slot or waits in
+    a bounded queue. Anything that can't be served soon is rejected right away
+    with a retry-after hint instead of piling onto the providers.
+    """
+
+    BUCKET_PRUNE_THRESHOLD = 1024
+
+    def __init__(
+        self,
+        max_active=8,
+        max_queue=32,
+        queue_timeout=10.0,
+        max_per_user=2,
+        endpoint_rate=2.0,
+        endpoint_burst=5,
+        llm_rate=5.0,
+        llm_burst=10,
+    ):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self.endpoint_rate = endpoint_rate
+        self.endpoint_burst = endpoint_burst
+        self.llm_rate = llm_rate
+        self.llm_burst = llm_burst
+
+        self.lock = threading.Condition()
+        self.active = 0
+        self.queued = 0
+        self.per_user = {}
+        self.endpoint_buckets = {}
+        self.llm_buckets = {}
+
+        self.admitted = 0
+        self.rejected = {}
+        self.wait_times = deque(maxlen=1000)
+        self.service_times = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_active=int(os.getenv("ADMISSION_MAX_ACTIVE", "8")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+            max_per_user=int(os.getenv("ADMISSION_MAX_PER_USER", "2")),
+            endpoint_rate=float(os.getenv("ADMISSION_ENDPOINT_RATE", "2")),
+            endpoint_burst=int(os.getenv("ADMISSION_ENDPOINT_BURST", "5")),
+            llm_rate=float(os.getenv("ADMISSION_LLM_RATE", "5")),
+            llm_burst=int(os.getenv("ADMISSION_LLM_BURST", "10")),
+        )
+
+    @staticmethod
+    def user_endpoints(user):
+        if not isinstance(user, dict):
+            return []
+        endpoints = [
+            user[key]
+            for key in ("gsheetsEndpoint", "calendarEndpoint")
+            if user.get(key)
+        ]
+        for key in ("gsheetsEndpoints", "calendarEndpoints"):
+            for url in (user.get(key) or {}).values():
+                if url and url not in endpoints:
+                    endpoints.append(url)
+        return endpoints
+
+    @staticmethod
+    def user_key(user):
+        if isinstance(user, dict) and user.get("id"):
+            return str(user["id"])
+        endpoints = AdmissionController.user_endpoints(user)
+        return "|".join(endpoints) if endpoints else "anonymous"
+
+    @staticmethod
+    def _llm_key_id(llm_key):
+        # Never keep the raw key around, only a short fingerprint
+        return hashlib.sha256((llm_key or "").encode()).hexdigest()[:12]
+
+    def _bucket(self, buckets, key, rate, burst, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.BUCKET_PRUNE_THRESHOLD:
+                for stale in [k for k, b in buckets.items() if b.idle(now)]:
+                    del buckets[stale]
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _reject(self, reason, retry_after):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(reason, retry_after)
+
+    def _estimated_wait(self):
+        """Rough time until a slot frees up, from recent service times"""
+        if self.service_times:
+            avg_service = sum(self.service_times) / len(self.service_times)
+        else:
+            avg_service = 5.0
+        ahead = self.queued + 1
+        return avg_service * ahead / max(1, self.max_active)
+
+    def admit(self, user, llm_key=None):
+        """Admit a request or raise AdmissionRejected. Blocks while queued."""
+        user_key = self.user_key(user)
+        enqueued_at = time.monotonic()
+
+        with self.lock:
+            now = time.monotonic()
+
+            if self.per_user.get(user_key, 0) >= self.max_per_user:
+                self._reject("user_concurrency", self._estimated_wait())
+
+            buckets = [
+                self._bucket(
+                    self.endpoint_buckets,
+                    endpoint,
+                    self.endpoint_rate,
+                    self.endpoint_burst,
+                    now,
+                )
+                for endpoint in self.user_endpoints(user)
+            ]
+            buckets.append(
+                self._bucket(
+                    self.llm_buckets,
+                    self._llm_key_id(llm_key),
+                    self.llm_rate,
+                    self.llm_burst,
+                    now,
+                )
+            )
+            bucket_wait = max(bucket.wait_time(now) for bucket in buckets)
+            if bucket_wait > 0:
+                self._reject("rate_limited", bucket_wait)
+
+            if self.active >= self.max_active and self.queued >= self.max_queue:
+                self._reject("queue_full", self._estimated_wait())
+
+            # Only spend tokens once we know the request will be queued or run
+            for bucket in buckets:
+                bucket.take()
+            self.per_user[user_key] = self.per_user.get(user_key, 0) + 1
+
+            if self.active >= self.max_active:
+                self.queued += 1
+                deadline = enqueued_at + self.queue_timeout
+                try:
+                    while self.active >= self.max_active:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._drop_user(user_key)
+                            self._reject("queue_timeout", self._estimated_wait())
+                        self.lock.wait(remaining)
+                finally:
+                    self.queued -= 1
+
+            self.active += 1
+            self.admitted += 1
+            admitted_at = time.monotonic()
+            self.wait_times.append(admitted_at - enqueued_at)
+
+        return AdmissionTicket(self, user_key, admitted_at)
+
+    def try_take(self, endpoint):
+        """Spend a token from `endpoint`'s bucket if one is free right now, for
+        optional work (such as prefetching) that should give way, not wait"""
+        with self.lock:
+            now = time.monotonic()
+            bucket = self._bucket(
+                self.endpoint_buckets,
+                endpoint,
+                self.endpoint_rate,
+                self.endpoint_burst,
+                now,
+            )
+            if bucket.wait_time(now) > 0:
+                return False
+            bucket.take()
+            return True
+
+    def _drop_user(self, user_key):
+        count = self.per_user.get(user_key, 0) - 1
+        if count > 0:
+            self.per_user[user_key] = count
+        else:
+            self.per_user.pop(user_key, None)
+
+    def _release(self, ticket):
+        with self.lock:
+            self.active -= 1
+            self._drop_user(ticket.user_key)
+            self.service_times.append(time.monotonic() - ticket.admitted_at)
+            self.lock.notify()
+
+    def metrics(self):
+        """Snapshot of queue depth, wait times and rejection counts"""
+        with self.lock:
+            waits = sorted(self.wait_times)
+
+            def percentile(p):
+                if not waits:
+                    return 0.0
+                return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+            capacity = self.max_active + self.max_queue
+            return {
+                "active": self.active,
+                "queued": self.queued,
+                "max_active": self.max_active,
+                "max_queue": self.max_queue,
+                "saturation": round((self.active + self.queued) / capacity, 3)
+                if capacity
+                else 1.0,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "wait_seconds": {
+                    "avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                    "p50": round(percentile(0.5), 4),
+                    "p95": round(percentile(0.95), 4),
+                    "max": round(waits[-1], 4) if waits else 0.0,
+                },
+                "users_in_flight": len(self.per_user),
+            }
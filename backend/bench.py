@@ -0,0 +1,280 @@
+"""Micro-benchmarks for the backend's hot paths.
+
+Run from the backend directory, e.g. `python bench.py results`. Nothing here
+talks to OpenAI or Apps Script; payloads are synthesized locally.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+
+def column_letter(col):
+    letters = ""
+    while col > 0:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def make_sheet_payload(rows, cols):
+    """A readSheet-style response body with rows x cols cells"""
+    data = {}
+    for row in range(1, rows + 1):
+        for col in range(1, cols + 1):
+            if row == 1:
+                value = f"Header {col}"
+            elif col == 1:
+                value = f"2024-01-{(row % 28) + 1:02d}"
+            else:
+                value = round(row * col * 1.25, 2)
+            data[f"{column_letter(col)}{row}"] = {"value": value}
+    return json.dumps({"success": True, "sheetName": "Sheet1", "data": data}, indent=2)
+
+
+def measure(label, fn, repeat=5):
+    """Best-of-`repeat` wall time plus peak traced memory for one run"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<32} {best * 1000:9.2f} ms  peak {peak / 1024 / 1024:8.2f} MiB")
+    return best, peak
+
+
+def bench_results(steps=8, rows=1000, cols=10):
+    """Tool-result pipeline over a multi-step chain that reads a rows x cols
+    sheet on every step, as handle_message rebuilds the prompt each step"""
+    from results import ToolResult
+
+    body = make_sheet_payload(rows, cols)
+    # Sheet text containing "Result of" sent the old loop through its
+    # re-parse pass on every step; the plain sheet skipped it
+    noted = body.replace("Header 2", "Result of audit", 1)
+    call_info = (
+        "<function_call>\n  <platform>gsheets</platform>\n"
+        "  <function>read_sheet</function>\n  <parameters>\n"
+        '    <parameter name="sheet_name">Sheet1</parameter>\n'
+        "  </parameters>\n</function_call>"
+    )
+    io_continue = (
+        "<function_call><platform>io</platform><function>continue</function>"
+        "<parameters></parameters></function_call>"
+    )
+
+    def clean_json_for_prompt(json_str):
+        # As removed from main.py
+        try:
+            json_str = json_str.replace('\\"', '"').replace("\\\\", "\\")
+            parsed = json.loads(json_str)
+            return json.dumps(parsed, separators=(",", ":"))
+        except ValueError:
+            return json_str
+
+    def legacy_prompt(call_responses):
+        # handle_message's loop before ToolResult
+        messages = []
+        for response in call_responses:
+            if '"platform":"io"' in response.replace(
+                " ", ""
+            ) and '"function":"continue"' in response.replace(" ", ""):
+                continue
+            if "Result of" in response:
+                start = response.find("{")
+                end = response.rfind("}") + 1
+                if start >= 0 and end > start:
+                    cleaned = clean_json_for_prompt(response[start:end])
+                    response = response[:start] + cleaned + response[end:]
+            messages.append({"role": "assistant", "content": response})
+        return messages
+
+    def legacy(payload):
+        call_responses = []
+        for _ in range(steps):
+            legacy_prompt(call_responses)
+            # read_sheet: response.json(), then format_function_result
+            result_str = json.dumps(json.loads(payload), separators=(",", ":"))
+            call_responses.append(call_info)
+            call_responses.append(
+                "<function_result>\n  <platform>gsheets</platform>\n"
+                f"  <function>read_sheet</function>\n  <result>{result_str}</result>\n"
+                "</function_result>"
+            )
+            call_responses.append(io_continue)
+        legacy_prompt(call_responses)
+
+    def current_prompt(call_responses):
+        # handle_message's loop now
+        messages = []
+        for response in call_responses:
+            if isinstance(response, ToolResult):
+                messages.append({"role": "assistant", "content": response.text})
+                continue
+            if '"platform":"io"' in response.replace(
+                " ", ""
+            ) and '"function":"continue"' in response.replace(" ", ""):
+                continue
+            messages.append({"role": "assistant", "content": response})
+        return messages
+
+    def current(payload):
+        call_responses = []
+        for _ in range(steps):
+            current_prompt(call_responses)
+            call_responses.append(call_info)
+            call_responses.append(ToolResult("gsheets", "read_sheet", json.loads(payload)))
+            call_responses.append(io_continue)
+        current_prompt(call_responses)
+
+    print(f"Tool-result pipeline: {steps} steps, each reading {rows * cols} cells")
+    for label, payload in (("plain sheet", body), ('sheet with "Result of"', noted)):
+        print(label)
+        old_time, old_peak = measure("  legacy (rescan every step)", lambda: legacy(payload))
+        new_time, new_peak = measure("  ToolResult (render once)", lambda: current(payload))
+        print(
+            f"  speedup {old_time / new_time:.2f}x, "
+            f"peak memory {new_peak / old_peak:.0%} of legacy"
+        )
+
+
+def bench_timezones(count=5000, zone="America/Los_Angeles"):
+    """Bulk event time normalization, one import of `count` naive-time events"""
+    from datetime import datetime, timedelta
+    from zoneinfo import ZoneInfo
+
+    import pytz
+    from tzlocal import get_localzone
+
+    from timecontext import TimeContext
+
+    # A few events a day for months, spanning the spring and fall transitions
+    first = datetime(2024, 2, 1, 8, 0)
+    events = [
+        {
+            "title": f"Event {i}",
+            "start": (first + timedelta(minutes=97 * i)).isoformat(),
+            "end": (first + timedelta(minutes=97 * i + 45)).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+    tz = ZoneInfo(zone)
+
+    def legacy_format(dt_str, is_end=False):
+        # The per-value conversion create_events used before TimeContext; it
+        # resolved the server zone every time, here pinned to `zone` so both
+        # sides do the same conversion
+        get_localzone()
+        if "T" not in dt_str:
+            dt_str = f"{dt_str}T{'23:59:59' if is_end else '00:00:00'}"
+        dt = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
+        if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
+            naive_dt = dt.replace(tzinfo=None)
+            dt = datetime.combine(naive_dt.date(), naive_dt.time(), tzinfo=tz)
+        return dt.astimezone(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def legacy():
+        processed = []
+        for event in events:
+            event = event.copy()
+            event["start"] = legacy_format(event["start"])
+            event["end"] = legacy_format(event["end"], is_end=True)
+            processed.append(event)
+
+    def current():
+        TimeContext(ZoneInfo(zone)).normalize_events(events)
+
+    print(f"Event time normalization: {count} events")
+    old_time, _ = measure("per-value _format_datetime", legacy)
+    new_time, _ = measure("TimeContext.normalize_events", current)
+    print(f"speedup {old_time / new_time:.2f}x")
+
+
+def bench_analyze(rows=100_000, cols=5):
+    """gsheets.analyze on a rows x cols sheet against the pure-Python query path"""
+    from sheet_query import SheetQuery, cells_to_grid
+    from sheet_table import SheetTable
+
+    sheet = json.loads(make_sheet_payload(rows, cols))
+    grid = cells_to_grid(sheet["data"])
+    table = SheetTable.from_grid(grid)
+
+    print(f"Local analytics: {rows} rows x {cols} columns")
+    measure("build grid from cells", lambda: cells_to_grid(sheet["data"]), repeat=1)
+    measure("build typed table", lambda: SheetTable.from_grid(grid), repeat=1)
+
+    group = SheetQuery(
+        group_by=["Header 1"], aggregate=[{"op": "avg", "column": "Header 3"}]
+    )
+    old_time, _ = measure("group-by mean, Python", lambda: group.run(grid))
+    new_time, _ = measure(
+        "group-by mean, NumPy",
+        lambda: table.analyze("group_by", by="Header 1", column="Header 3", aggregate="mean"),
+    )
+    print(f"speedup {old_time / new_time:.2f}x")
+
+    top = SheetQuery(order_by={"column": "Header 4", "desc": True}, limit=5)
+    old_time, _ = measure("top 5, Python sort", lambda: top.run(grid))
+    new_time, _ = measure(
+        "top 5, NumPy argpartition", lambda: table.analyze("top_k", column="Header 4", n=5)
+    )
+    print(f"speedup {old_time / new_time:.2f}x")
+
+    old_time, _ = measure("sum, Python", lambda: sum(row[2] for row in grid[1:]))
+    new_time, _ = measure("sum, NumPy", lambda: table.analyze("sum", column="Header 3"))
+    print(f"speedup {old_time / new_time:.2f}x")
+
+
+def bench_decode(rows=20_000, cols=10):
+    """read_sheet decode of a large response body, buffered vs streamed"""
+    from stream_decode import CHUNK_SIZE, PROMPT_BUDGET, decode_sheet
+
+    body = make_sheet_payload(rows, cols).encode()
+
+    def chunks():
+        for start in range(0, len(body), CHUNK_SIZE):
+            yield body[start : start + CHUNK_SIZE]
+
+    def legacy():
+        # response.json(): the whole body as text, then a dict per cell
+        return json.loads(body.decode("utf-8"))
+
+    print(f"Sheet response decode: {rows * cols} cells, {len(body) / 1024 / 1024:.1f} MiB")
+    old_time, old_peak = measure("response.json()", legacy, repeat=3)
+    new_time, new_peak = measure("streamed into rows", lambda: decode_sheet(chunks()), repeat=3)
+    print(
+        f"speedup {old_time / new_time:.2f}x, peak memory {new_peak / old_peak:.0%} of legacy"
+    )
+    cut_time, cut_peak = measure(
+        f"streamed, {PROMPT_BUDGET} char budget",
+        lambda: decode_sheet(chunks(), PROMPT_BUDGET),
+        repeat=3,
+    )
+    print(f"with early cutoff: {old_time / cut_time:.0f}x faster, peak {cut_peak / old_peak:.1%}")
+
+
+BENCHMARKS = {
+    "analyze": bench_analyze,
+    "decode": bench_decode,
+    "results": bench_results,
+    "timezones": bench_timezones,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    args = parser.parse_args()
+
+    names = sorted(BENCHMARKS) if args.benchmark == "all" else [args.benchmark]
+    for name in names:
+        BENCHMARKS[name]()
+        print()
@@ -8,7 +8,22 @@ function doGet(e) {
 	
 	switch (action) {
 		case 'listEvents':
-			return handleListEvents({ start, end });
+			return handleListEvents({
+				start,
+				end,
+				fields: e.parameter.fields,
+				maxResults: e.parameter.maxResults,
+				offset: e.parameter.offset,
+				format: e.parameter.format,
+				ifVersion: e.parameter.ifVersion
+			});
+		case 'syncEvents':
+			return handleSyncEvents({
+				start,
+				end,
+				updatedMin: e.parameter.updatedMin,
+				ifVersion: e.parameter.ifVersion
+			});
 		default:
 			return jsonResponse({ error: 'Unknown action' });
 	}
@@ -23,16 +38,29 @@ function doPost(e) {
 		const action = payload.action;
 		const data = payload.data;
 		
+		let response;
 		switch (action) {
 			case 'createEvents':
-				return handleCreateEvents(data);
+				response = handleCreateEvents(data);
+				break;
 			case 'updateEvent':
-				return handleUpdateEvent(data);
+				response = handleUpdateEvent(data);
+				break;
 			case 'deleteEvent':
-				return handleDeleteEvent(data);
+				response = handleDeleteEvent(data);
+				break;
+			case 'updateEvents':
+				response = handleUpdateEvents(data);
+				break;
+			case 'deleteEvents':
+				response = handleDeleteEvents(data);
+				break;
 			default:
 				return jsonResponse({ error: 'Unknown action' });
 		}
+		// After the write, so no reader can pair the new token with old data
+		bumpVersion();
+		return response;
 	} catch (error) {
 		return jsonResponse({ error: 'Invalid request: ' + error.message });
 	}
@@ -44,31 +72,234 @@ function jsonResponse(data) {
 		.setMimeType(ContentService.MimeType.JSON);
 }
 
+// Version tokens. Every read returns a `version`; a caller that sends it back
+// as ifVersion gets { notModified: true } instead of the data when nothing
+// changed. With installVersionTriggers() run once, the token is a marker in
+// CacheService replaced on every change, so an unchanged read is answered
+// without touching the calendar. Without the triggers, edits made elsewhere
+// can't be seen, so the token is a hash of the response content instead.
+const VERSION_KEY = 'calendarVersion';
+const VERSION_TTL = 21600;
+
+function currentMarker() {
+	if (!PropertiesService.getScriptProperties().getProperty('versionTriggers')) {
+		return null;
+	}
+	const cache = CacheService.getScriptCache();
+	let marker = cache.get(VERSION_KEY);
+	if (!marker) {
+		marker = 'm' + Utilities.getUuid();
+		cache.put(VERSION_KEY, marker, VERSION_TTL);
+	}
+	return marker;
+}
+
+function bumpVersion() {
+	CacheService.getScriptCache().remove(VERSION_KEY);
+}
+
+function contentHash(text) {
+	const digest = Utilities.computeDigest(Utilities.DigestAlgorithm.MD5, text);
+	return 'h' + Utilities.base64EncodeWebSafe(digest);
+}
+
+// Send `payload` with its version, or a notModified reply if the caller has it
+function versionedResponse(payload, marker, ifVersion) {
+	const version = marker || contentHash(JSON.stringify(payload));
+	if (ifVersion && ifVersion === version) {
+		return jsonResponse({ notModified: true, version: version });
+	}
+	payload.version = version;
+	return jsonResponse(payload);
+}
+
+// Run once from the editor to have calendar changes replace the version marker
+function installVersionTriggers() {
+	ScriptApp.newTrigger('onCalendarChanged')
+		.forUserCalendar(Session.getEffectiveUser().getEmail())
+		.onEventUpdated()
+		.create();
+	PropertiesService.getScriptProperties().setProperty('versionTriggers', 'true');
+}
+
+function onCalendarChanged() {
+	bumpVersion();
+}
+
 // Calendar operation handlers
+// Getters for the fields listEvents can project; only requested ones are
+// called, so skipping description also skips that service call.
+const EVENT_FIELD_GETTERS = {
+	id: event => event.getId(),
+	title: event => event.getTitle(),
+	start: event => event.getStartTime().toISOString(),
+	end: event => event.getEndTime().toISOString(),
+	description: event => event.getDescription(),
+	recurring: event => event.isRecurringEvent()
+};
+
 function handleListEvents(data) {
 	try {
+		// Read the marker before the events so a change in between can only
+		// make the token stale, never the data
+		const marker = currentMarker();
+		if (marker && marker === data.ifVersion) {
+			return jsonResponse({ notModified: true, version: marker });
+		}
 		const calendar = CalendarApp.getDefaultCalendar();
 		const startDate = data.start ? new Date(data.start) : new Date();
 		const endDate = data.end ? new Date(data.end) : new Date(startDate.getTime() + 7 * 24 * 60 * 60 * 1000);
 		
 		const events = calendar.getEvents(startDate, endDate);
-		const eventList = events.map(event => ({
-			id: event.getId(),
-			title: event.getTitle(),
-			start: event.getStartTime().toISOString(),
-			end: event.getEndTime().toISOString(),
-			description: event.getDescription()
-		}));
+		const fields = data.fields
+			? data.fields.split(',').filter(field => EVENT_FIELD_GETTERS[field])
+			: ['id', 'title', 'start', 'end', 'description'];
+		const offset = data.offset ? parseInt(data.offset, 10) : 0;
+		const maxResults = data.maxResults ? parseInt(data.maxResults, 10) : events.length;
+		const page = events.slice(offset, offset + maxResults);
+		const nextOffset = offset + maxResults < events.length ? offset + maxResults : undefined;
+		
+		if (data.format === 'rows') {
+			return versionedResponse({
+				success: true,
+				columns: fields,
+				rows: page.map(event => fields.map(field => EVENT_FIELD_GETTERS[field](event))),
+				total: events.length,
+				next_offset: nextOffset
+			}, marker, data.ifVersion);
+		}
+		
+		const eventList = page.map(event => {
+			const item = {};
+			for (const field of fields) item[field] = EVENT_FIELD_GETTERS[field](event);
+			return item;
+		});
+		
+		return versionedResponse({
+			success: true,
+			events: eventList,
+			next_offset: nextOffset
+		}, marker, data.ifVersion);
+	} catch (error) {
+		return jsonResponse({ error: 'Failed to list events: ' + error.message });
+	}
+}
+
+// Incremental sync for the backend's local event mirror.
+// Returns every event in [start, end) changed since updatedMin (all of them
+// when updatedMin is omitted), including cancelled ones so deletions can be
+// applied. Uses the Calendar advanced service when it is enabled; otherwise
+// falls back to a full CalendarApp read of the window.
+function handleSyncEvents(data) {
+	try {
+		const marker = currentMarker();
+		if (marker && marker === data.ifVersion) {
+			return jsonResponse({ notModified: true, version: marker });
+		}
+		const syncedAt = new Date().toISOString();
+		const startDate = data.start ? new Date(data.start) : new Date();
+		const endDate = data.end ? new Date(data.end) : new Date(startDate.getTime() + 7 * 24 * 60 * 60 * 1000);
+		
+		if (typeof Calendar === 'undefined') {
+			const events = CalendarApp.getDefaultCalendar().getEvents(startDate, endDate);
+			return jsonResponse({
+				success: true,
+				full: true,
+				syncedAt: syncedAt,
+				version: marker,
+				events: events.map(event => ({
+					key: event.getId() + '_' + event.getStartTime().getTime(),
+					id: event.getId(),
+					title: event.getTitle(),
+					start: event.getStartTime().toISOString(),
+					end: event.getEndTime().toISOString(),
+					description: event.getDescription(),
+					recurring: event.isRecurringEvent()
+				}))
+			});
+		}
+		
+		const eventList = [];
+		let pageToken;
+		do {
+			const options = {
+				timeMin: startDate.toISOString(),
+				timeMax: endDate.toISOString(),
+				singleEvents: true,
+				showDeleted: true,
+				maxResults: 2500,
+				pageToken: pageToken
+			};
+			if (data.updatedMin) options.updatedMin = data.updatedMin;
+			
+			const page = Calendar.Events.list('primary', options);
+			for (const item of page.items || []) {
+				const startTime = item.start && (item.start.dateTime || item.start.date);
+				const endTime = item.end && (item.end.dateTime || item.end.date);
+				eventList.push({
+					key: item.id,
+					id: item.iCalUID,
+					title: item.summary || '',
+					start: startTime ? new Date(startTime).toISOString() : null,
+					end: endTime ? new Date(endTime).toISOString() : null,
+					description: item.description || '',
+					recurring: Boolean(item.recurringEventId),
+					cancelled: item.status === 'cancelled'
+				});
+			}
+			pageToken = page.nextPageToken;
+		} while (pageToken);
 		
 		return jsonResponse({
 			success: true,
+			full: !data.updatedMin,
+			syncedAt: syncedAt,
+			version: marker,
 			events: eventList
 		});
 	} catch (error) {
-		return jsonResponse({ error: 'Failed to list events: ' + error.message });
+		return jsonResponse({ error: 'Failed to sync events: ' + error.message });
 	}
 }
 
+// Map a recurrence object ({ frequency, interval, days, monthDays, until,
+// count }) to a CalendarApp EventRecurrence. monthDays with days picks the nth
+// weekday of the month: the first Monday is a Monday on days 1-7.
+function buildRecurrence(rule) {
+	const recurrence = CalendarApp.newRecurrence();
+	let ruleBuilder;
+	switch (rule.frequency) {
+		case 'daily':
+			ruleBuilder = recurrence.addDailyRule();
+			break;
+		case 'weekly':
+			ruleBuilder = recurrence.addWeeklyRule();
+			break;
+		case 'monthly':
+			ruleBuilder = recurrence.addMonthlyRule();
+			break;
+		case 'yearly':
+			ruleBuilder = recurrence.addYearlyRule();
+			break;
+		default:
+			throw new Error('Unsupported recurrence frequency: ' + rule.frequency);
+	}
+	
+	if (rule.interval && rule.interval > 1) ruleBuilder = ruleBuilder.interval(rule.interval);
+	if (rule.days && rule.days.length) {
+		ruleBuilder = ruleBuilder.onlyOnWeekdays(rule.days.map(day => CalendarApp.Weekday[day]));
+	}
+	if (rule.monthDays && rule.monthDays.length) {
+		ruleBuilder = ruleBuilder.onlyOnMonthDays(rule.monthDays);
+	}
+	if (rule.until) {
+		ruleBuilder = ruleBuilder.until(new Date(rule.until));
+	} else if (rule.count) {
+		ruleBuilder = ruleBuilder.times(rule.count);
+	}
+	return recurrence;
+}
+
 function handleCreateEvents(data) {
 	if (!Array.isArray(data.events)) {
 		return jsonResponse({ error: 'Events array is required' });
@@ -89,6 +320,27 @@ function handleCreateEvents(data) {
 			}
 			
 			try {
+				if (eventData.recurrence) {
+					// One service call for the whole series instead of one per occurrence
+					const series = calendar.createEventSeries(
+						eventData.title,
+						new Date(eventData.start),
+						new Date(eventData.end),
+						buildRecurrence(eventData.recurrence),
+						{ description: eventData.description }
+					);
+					
+					createdEvents.push({
+						id: series.getId(),
+						title: series.getTitle(),
+						start: eventData.start,
+						end: eventData.end,
+						description: series.getDescription(),
+						recurrence: eventData.recurrence
+					});
+					continue;
+				}
+				
 				const event = calendar.createEvent(
 					eventData.title,
 					new Date(eventData.start),
@@ -174,6 +426,88 @@ function handleDeleteEvent(data) {
 	}
 }
 
+// Batch handlers: one execution for many events, with a result per item so a
+// single bad id doesn't fail the whole batch.
+function handleUpdateEvents(data) {
+	if (!Array.isArray(data.events)) {
+		return jsonResponse({ error: 'Events array is required' });
+	}
+	
+	try {
+		const calendar = CalendarApp.getDefaultCalendar();
+		const results = data.events.map(eventData => {
+			if (!eventData.id) {
+				return { id: null, success: false, error: 'Event ID is required' };
+			}
+			try {
+				const event = calendar.getEventById(eventData.id);
+				if (!event) {
+					return { id: eventData.id, success: false, error: 'Event not found' };
+				}
+				
+				if (eventData.title) event.setTitle(eventData.title);
+				if (eventData.start || eventData.end) {
+					event.setTime(
+						eventData.start ? new Date(eventData.start) : event.getStartTime(),
+						eventData.end ? new Date(eventData.end) : event.getEndTime()
+					);
+				}
+				if (eventData.description) event.setDescription(eventData.description);
+				
+				return {
+					id: event.getId(),
+					success: true,
+					title: event.getTitle(),
+					start: event.getStartTime().toISOString(),
+					end: event.getEndTime().toISOString()
+				};
+			} catch (eventError) {
+				return { id: eventData.id, success: false, error: eventError.message };
+			}
+		});
+		
+		return jsonResponse({
+			success: true,
+			updated: results.filter(result => result.success).length,
+			failed: results.filter(result => !result.success).length,
+			results: results
+		});
+	} catch (error) {
+		return jsonResponse({ error: 'Failed to update events: ' + error.message });
+	}
+}
+
+function handleDeleteEvents(data) {
+	if (!Array.isArray(data.ids)) {
+		return jsonResponse({ error: 'Ids array is required' });
+	}
+	
+	try {
+		const calendar = CalendarApp.getDefaultCalendar();
+		const results = data.ids.map(id => {
+			try {
+				const event = calendar.getEventById(id);
+				if (!event) {
+					return { id: id, success: false, error: 'Event not found' };
+				}
+				event.deleteEvent();
+				return { id: id, success: true };
+			} catch (eventError) {
+				return { id: id, success: false, error: eventError.message };
+			}
+		});
+		
+		return jsonResponse({
+			success: true,
+			deleted: results.filter(result => result.success).length,
+			failed: results.filter(result => !result.success).length,
+			results: results
+		});
+	} catch (error) {
+		return jsonResponse({ error: 'Failed to delete events: ' + error.message });
+	}
+}
+
 // Simple test function
 function testCalendarOperations() {
 	Logger.log('Starting calendar operations test...');
@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from stream_decode import decode_rows, response_chunks
+
+# How long a mirror answers queries before asking Apps Script for changes
+MIRROR_MAX_AGE = float(os.getenv("CALENDAR_MIRROR_MAX_AGE", "30"))
+# Overlap between consecutive incremental syncs, to absorb clock skew
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+def to_timestamp(value):
+    """Epoch seconds for an ISO 8601 string (or pass through numbers)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def to_iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class IntervalIndex:
+    """Intervals sorted by start, answering overlap queries with bisect.
+
+    Candidates for a query [start, end) are the intervals whose start lies in
+    [start - longest_duration, end), so only that slice is scanned instead of
+    the whole list.
+    """
+
+    def __init__(self, intervals=()):
+        self.items = sorted(intervals)
+        self.starts = [item[0] for item in self.items]
+        self.max_duration = max((e - s for s, e, _ in self.items), default=0)
+
+    def overlapping(self, start, end):
+        """(start, end, key) tuples intersecting [start, end), sorted by start"""
+        lo = bisect_left(self.starts, start - self.max_duration)
+        hi = bisect_left(self.starts, end)
+        return [item for item in self.items[lo:hi] if item[1] > start]
+
+    def __len__(self):
+        return len(self.items)
+
+
+class CalendarMirror:
+    """Local copy of one calendar endpoint's events, kept fresh incrementally.
+
+    The mirror covers a time window. Queries inside the window are answered
+    from the interval index after a cheap `syncEvents` call for changes since
+    the last sync (skipped server-side when the endpoint's version marker
+    is unchanged); queries outside it fetch just the missing range. An event
+    moved entirely out of the covered window keeps its old copy until the
+    next forced refresh.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.events = {}
+        self.window = None
+        self.synced_at = None
+        self.version = None
+        self.checked_at = 0.0
+        self.index = None
+        self.lock = threading.Lock()
+
+    def _fetch(self, start, end, updated_min=None, if_version=None):
+        params = {"action": "syncEvents", "start": to_iso(start), "end": to_iso(end)}
+        if updated_min:
+            params["updatedMin"] = updated_min
+        if if_version:
+            params["ifVersion"] = if_version
+        with requests.get(self.endpoint, params=params, stream=True) as response:
+            data = decode_rows(response_chunks(response), "events")
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        return data
+
+    def _apply(self, data, start=None, end=None):
+        if data.get("full") and start is not None:
+            # A full read replaces whatever the mirror held for that range
+            for key in [
+                key
+                for key, event in self.events.items()
+                if event["_start"] < end and event["_end"] > start
+            ]:
+                del self.events[key]
+
+        for event in data.get("events", []):
+            key = event.get("key") or event.get("id")
+            if event.get("cancelled") or not event.get("start"):
+                self.events.pop(key, None)
+                continue
+            event = dict(event)
+            event["_start"] = to_timestamp(event["start"])
+            event["_end"] = to_timestamp(event["end"])
+            self.events[key] = event
+
+        # Incremental syncs must cover changes since the oldest fetch
+        synced_at = data.get("syncedAt")
+        if synced_at and (self.synced_at is None or synced_at < self.synced_at):
+            self.synced_at = synced_at
+        self.index = None
+
+    def _sync_changes(self):
+        since = datetime.fromisoformat(self.synced_at.replace("Z", "+00:00"))
+        data = self._fetch(
+            self.window[0],
+            self.window[1],
+            updated_min=(since - SYNC_OVERLAP).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            if_version=self.version,
+        )
+        if data.get("notModified"):
+            # Nothing changed since the last sync; keep the old sync point
+            return
+        self.synced_at = None
+        self._apply(data, *self.window)
+        self.version = data.get("version")
+
+    def _extend(self, start, end):
+        """Fetch the parts of [start, end) the window doesn't cover yet"""
+        if self.window is None:
+            gaps = [(start, end)]
+            new_window = (start, end)
+        else:
+            gaps = []
+            if start < self.window[0]:
+                gaps.append((start, self.window[0]))
+            if end > self.window[1]:
+                gaps.append((self.window[1], end))
+            new_window = (min(start, self.window[0]), max(end, self.window[1]))
+
+        versions = {self.version} if self.window is not None else set()
+        for gap_start, gap_end in gaps:
+            data = self._fetch(gap_start, gap_end)
+            self._apply(data, gap_start, gap_end)
+            versions.add(data.get("version"))
+        # Only trust the version marker if every part of the window was read
+        # under the same one; otherwise the next sync has to do a real check
+        self.version = versions.pop() if len(versions) == 1 else None
+        self.window = new_window
+
+    def invalidate(self):
+        """Make the next query check for changes regardless of MIRROR_MAX_AGE"""
+        self.checked_at = 0.0
+
+    def query(self, start, end, refresh=False):
+        """Events overlapping [start, end) (epoch seconds), sorted by start"""
+        with self.lock:
+            if refresh:
+                self.events = {}
+                self.window = None
+                self.synced_at = None
+                self.version = None
+                self.index = None
+
+            if self.window is not None and time.time() - self.checked_at > MIRROR_MAX_AGE:
+                self._sync_changes()
+                self.checked_at = time.time()
+
+            if self.window is None or start < self.window[0] or end > self.window[1]:
+                self._extend(start, end)
+                self.checked_at = time.time()
+
+            if self.index is None:
+                self.index = IntervalIndex(
+                    (event["_start"], event["_end"], key)
+                    for key, event in self.events.items()
+                )
+
+            return [
+                self._public(self.events[key])
+                for _, _, key in self.index.overlapping(start, end)
+            ]
+
+    @staticmethod
+    def _public(event):
+        """The listEvents shape, flagging occurrences of recurring series"""
+        public = {
+            k: v
+            for k, v in event.items()
+            if k in ("id", "title", "start", "end", "description")
+        }
+        if event.get("recurring"):
+            public["recurring"] = True
+        return public
+
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_mirror(endpoint):
+    with _mirrors_lock:
+        mirror = _mirrors.get(endpoint)
+        if mirror is None:
+            mirror = _mirrors[endpoint] = CalendarMirror(endpoint)
+        return mirror
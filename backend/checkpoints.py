@@ -0,0 +1,248 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db")
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL", str(24 * 3600)))
+# A running request that hasn't checkpointed for this long is taken to be dead
+CHECKPOINT_STALE_AFTER = float(os.getenv("CHECKPOINT_STALE_AFTER", "600"))
+
+
+class RequestInProgress(Exception):
+    """Raised when a request id is still being run by someone else"""
+
+
+class CheckpointStore:
+    """SQLite store of per-step agent-loop state, keyed by request id.
+
+    For every model step it keeps the raw model output, the call_responses
+    entries produced by each call that succeeded, and (once the step is done)
+    the full call_responses snapshot along with any buffered writes not yet
+    sent. That is enough to pick a failed request back up without paying
+    again for earlier LLM calls or connector calls.
+    """
+
+    def __init__(
+        self,
+        path=CHECKPOINT_DB_PATH,
+        ttl=CHECKPOINT_TTL,
+        stale_after=CHECKPOINT_STALE_AFTER,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.stale_after = stale_after
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS requests (
+                    request_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS steps (
+                    request_id TEXT NOT NULL,
+                    depth INTEGER NOT NULL,
+                    model_output TEXT,
+                    results TEXT NOT NULL DEFAULT '{}',
+                    call_responses TEXT,
+                    complete INTEGER NOT NULL DEFAULT 0,
+                    truncated INTEGER NOT NULL DEFAULT 0,
+                    pending_writes TEXT,
+                    PRIMARY KEY (request_id, depth)
+                )"""
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(steps)")}
+            if "truncated" not in columns:
+                # Stores created before the model's finish reason was kept
+                conn.execute(
+                    "ALTER TABLE steps ADD COLUMN truncated INTEGER NOT NULL DEFAULT 0"
+                )
+            if "pending_writes" not in columns:
+                # Stores created before buffered writes were checkpointed
+                conn.execute("ALTER TABLE steps ADD COLUMN pending_writes TEXT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _live(self, row, now):
+        return (
+            row["status"] == "running" and row["updated_at"] >= now - self.stale_after
+        )
+
+    def begin(self, request_id, payload):
+        """Start (or restart) a request, dropping any older checkpoints for it.
+        Raises RequestInProgress if the id is still running elsewhere."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT status, updated_at FROM requests WHERE request_id = ?",
+                    (request_id,),
+                ).fetchone()
+                if row is not None and self._live(row, now):
+                    raise RequestInProgress(request_id)
+                expired = [
+                    row["request_id"]
+                    for row in conn.execute(
+                        "SELECT request_id FROM requests WHERE updated_at < ?",
+                        (now - self.ttl,),
+                    )
+                ]
+                for old_id in expired + [request_id]:
+                    conn.execute("DELETE FROM steps WHERE request_id = ?", (old_id,))
+                    conn.execute(
+                        "DELETE FROM requests WHERE request_id = ?", (old_id,)
+                    )
+                conn.execute(
+                    "INSERT INTO requests (request_id, payload, status, updated_at) "
+                    "VALUES (?, ?, 'running', ?)",
+                    (request_id, json.dumps(payload), now),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, request_id):
+        """Mark a stopped request as running again before resuming it. Raises
+        RequestInProgress if it is still running elsewhere (or already done)."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE requests SET status = 'running', updated_at = ? "
+                "WHERE request_id = ? AND status != 'done' "
+                "AND (status != 'running' OR updated_at < ?)",
+                (now, request_id, now - self.stale_after),
+            )
+        if cursor.rowcount != 1:
+            raise RequestInProgress(request_id)
+
+    def load_request(self, request_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload, status, updated_at FROM requests WHERE request_id = ?",
+                (request_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "payload": json.loads(row["payload"]),
+            "status": row["status"],
+            # Still being run by another handler or worker
+            "live": self._live(row, time.time()),
+        }
+
+    def set_status(self, request_id, status):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE requests SET status = ?, updated_at = ? WHERE request_id = ?",
+                (status, time.time(), request_id),
+            )
+
+    def resume_point(self, request_id):
+        """Depth to resume at, and the call_responses and buffered writes still
+        unsent (see WriteBuffer.snapshot) of the last complete step"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT depth, call_responses, pending_writes FROM steps "
+                "WHERE request_id = ? AND complete = 1 ORDER BY depth DESC LIMIT 1",
+                (request_id,),
+            ).fetchone()
+        if row is None:
+            return 0, [], []
+        pending = json.loads(row["pending_writes"]) if row["pending_writes"] else []
+        return row["depth"] + 1, json.loads(row["call_responses"]), pending
+
+    def load_step(self, request_id, depth):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT model_output, results, complete, truncated FROM steps "
+                "WHERE request_id = ? AND depth = ?",
+                (request_id, depth),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "model_output": row["model_output"],
+            "results": json.loads(row["results"]),
+            "complete": bool(row["complete"]),
+            "truncated": bool(row["truncated"]),
+        }
+
+    def save_output(self, request_id, depth, model_output, truncated=False):
+        """Record a step's model output and whether it hit the token limit"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO steps "
+                "(request_id, depth, model_output, truncated) VALUES (?, ?, ?, ?)",
+                (request_id, depth, model_output, int(truncated)),
+            )
+            self._touch(conn, request_id)
+
+    @staticmethod
+    def _touch(conn, request_id):
+        conn.execute(
+            "UPDATE requests SET updated_at = ? WHERE request_id = ?",
+            (time.time(), request_id),
+        )
+
+    def save_call(self, request_id, depth, index, entries, continued):
+        """Record the call_responses entries a successful call produced"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE steps SET results = json_set(results, ?, json(?)) "
+                "WHERE request_id = ? AND depth = ?",
+                (
+                    f'$."{index}"',
+                    json.dumps({"entries": entries, "continue": continued}),
+                    request_id,
+                    depth,
+                ),
+            )
+            self._touch(conn, request_id)
+
+    def complete_step(self, request_id, depth, call_responses, pending_writes=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE steps SET complete = 1, call_responses = ?, pending_writes = ? "
+                "WHERE request_id = ? AND depth = ?",
+                (
+                    json.dumps(call_responses),
+                    json.dumps(pending_writes) if pending_writes else None,
+                    request_id,
+                    depth,
+                ),
+            )
+            self._touch(conn, request_id)
+
+
+class RequestCheckpoint:
+    """A CheckpointStore bound to one request id, as threaded through handle_message"""
+
+    def __init__(self, store, request_id):
+        self.store = store
+        self.request_id = request_id
+
+    def load_step(self, depth):
+        return self.store.load_step(self.request_id, depth)
+
+    def save_output(self, depth, model_output, truncated=False):
+        self.store.save_output(self.request_id, depth, model_output, truncated)
+
+    def save_call(self, depth, index, entries, continued):
+        self.store.save_call(self.request_id, depth, index, entries, continued)
+
+    def complete_step(self, depth, call_responses, pending_writes=None):
+        self.store.complete_step(self.request_id, depth, call_responses, pending_writes)
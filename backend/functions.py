@@ -1,8 +1,155 @@
 import requests
 import json
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import pytz
-from tzlocal import get_localzone
+from calendar_mirror import IntervalIndex, get_mirror, to_iso, to_timestamp
+from output_repair import TruncatedJSON, repair_json, repairs as output_repairs
+from sheet_index import SheetIndex, indexes as sheet_indexes
+from sheet_query import QueryError, SheetQuery, parse_limit, sheet_grid
+from sheet_snapshot import snapshots
+from stream_decode import PROMPT_BUDGET, decode_rows, decode_sheet, value_size
+from timecontext import TimeContext, current_time_context
+from versioned_cache import responses as versioned_responses
+
+# Connector functions that never change remote state. Their results can be
+# memoized within a request and reused until a write hits the same platform.
+READ_ONLY_FUNCTIONS = {
+    ("datetime", "get_current_time"),
+    ("gsheets", "list_sheets"),
+    ("gsheets", "read_sheet"),
+    ("gsheets", "read_sheets"),
+    ("gsheets", "query"),
+    ("gsheets", "analyze"),
+    ("gsheets", "describe_sheet"),
+    ("gsheets", "lookup_rows"),
+    ("gsheets", "search"),
+    ("calendar", "list_events"),
+    ("calendar", "list_all_events"),
+    ("calendar", "find_free_slots"),
+    ("calendar", "check_conflicts"),
+}
+
+# Sheet functions that can also run over a read_sheet result already in hand,
+# through the matching gsheets.<function>_local helper
+CACHED_SHEET_FUNCTIONS = {
+    ("gsheets", "query"),
+    ("gsheets", "analyze"),
+    ("gsheets", "describe_sheet"),
+    ("gsheets", "lookup_rows"),
+}
+
+
+def _is_true(value):
+    """Model-supplied flags arrive as strings like "true" as often as booleans"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    return bool(value)
+
+
+# User settings per connector: the single (default) endpoint, and a map of
+# further named endpoints, e.g. {"work": "https://...", "home": "https://..."}
+ENDPOINT_SETTINGS = {
+    "gsheets": ("gsheetsEndpoint", "gsheetsEndpoints"),
+    "calendar": ("calendarEndpoint", "calendarEndpoints"),
+}
+DEFAULT_SOURCE = "default"
+
+
+def connector_endpoints(user, platform):
+    """{name: url} of every endpoint configured for a connector; the single
+    endpoint comes first, as "default" unless it is also a named one"""
+    single, named = ENDPOINT_SETTINGS[platform]
+    endpoints = {}
+    if not isinstance(user, dict):
+        return endpoints
+    named = {
+        str(name).strip(): url for name, url in (user.get(named) or {}).items() if url
+    }
+    if user.get(single) and user[single] not in named.values():
+        endpoints[DEFAULT_SOURCE] = user[single]
+    for name, url in named.items():
+        if name not in endpoints:
+            endpoints[name] = url
+    return endpoints
+
+
+def with_default_endpoints(user):
+    """`user` with the first named endpoint standing in for a missing single
+    one, so every function has an endpoint to default to"""
+    if not isinstance(user, dict):
+        return user
+    for platform, (single, _) in ENDPOINT_SETTINGS.items():
+        if not user.get(single):
+            endpoints = connector_endpoints(user, platform)
+            if endpoints:
+                user = dict(user, **{single: next(iter(endpoints.values()))})
+    return user
+
+
+def user_for_source(user, platform, source):
+    """Copy of `user` whose endpoint for `platform` is the one named `source`"""
+    endpoints = connector_endpoints(user, platform)
+    source = str(source).strip()
+    if source not in endpoints:
+        raise ValueError(
+            f"Unknown {platform} source {source!r}, choose from {list(endpoints)}"
+        )
+    return dict(user, **{ENDPOINT_SETTINGS[platform][0]: endpoints[source]})
+
+
+def resolve_source(user, platform, params):
+    """(user, params) to call `platform` with: a `source` parameter picks one
+    of the user's named endpoints and is not passed on"""
+    if platform not in ENDPOINT_SETTINGS or "source" not in params:
+        return user, params
+    call_params = {name: value for name, value in params.items() if name != "source"}
+    if params["source"] in ("", None):
+        return user, call_params
+    return user_for_source(user, platform, params["source"]), call_params
+
+
+def fan_out(user, platform, sources, call):
+    """Run call(user_for_source) for each named source of a connector in
+    parallel; {source: result}, in source order"""
+    endpoints = connector_endpoints(user, platform)
+    if sources:
+        if isinstance(sources, str):
+            sources = (
+                json.loads(sources)
+                if sources.strip().startswith("[")
+                else sources.split(",")
+            )
+        sources = [str(name).strip() for name in sources]
+        unknown = [name for name in sources if name not in endpoints]
+        if unknown:
+            raise ValueError(
+                f"Unknown {platform} sources {unknown}, choose from {list(endpoints)}"
+            )
+    else:
+        sources = list(endpoints)
+    if not sources:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        futures = {
+            # Each worker sees the request's time context
+            name: executor.submit(
+                contextvars.copy_context().run,
+                call,
+                user_for_source(user, platform, name),
+            )
+            for name in sources
+        }
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            results[name] = {"error": str(e)}
+    return results
 
 
 class functions:
@@ -11,7 +158,7 @@ class functions:
         def get_current_time(user):
             """Get the current date and time in ISO format with timezone information"""
             try:
-                tz = get_localzone()
+                tz = current_time_context(user).tz
                 current_time = datetime.now(tz)
                 utc_time = current_time.astimezone(pytz.UTC)
 
@@ -55,7 +202,27 @@ class functions:
 
         @staticmethod
         def read_sheet(user, sheet_name=""):
-            """Read content of a specific sheet"""
+            """Read content of a specific sheet, as rows of values starting at A1
+            plus the formulas by cell. Cut off at the prompt budget."""
+            result = functions.gsheets._read_sheet(user, sheet_name, PROMPT_BUDGET)
+            if result.get("truncated"):
+                result = dict(
+                    result,
+                    note=f"Only the first {len(result['rows'])} rows fit; use "
+                    f"gsheets.query or gsheets.analyze to work with the whole sheet.",
+                )
+            return result
+
+        @staticmethod
+        def _read_sheet(user, sheet_name="", budget=None):
+            """readSheet decoded as it streams in; `budget` caps the characters
+            of cell content kept, None reads everything"""
+            return functions.gsheets._read_sheet_versioned(user, sheet_name, budget)[1]
+
+        @staticmethod
+        def _read_sheet_versioned(user, sheet_name="", budget=None):
+            """(version, result) of _read_sheet; version is None for errors and
+            deployments that send none"""
             try:
                 # Check if required endpoint exists
                 if (
@@ -63,7 +230,7 @@ class functions:
                     or "gsheetsEndpoint" not in user
                     or not user["gsheetsEndpoint"]
                 ):
-                    return {
+                    return None, {
                         "error": "Google Sheets endpoint not configured in user settings"
                     }
 
@@ -74,20 +241,20 @@ class functions:
                 print(
                     f"Sending request to Google Sheets endpoint: {user['gsheetsEndpoint'][:30]}... with params: {params}"
                 )
-                response = requests.get(user["gsheetsEndpoint"], params=params)
-
-                # Print the response status and first part of content for debugging
-                print(f"Google Sheets API response status: {response.status_code}")
-                response_preview = (
-                    response.text[:100] if response.text else "Empty response"
-                )
-                print(f"Response preview: {response_preview}")
-
-                # Try parsing the response as JSON
+                # Revalidates the last copy of this sheet; an unchanged sheet
+                # costs a near-empty reply instead of a full download
                 try:
-                    return response.json()
-                except Exception as json_error:
-                    return {
+                    version, result = versioned_responses.get_versioned(
+                        user["gsheetsEndpoint"],
+                        params,
+                        decode=lambda chunks: decode_sheet(chunks, budget),
+                        variant=budget,
+                    )
+                    # Later write_cells calls diff against this read
+                    snapshots.record(user["gsheetsEndpoint"], sheet_name, version, result)
+                    return version, result
+                except ValueError as json_error:
+                    return None, {
                         "error": f"Failed to parse Google Sheets API response as JSON: {str(json_error)}"
                     }
             except Exception as e:
@@ -96,12 +263,124 @@ class functions:
                 error_trace = traceback.format_exc()
                 print(f"Error in read_sheet: {str(e)}")
                 print(f"Traceback: {error_trace}")
-                return {"error": f"Failed to read sheet: {str(e)}"}
+                return None, {"error": f"Failed to read sheet: {str(e)}"}
+
+        @staticmethod
+        def _sheet_requests(sheets):
+            """Normalize sheet names, "Name!A1:C10" strings and {"name", "range"}
+            objects into the list readSheets expects"""
+            if isinstance(sheets, str):
+                text = sheets.strip()
+                if text.startswith("["):
+                    sheets = json.loads(text)
+                else:
+                    sheets = [part.strip() for part in text.split(",") if part.strip()]
+            if not isinstance(sheets, list) or not sheets:
+                raise ValueError("sheets must be a non-empty list")
+
+            requested = []
+            for item in sheets:
+                if isinstance(item, dict):
+                    name, range_ = item.get("name", ""), item.get("range", "")
+                else:
+                    name, _, range_ = str(item).partition("!")
+                entry = {"name": name.strip().strip("'")}
+                if range_.strip():
+                    entry["range"] = range_.strip()
+                requested.append(entry)
+            return requested
+
+        @staticmethod
+        def _read_sheets_one_by_one(user, requested):
+            results = []
+            for item in requested:
+                if item.get("range"):
+                    results.append(
+                        {
+                            "sheetName": item["name"],
+                            "error": "Ranges need the readSheets action; redeploy sheets.gs",
+                        }
+                    )
+                    continue
+                result = dict(functions.gsheets.read_sheet(user, item["name"]))
+                result.pop("success", None)
+                results.append(result)
+            return {"success": True, "sheets": results}
+
+        @staticmethod
+        def read_sheets(user, sheets):
+            """Read several sheets, or ranges of them, in one Apps Script call
+
+            Args:
+                sheets: List of sheet names, "Name!A1:C10" strings or
+                    {"name": ..., "range": ...} objects. Can be a JSON string.
+            """
+            try:
+                if not user or not user.get("gsheetsEndpoint"):
+                    return {
+                        "error": "Google Sheets endpoint not configured in user settings"
+                    }
+                requested = functions.gsheets._sheet_requests(sheets)
+            except (ValueError, json.JSONDecodeError) as e:
+                return {"error": f"Invalid sheets list: {str(e)}"}
+
+            params = {
+                "action": "readSheets",
+                "sheets": json.dumps(requested, separators=(",", ":")),
+            }
+            cache_key = versioned_responses.key(user["gsheetsEndpoint"], params)
+            version, cached = versioned_responses.lookup(cache_key)
+            request_params = dict(params, ifVersion=version) if version else params
+            try:
+                with requests.get(
+                    user["gsheetsEndpoint"], params=request_params, stream=True
+                ) as response:
+                    response.encoding = "utf-8"
+                    # One JSON document per line: a header, then one per sheet.
+                    # Each part is decoded on its own, so only one sheet's
+                    # text is held at a time.
+                    lines = (line for line in response.iter_lines(decode_unicode=True) if line)
+                    first = next(lines, "{}")
+                    try:
+                        header = json.loads(first)
+                    except json.JSONDecodeError:
+                        # Errors come back as a single pretty-printed document
+                        header = json.loads("\n".join([first, *lines]))
+                    if "error" in header:
+                        if header["error"] == "Unknown action":
+                            # Deployment predates readSheets; read one by one
+                            return functions.gsheets._read_sheets_one_by_one(
+                                user, requested
+                            )
+                        return header
+                    if header.get("notModified") and cached is not None:
+                        return cached
+                    results = [json.loads(line) for line in lines]
+            except (json.JSONDecodeError, StopIteration) as e:
+                return {"error": f"Failed to parse batch sheet response: {str(e)}"}
+            except Exception as e:
+                return {"error": f"Failed to read sheets: {str(e)}"}
+
+            if header.get("count") not in (None, len(results)):
+                return {
+                    "error": "Batch sheet response was cut off",
+                    "received": len(results),
+                    "expected": header.get("count"),
+                }
+            result = {"success": True, "sheets": results}
+            if header.get("version"):
+                versioned_responses.store(cache_key, header["version"], result)
+            return result
 
         @staticmethod
-        def write_cells(user, cells):
+        def write_cells(user, cells, sheet_name="", buffer=None):
             """Write values/formulas to specific cells
 
+            Cells that already hold the requested value or formula in the last
+            read of the sheet are skipped, as long as the sheet is still at
+            that read's version. With a request's WriteBuffer as `buffer` the
+            validated cells are queued there instead of sent.
+
             Args:
                 cells: Cell updates in format:
                     {
@@ -109,6 +388,7 @@ class functions:
                         "B1": {"formula": "=SUM(C1:D1)"}
                     }
                     Can be provided as either a JSON string or a direct object.
+                sheet_name: Sheet to write to; the first sheet if omitted
             """
             try:
                 print(f"=== write_cells called with cells type: {type(cells)}")
@@ -134,43 +414,16 @@ class functions:
                 # Handle both direct JSON objects and JSON strings
                 cells_data = cells
                 if isinstance(cells, str):
+                    found = Counter()
                     try:
-                        # First try normal parsing
-                        try:
-                            cells_data = json.loads(cells)
-                            print(f"=== Successfully parsed cells JSON normally")
-                        except json.JSONDecodeError as e:
-                            print(f"=== Standard JSON parsing failed: {str(e)}")
-
-                            # Try with additional unescaping for double-escaped quotes
-                            fixed_cells = cells.replace('\\"', '"').replace(
-                                '\\\\"', '\\"'
-                            )
-                            try:
-                                cells_data = json.loads(fixed_cells)
-                                print(
-                                    f"=== Successfully parsed cells JSON after fixing escapes"
-                                )
-                            except json.JSONDecodeError as e2:
-                                print(f"=== Fixed JSON parsing also failed: {str(e2)}")
-                                print(f"=== Original: {cells[:50]}...")
-                                print(f"=== Fixed attempt: {fixed_cells[:50]}...")
-
-                                # If the string starts with a quote and ends with a quote, try removing them
-                                if cells.startswith('"') and cells.endswith('"'):
-                                    try:
-                                        inner_content = cells[1:-1].replace('\\"', '"')
-                                        cells_data = json.loads(inner_content)
-                                        print(
-                                            f"=== Successfully parsed cells JSON after removing outer quotes"
-                                        )
-                                    except json.JSONDecodeError as e3:
-                                        # Give up and report the original error
-                                        raise e
-                                else:
-                                    # Give up and report the original error
-                                    raise e
+                        cells_data = repair_json(cells, found)
                     except json.JSONDecodeError as e:
+                        # Brackets left open may mean a cut-off value: not guessed
+                        found[
+                            "truncated_json"
+                            if isinstance(e, TruncatedJSON)
+                            else "unparsed_json"
+                        ] += 1
                         error_context = cells[
                             max(0, int(e.pos) - 30) : min(len(cells), int(e.pos) + 30)
                         ]
@@ -179,6 +432,10 @@ class functions:
                             "details": f"Error near: ...{error_context}... (position {e.pos})",
                             "tip": "Make sure your JSON is valid and doesn't contain improperly escaped quotes",
                         }
+                    finally:
+                        output_repairs.record(found)
+                    if found:
+                        print(f"=== Repaired cells JSON: {dict(found)}")
 
                 # Verify that the cells data is a dictionary
                 if not isinstance(cells_data, dict):
@@ -200,66 +457,521 @@ class functions:
                             "received": f"Type: {type(data['formula']).__name__}",
                         }
 
-                print(f"=== Sending writeCells request with {len(cells_data)} cells")
+                if buffer is not None:
+                    return buffer.add(user["gsheetsEndpoint"], sheet_name, cells_data)
+                return functions.gsheets._send_cells(user, cells_data, sheet_name)
+            except Exception as e:
+                import traceback
+
+                error_trace = traceback.format_exc()
+                print(f"=== Error in write_cells: {str(e)}")
+                print(f"=== Traceback: {error_trace}")
+                return {"error": f"Failed to write cells: {str(e)}"}
+
+        @staticmethod
+        def _post_cells(user, cells, sheet_name, base_version=None):
+            payload = {
+                "action": "writeCells",
+                "data": {"cells": cells, "sheetName": sheet_name},
+            }
+            if base_version:
+                payload["data"]["baseVersion"] = base_version
+                # The new version keeps the snapshot, and so the diffing of
+                # later writes, alive even without the sheet's version triggers
+                payload["data"]["returnVersion"] = True
+            response = requests.post(user["gsheetsEndpoint"], json=payload)
+
+            # Check for a successful status code
+            if response.status_code != 200:
+                return {
+                    "error": f"Failed to write cells: HTTP {response.status_code}",
+                    "details": response.text,
+                }
+
+            # Try to parse the response
+            try:
+                return response.json()
+            except json.JSONDecodeError:
+                return {
+                    "error": "Failed to parse response from Google Sheets",
+                    "details": response.text[:200],
+                }
+
+        @staticmethod
+        def _send_cells(user, cells, sheet_name=""):
+            """Write `cells`, leaving out the ones the last snapshot of the sheet
+            says already hold the requested value or formula"""
+            endpoint = user["gsheetsEndpoint"]
+            snapshot = snapshots.get(endpoint, sheet_name)
+            if snapshot is None:
+                print(f"=== Sending writeCells request with {len(cells)} cells")
+                result = functions.gsheets._post_cells(user, cells, sheet_name)
+                # Without a version to anchor it, an old snapshot can't be patched
+                snapshots.discard(endpoint, sheet_name)
+                return result
+
+            changed = {a1: data for a1, data in cells.items() if not snapshot.unchanged(a1, data)}
+            skipped = [a1 for a1 in cells if a1 not in changed]
+            note = f"Skipped {len(skipped)} cell(s) that already had the requested content"
+            if not changed:
+                print(f"=== All {len(skipped)} cells unchanged, nothing to send")
+                return {
+                    "success": True,
+                    "updatedCells": [],
+                    "skippedCells": skipped,
+                    "note": note,
+                }
+            print(
+                f"=== Sending writeCells request with {len(changed)} changed cells "
+                f"({len(skipped)} unchanged since version {snapshot.version})"
+            )
+            result = functions.gsheets._post_cells(
+                user, changed, sheet_name, base_version=snapshot.version
+            )
+
+            if result.get("stale"):
+                # The sheet moved on since the snapshot; nothing can be skipped
+                print("=== Sheet changed since snapshot, writing every cell")
+                snapshots.discard(endpoint, sheet_name)
+                return functions.gsheets._post_cells(user, cells, sheet_name)
+            if "error" in result:
+                return result
+
+            if result.get("version"):
+                snapshot.apply(changed, result.pop("version"))
+            else:
+                snapshots.discard(endpoint, sheet_name)
+            if skipped:
+                result["skippedCells"] = skipped
+                result["note"] = note
+            return result
+
+        @staticmethod
+        def append_rows(user, rows, sheet_name=""):
+            """Append rows below the last used row of a sheet
+
+            Args:
+                rows: List of rows, each a list of cell values, e.g.
+                    [["2024-03-21", "Lunch", 12.5]]. Values starting with "="
+                    are written as formulas. Can be a JSON string.
+            """
+            try:
+                if not user or not user.get("gsheetsEndpoint"):
+                    return {
+                        "error": "Google Sheets endpoint not configured in user settings"
+                    }
+
+                if isinstance(rows, str):
+                    try:
+                        rows = json.loads(rows)
+                    except json.JSONDecodeError as e:
+                        return {"error": f"Invalid rows format: {str(e)}"}
+                if isinstance(rows, list) and rows and not any(
+                    isinstance(row, list) for row in rows
+                ):
+                    # A single flat row
+                    rows = [rows]
+                if (
+                    not isinstance(rows, list)
+                    or not rows
+                    or not all(isinstance(row, list) for row in rows)
+                ):
+                    return {
+                        "error": "Invalid rows format: Must be a list of rows, each a list of values"
+                    }
+
                 payload = {
-                    "action": "writeCells",
-                    "data": {"cells": cells_data},
+                    "action": "appendRows",
+                    "data": {"sheetName": sheet_name, "rows": rows},
                 }
                 response = requests.post(user["gsheetsEndpoint"], json=payload)
-
-                # Check for a successful status code
                 if response.status_code != 200:
                     return {
-                        "error": f"Failed to write cells: HTTP {response.status_code}",
-                        "details": response.text,
+                        "error": f"Failed to append rows: HTTP {response.status_code}",
+                        "details": response.text[:200],
                     }
+                return response.json()
+            except Exception as e:
+                return {"error": f"Failed to append rows: {str(e)}"}
 
-                # Try to parse the response
-                try:
-                    return response.json()
-                except json.JSONDecodeError:
+        @staticmethod
+        def query(
+            user,
+            sheet_name="",
+            select=None,
+            where=None,
+            group_by=None,
+            aggregate=None,
+            order_by=None,
+            limit=None,
+        ):
+            """Filter, project and aggregate a sheet inside Apps Script so only
+            the matching rows (or the aggregates) come back
+
+            Args:
+                select: Columns to return, by header name or letter
+                where: Conditions like [{"column": "Category", "op": "=", "value": "Food"}]
+                group_by: Columns to group by
+                aggregate: Aggregates like [{"op": "sum", "column": "Amount"}]
+                order_by: {"column": "Amount", "desc": true} or a column name
+                limit: Maximum number of rows
+            """
+            try:
+                if not user or not user.get("gsheetsEndpoint"):
                     return {
-                        "error": "Failed to parse response from Google Sheets",
-                        "details": response.text[:200],
+                        "error": "Google Sheets endpoint not configured in user settings"
                     }
 
+                spec = SheetQuery(select, where, group_by, aggregate, order_by, limit)
+                params = {
+                    "action": "query",
+                    "query": json.dumps(spec.to_params(), separators=(",", ":")),
+                }
+                if sheet_name:
+                    params["sheetName"] = sheet_name
+                result = versioned_responses.get(user["gsheetsEndpoint"], params)
+
+                if result.get("error") == "Unknown action":
+                    # Deployment predates the query action; run it here instead
+                    print("=== Apps Script has no query action, querying locally")
+                    sheet = functions.gsheets._read_sheet(user, sheet_name)
+                    if "error" in sheet:
+                        return sheet
+                    return spec.run(sheet_grid(sheet))
+                return result
+            except (QueryError, json.JSONDecodeError) as e:
+                return {"error": f"Invalid query: {str(e)}"}
             except Exception as e:
-                import traceback
+                return {"error": f"Failed to query sheet: {str(e)}"}
 
-                error_trace = traceback.format_exc()
-                print(f"=== Error in write_cells: {str(e)}")
-                print(f"=== Traceback: {error_trace}")
-                return {"error": f"Failed to write cells: {str(e)}"}
+        @staticmethod
+        def query_local(sheet, **query):
+            """Run a query over a read_sheet result already held in memory"""
+            try:
+                return SheetQuery(**query).run(sheet_grid(sheet))
+            except (QueryError, TypeError, json.JSONDecodeError) as e:
+                return {"error": f"Invalid query: {str(e)}"}
+
+        @staticmethod
+        def analyze(
+            user,
+            operation,
+            sheet_name="",
+            column="",
+            by="",
+            aggregate="sum",
+            period="",
+            n=None,
+            descending=None,
+            select=None,
+        ):
+            """Analyze a sheet locally: describe, sum/mean/min/max/count of a
+            column, group_by, sort or top_k. Reads the sheet once, then the work
+            runs on a typed columnar table instead of in the prompt."""
+            sheet = functions.gsheets._read_sheet(user, sheet_name)
+            if "error" in sheet:
+                return sheet
+            return functions.gsheets.analyze_local(
+                sheet,
+                operation=operation,
+                column=column,
+                by=by,
+                aggregate=aggregate,
+                period=period,
+                n=n,
+                descending=descending,
+                select=select,
+            )
+
+        @staticmethod
+        def analyze_local(sheet, operation, descending=None, select=None, **options):
+            """Run an analysis over a read_sheet result already held in memory"""
+            try:
+                from sheet_table import AnalyzeError, tables
+            except ImportError:
+                return {"error": "Local analysis needs numpy installed on the server"}
+
+            if isinstance(select, str):
+                select = [name.strip() for name in select.split(",") if name.strip()]
+            if descending not in (None, ""):
+                descending = _is_true(descending)
+            else:
+                descending = None
+            try:
+                return tables.get(sheet).analyze(
+                    operation, descending=descending, select=select, **options
+                )
+            except (AnalyzeError, TypeError) as e:
+                return {"error": f"Invalid analysis: {str(e)}"}
+
+        @staticmethod
+        def _sheet_index(user, sheet_name=""):
+            """(index, None) for the current version of a sheet, built once per
+            version, or (None, error)"""
+            version, sheet = functions.gsheets._read_sheet_versioned(user, sheet_name)
+            if "error" in sheet:
+                return None, sheet
+            return (
+                sheet_indexes.get(user["gsheetsEndpoint"], sheet_name, version, sheet),
+                None,
+            )
+
+        @staticmethod
+        def describe_sheet(user, sheet_name=""):
+            """Schema of a sheet instead of its contents: header, per-column
+            type, fill and distinct counts with a few samples, and the row
+            count. Columns marked unique can be used with lookup_rows."""
+            index, error = functions.gsheets._sheet_index(user, sheet_name)
+            if error:
+                return error
+            return index.schema()
+
+        @staticmethod
+        def describe_sheet_local(sheet):
+            """describe_sheet over a read_sheet result already held in memory"""
+            return SheetIndex.from_sheet(sheet).schema()
+
+        @staticmethod
+        def lookup_rows(user, column, value, sheet_name="", select=None, limit=None):
+            """Rows whose `column` equals `value` (or any of a list of values),
+            found through a hash index on that column
+
+            Args:
+                column: Key column, by header name or letter
+                value: Value to find, or a list of values; text matches ignore
+                    case and surrounding spaces, "1043" matches 1043
+                select: Columns to return, by header name or letter
+                limit: Maximum number of rows
+            """
+            index, error = functions.gsheets._sheet_index(user, sheet_name)
+            if error:
+                return error
+            return functions.gsheets._lookup(index, column, value, select, limit)
+
+        @staticmethod
+        def lookup_rows_local(sheet, column, value, select=None, limit=None):
+            """lookup_rows over a read_sheet result already held in memory"""
+            return functions.gsheets._lookup(
+                SheetIndex.from_sheet(sheet), column, value, select, limit
+            )
+
+        @staticmethod
+        def _lookup(index, column, value, select, limit):
+            try:
+                if isinstance(value, str) and value.strip().startswith("["):
+                    value = json.loads(value)
+                if isinstance(select, str):
+                    select = (
+                        json.loads(select)
+                        if select.strip().startswith("[")
+                        else [n.strip() for n in select.split(",") if n.strip()]
+                    )
+                return index.lookup(
+                    column, value, select=select, limit=parse_limit(limit)
+                )
+            except (QueryError, ValueError) as e:
+                return {"error": f"Invalid lookup: {str(e)}"}
+
+        @staticmethod
+        def search(user, text, sheet_name="", sources=None, max_results=50):
+            """Find the rows containing `text` in every spreadsheet of the user
+            (or the named `sources`), searched in parallel
+
+            Args:
+                text: Case-insensitive text to look for in any cell
+                sheet_name: Only search this tab; every tab if omitted
+                sources: Names of the spreadsheets to search; all if omitted
+            """
+            needle = str(text).strip().lower()
+            if not needle:
+                return {"error": "Nothing to search for"}
+            max_results = int(max_results)
+
+            def search_one(source_user):
+                if sheet_name:
+                    names = [sheet_name]
+                else:
+                    listing = functions.gsheets.list_sheets(source_user)
+                    if "error" in listing:
+                        return listing
+                    names = [sheet["name"] for sheet in listing.get("sheets", [])]
+                if len(names) == 1:
+                    sheets = [functions.gsheets._read_sheet(source_user, names[0])]
+                else:
+                    batch = functions.gsheets.read_sheets(source_user, names)
+                    if "error" in batch:
+                        return batch
+                    sheets = batch["sheets"]
+
+                found = []
+                for sheet in sheets:
+                    if "error" in sheet:
+                        continue
+                    grid = sheet_grid(sheet)
+                    for index, row in enumerate(grid):
+                        if any(needle in str(value).lower() for value in row):
+                            found.append(
+                                (sheet.get("sheetName"), index + 1, row, grid[0])
+                            )
+                return {"found": found}
+
+            try:
+                results = fan_out(user, "gsheets", sources, search_one)
+            except ValueError as e:
+                return {"error": str(e)}
+
+            matches = []
+            headers = {}
+            errors = {}
+            total = 0
+            for source, result in results.items():
+                if "error" in result:
+                    errors[source] = result["error"]
+                    continue
+                for sheet, row_number, row, header in result["found"]:
+                    total += 1
+                    if len(matches) < max_results:
+                        matches.append(
+                            {
+                                "source": source,
+                                "sheet": sheet,
+                                "row": row_number,
+                                "values": row,
+                            }
+                        )
+                        headers.setdefault(f"{source}/{sheet}", header)
+            if errors and not matches and len(errors) == len(results):
+                return {"error": "Search failed in every spreadsheet", "errors": errors}
+
+            result = {
+                "success": True,
+                "matches": matches,
+                "total": total,
+                "headers": headers,
+            }
+            if errors:
+                result["errors"] = errors
+            return result
 
     class calendar:
         @staticmethod
-        def _format_datetime(user, dt_str=None, is_end=False):
+        def _format_datetime(user, dt_str=None, is_end=False, tz=None):
             """Helper to format datetime with timezone awareness
             If no datetime provided, uses current time for start, or current time + 1 hour for end
-            Always adds 7 hours to convert PDT to UTC
+            Naive datetimes are read in `tz`, else the request's timezone, and converted to UTC
             """
-            tz = get_localzone()
-
-            if dt_str:
-                if "T" not in dt_str:
-                    dt_str = f"{dt_str}T{'23:59:59' if is_end else '00:00:00'}"
-                dt = datetime.fromisoformat(dt_str.replace("Z", "+00:00"))
-                if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
-                    # Replace localize() with a more compatible approach
-                    naive_dt = dt.replace(tzinfo=None)
-                    dt = datetime.combine(naive_dt.date(), naive_dt.time(), tzinfo=tz)
-            else:
-                dt = datetime.now(tz)
-                if is_end:
-                    dt += timedelta(hours=1)
+            context = TimeContext(tz) if tz else current_time_context(user)
+            return context.to_utc(dt_str, is_end)
+
+        WEEKDAYS = {
+            "MO": "MONDAY",
+            "TU": "TUESDAY",
+            "WE": "WEDNESDAY",
+            "TH": "THURSDAY",
+            "FR": "FRIDAY",
+            "SA": "SATURDAY",
+            "SU": "SUNDAY",
+        }
+
+        @staticmethod
+        def _normalize_recurrence(user, recurrence):
+            """Turn a recurrence object or RRULE string into the shape calendar.gs expects:
+            {"frequency": "weekly", "interval": 1, "days": ["MONDAY"], "until": UTC ISO, "count": n}
+
+            A monthly rule's ordinal days ("1MO": the first Monday) become the
+            month days that week covers ("monthDays": [1, ..., 7]), since
+            CalendarApp has no nth-weekday rule. Counting from the end ("-1FR")
+            and mixed ordinals can't be expressed that way and are refused."""
+            if isinstance(recurrence, str):
+                text = recurrence.strip()
+                if text.startswith("{"):
+                    recurrence = json.loads(text)
+                else:
+                    parts = dict(
+                        part.split("=", 1)
+                        for part in text.replace("RRULE:", "").split(";")
+                        if "=" in part
+                    )
+                    recurrence = {
+                        "frequency": parts.get("FREQ", ""),
+                        "interval": parts.get("INTERVAL"),
+                        "days": parts["BYDAY"].split(",") if "BYDAY" in parts else None,
+                        "until": parts.get("UNTIL"),
+                        "count": parts.get("COUNT"),
+                    }
+                    if recurrence["until"] and "T" not in recurrence["until"]:
+                        until = recurrence["until"]
+                        recurrence["until"] = f"{until[:4]}-{until[4:6]}-{until[6:8]}"
+                    elif recurrence["until"]:
+                        until = recurrence["until"]
+                        recurrence["until"] = (
+                            f"{until[:4]}-{until[4:6]}-{until[6:8]}T"
+                            f"{until[9:11]}:{until[11:13]}:{until[13:15]}"
+                            + ("Z" if until.endswith("Z") else "")
+                        )
 
-            utc_dt = dt.astimezone(pytz.UTC)
-            return utc_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+            frequency = str(recurrence.get("frequency", "")).lower()
+            if frequency not in ("daily", "weekly", "monthly", "yearly"):
+                raise ValueError(f"Unsupported recurrence frequency: {frequency}")
+
+            normalized = {"frequency": frequency}
+            if recurrence.get("interval"):
+                normalized["interval"] = int(recurrence["interval"])
+
+            days = recurrence.get("days")
+            if isinstance(days, str):
+                days = (
+                    ["MO", "TU", "WE", "TH", "FR"]
+                    if days.strip().lower() == "weekdays"
+                    else days.split(",")
+                )
+            if days:
+                normalized["days"] = []
+                # Ordinal prefix ("" for plain weekdays) -> a day using it
+                ordinals = {}
+                for day in days:
+                    day = day.strip().upper()
+                    code = day.lstrip("+-0123456789")
+                    if code not in functions.calendar.WEEKDAYS:
+                        raise ValueError(f"Unknown weekday: {day}")
+                    normalized["days"].append(functions.calendar.WEEKDAYS[code])
+                    ordinals[day[: len(day) - len(code)].lstrip("+")] = day
+                if set(ordinals) != {""}:
+                    example = next(day for o, day in ordinals.items() if o)
+                    ordinal = ordinals.popitem()[0]
+                    if frequency != "monthly" or ordinals or ordinal == "":
+                        raise ValueError(
+                            f"Ordinal weekdays like {example} are only supported on "
+                            "monthly recurrences, with the same ordinal on every day"
+                        )
+                    if not ordinal.isdigit() or not 1 <= int(ordinal) <= 5:
+                        raise ValueError(
+                            f"Unsupported weekday ordinal {ordinal} in {days}: only "
+                            "the 1st to 5th week of the month can be repeated, not "
+                            "weeks counted from the end"
+                        )
+                    first = (int(ordinal) - 1) * 7 + 1
+                    normalized["monthDays"] = list(range(first, min(first + 7, 32)))
+
+            if recurrence.get("until"):
+                normalized["until"] = functions.calendar._format_datetime(
+                    user, recurrence["until"], is_end=True
+                )
+            elif recurrence.get("count"):
+                normalized["count"] = int(recurrence["count"])
+            else:
+                raise ValueError("Recurrence needs either 'until' or 'count'")
+            return normalized
 
         @staticmethod
-        def list_events(user, start=None, end=None):
+        def list_events(
+            user, start=None, end=None, refresh=False, fields=None, max_results=100, offset=0
+        ):
             """List calendar events within a date range
-            If no dates provided, lists events from now to 7 days ahead"""
+            If no dates provided, lists events from now to 7 days ahead.
+            Answered from the local mirror, which syncs only changes from the
+            endpoint; refresh forces a full re-read of the range.
+            Returns compact rows of just the requested fields, one page at a time"""
             try:
                 start_dt = (
                     functions.calendar._format_datetime(user, start)
@@ -270,32 +982,374 @@ class functions:
                 if end:
                     end_dt = functions.calendar._format_datetime(user, end, is_end=True)
                 else:
-                    tz = get_localzone()
                     end_dt = (
                         datetime.fromisoformat(start_dt) + timedelta(days=7)
                     ).isoformat()
 
-                params = {"action": "listEvents", "start": start_dt, "end": end_dt}
-                response = requests.get(user["calendarEndpoint"], params=params)
-                return response.json()
+                fields = functions.calendar._event_fields(fields)
+                max_results = int(max_results)
+                offset = int(offset)
+
+                result = functions.calendar._fetch_events(
+                    user,
+                    start_dt,
+                    end_dt,
+                    refresh=_is_true(refresh),
+                    listing={
+                        "fields": ",".join(fields),
+                        "maxResults": max_results,
+                        "offset": offset,
+                        "format": "rows",
+                    },
+                )
+                if "events" not in result:
+                    # Error, or rows already projected by calendar.gs
+                    return result
+                return functions.calendar._event_rows(
+                    result["events"], fields, max_results, offset
+                )
             except Exception as e:
                 return {"error": f"Failed to list events: {str(e)}"}
 
         @staticmethod
-        def create_events(user, events):
-            """Create multiple calendar events
-            Automatically handles timezone conversion for event times"""
+        def list_all_events(
+            user, start=None, end=None, fields=None, max_results=100, sources=None
+        ):
+            """List events across every calendar of the user (or the named
+            `sources`), fetched in parallel and merged in start order.
+            Rows lead with the name of the calendar they came from."""
             try:
-                processed_events = []
-                for event in json.loads(events) if isinstance(events, str) else events:
-                    processed_event = event.copy()
-                    processed_event["start"] = functions.calendar._format_datetime(
-                        user, event.get("start")
+                fields = functions.calendar._event_fields(fields)
+                max_results = int(max_results)
+                results = fan_out(
+                    user,
+                    "calendar",
+                    sources,
+                    lambda source_user: functions.calendar.list_events(
+                        source_user, start, end, fields=fields, max_results=max_results
+                    ),
+                )
+            except ValueError as e:
+                return {"error": f"Failed to list events: {str(e)}"}
+
+            rows = []
+            errors = {}
+            total = 0
+            more = False
+            for source, result in results.items():
+                if "error" in result:
+                    errors[source] = result["error"]
+                    continue
+                total += result.get("total", len(result["rows"]))
+                more = more or "next_offset" in result
+                rows.extend([source] + row for row in result["rows"])
+            if errors and len(errors) == len(results):
+                return {"error": "Listing failed in every calendar", "errors": errors}
+
+            if "start" in fields:
+                index = fields.index("start") + 1
+
+                def start_key(row):
+                    try:
+                        return to_timestamp(row[index])
+                    except (TypeError, ValueError):
+                        return float("inf")
+
+                rows.sort(key=start_key)
+            merged = {
+                "success": True,
+                "columns": ["source"] + fields,
+                "rows": rows[:max_results],
+                "total": total,
+            }
+            if more or len(rows) > max_results:
+                merged["note"] = (
+                    "More events than fit; narrow the range or page through one "
+                    "calendar with list_events and its source"
+                )
+            if errors:
+                merged["errors"] = errors
+            return merged
+
+        EVENT_FIELDS = ("id", "title", "start", "end", "description", "recurring")
+        DEFAULT_EVENT_FIELDS = ("id", "title", "start", "end")
+
+        @staticmethod
+        def _event_fields(fields):
+            if not fields:
+                return list(functions.calendar.DEFAULT_EVENT_FIELDS)
+            if isinstance(fields, str):
+                fields = (
+                    json.loads(fields)
+                    if fields.strip().startswith("[")
+                    else fields.split(",")
+                )
+            fields = [field.strip() for field in fields]
+            unknown = [f for f in fields if f not in functions.calendar.EVENT_FIELDS]
+            if unknown:
+                raise ValueError(
+                    f"Unknown event fields {unknown}, choose from {list(functions.calendar.EVENT_FIELDS)}"
+                )
+            return fields
+
+        @staticmethod
+        def _event_rows(events, fields, max_results, offset, budget=PROMPT_BUDGET):
+            """Row-oriented page of events: column names once, then value arrays.
+            The page also ends early once its rows reach the prompt budget."""
+            rows = []
+            size = 0
+            for event in events[offset : offset + max_results]:
+                row = [event.get(field) for field in fields]
+                size += value_size(row)
+                if rows and size > budget:
+                    break
+                rows.append(row)
+            result = {
+                "success": True,
+                "columns": fields,
+                "rows": rows,
+                "total": len(events),
+            }
+            if offset + len(rows) < len(events):
+                result["next_offset"] = offset + len(rows)
+            return result
+
+        @staticmethod
+        def _fetch_events(user, start_dt, end_dt, refresh=False, listing=None):
+            """Events overlapping [start_dt, end_dt), from the mirror when possible
+            `listing` holds extra listEvents params (projection, paging) for the
+            fallback path on deployments without syncEvents"""
+            mirror = get_mirror(user["calendarEndpoint"])
+            try:
+                events = mirror.query(
+                    to_timestamp(start_dt), to_timestamp(end_dt), refresh=refresh
+                )
+                return {"success": True, "events": events}
+            except Exception as sync_error:
+                # Older Apps Script deployments have no syncEvents action
+                print(f"=== Calendar mirror unavailable: {str(sync_error)}")
+
+            params = {"action": "listEvents", "start": start_dt, "end": end_dt}
+            params.update(listing or {})
+            if listing and listing.get("format") == "rows":
+                # A page for the prompt: stop decoding once it is full
+                result = versioned_responses.get(
+                    user["calendarEndpoint"],
+                    params,
+                    decode=lambda chunks: decode_rows(chunks, "rows", PROMPT_BUDGET),
+                    variant=PROMPT_BUDGET,
+                )
+                if result.get("truncated"):
+                    result = dict(result)
+                    del result["truncated"]
+                    result["next_offset"] = int(listing.get("offset", 0)) + len(
+                        result["rows"]
+                    )
+                return result
+            return versioned_responses.get(
+                user["calendarEndpoint"],
+                params,
+                decode=lambda chunks: decode_rows(chunks, "events"),
+            )
+
+        @staticmethod
+        def _resolve_timezone(user, timezone=None):
+            """Explicit zone name, then the user's configured zone, then the server's"""
+            return current_time_context(user, timezone).tz
+
+        @staticmethod
+        def _busy_index(user, start_dt, end_dt):
+            """IntervalIndex over existing events plus the events themselves"""
+            result = functions.calendar._fetch_events(user, start_dt, end_dt)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            events = result.get("events", [])
+            index = IntervalIndex(
+                (to_timestamp(event["start"]), to_timestamp(event["end"]), i)
+                for i, event in enumerate(events)
+                if event.get("start") and event.get("end")
+            )
+            return index, events
+
+        @staticmethod
+        def find_free_slots(
+            user,
+            start=None,
+            end=None,
+            duration=30,
+            working_hours="09:00-17:00",
+            timezone=None,
+            include_weekends=False,
+            max_results=10,
+        ):
+            """Find free time slots of at least `duration` minutes
+            Busy time comes from existing events; only working hours in the
+            given (or user's) timezone are considered. Defaults to the next 7 days"""
+            try:
+                tz = functions.calendar._resolve_timezone(user, timezone)
+                duration_seconds = int(float(duration)) * 60
+                max_results = int(max_results)
+                day_start, day_end = [
+                    datetime.strptime(part.strip(), "%H:%M").time()
+                    for part in working_hours.split("-")
+                ]
+
+                start_dt = functions.calendar._format_datetime(user, start, tz=tz)
+                if end:
+                    end_dt = functions.calendar._format_datetime(
+                        user, end, is_end=True, tz=tz
+                    )
+                else:
+                    end_dt = functions.calendar._format_datetime(
+                        user,
+                        (datetime.fromisoformat(start_dt) + timedelta(days=7)).isoformat(),
+                        tz=tz,
+                    )
+                range_start, range_end = to_timestamp(start_dt), to_timestamp(end_dt)
+
+                index, _ = functions.calendar._busy_index(user, start_dt, end_dt)
+
+                slots = []
+                truncated = False
+                day = datetime.fromtimestamp(range_start, tz).date()
+                last_day = datetime.fromtimestamp(range_end, tz).date()
+                while day <= last_day and not truncated:
+                    if include_weekends or day.weekday() < 5:
+                        # combine() with a zoneinfo tz picks the right offset on DST days
+                        window_start = max(
+                            range_start,
+                            datetime.combine(day, day_start, tzinfo=tz).timestamp(),
+                        )
+                        window_end = min(
+                            range_end,
+                            datetime.combine(day, day_end, tzinfo=tz).timestamp(),
+                        )
+                        cursor = window_start
+                        for busy_start, busy_end, _ in index.overlapping(
+                            window_start, window_end
+                        ) + [(window_end, window_end, None)]:
+                            if busy_start - cursor >= duration_seconds:
+                                if len(slots) >= max_results:
+                                    truncated = True
+                                    break
+                                slots.append(
+                                    {
+                                        "start": datetime.fromtimestamp(
+                                            cursor, tz
+                                        ).isoformat(),
+                                        "end": datetime.fromtimestamp(
+                                            min(busy_start, window_end), tz
+                                        ).isoformat(),
+                                    }
+                                )
+                            cursor = max(cursor, busy_end)
+                    day += timedelta(days=1)
+
+                return {
+                    "success": True,
+                    "timezone": str(tz),
+                    "duration_minutes": duration_seconds // 60,
+                    "slots": slots,
+                    "truncated": truncated,
+                }
+            except Exception as e:
+                return {"error": f"Failed to find free slots: {str(e)}"}
+
+        @staticmethod
+        def check_conflicts(user, events=None, start=None, end=None, timezone=None):
+            """Check proposed events (or a single start/end) for overlaps
+            with existing events and with each other"""
+            try:
+                tz = functions.calendar._resolve_timezone(user, timezone)
+                if events is None:
+                    events = [{"start": start, "end": end}]
+                elif isinstance(events, str):
+                    events = json.loads(events)
+
+                proposed = []
+                for event in events:
+                    proposed_start = functions.calendar._format_datetime(
+                        user, event.get("start"), tz=tz
+                    )
+                    proposed_end = functions.calendar._format_datetime(
+                        user, event.get("end"), is_end=True, tz=tz
                     )
-                    processed_event["end"] = functions.calendar._format_datetime(
-                        user, event.get("end"), is_end=True
+                    proposed.append(
+                        (
+                            to_timestamp(proposed_start),
+                            to_timestamp(proposed_end),
+                            event,
+                        )
                     )
-                    processed_events.append(processed_event)
+                if not proposed:
+                    return {"success": True, "conflicts": []}
+
+                range_start = min(p[0] for p in proposed)
+                range_end = max(p[1] for p in proposed)
+                index, existing = functions.calendar._busy_index(
+                    user, to_iso(range_start), to_iso(range_end)
+                )
+                own_index = IntervalIndex(
+                    (p[0], p[1], i) for i, p in enumerate(proposed)
+                )
+
+                results = []
+                for i, (proposed_start, proposed_end, event) in enumerate(proposed):
+                    overlaps = [
+                        {
+                            "id": existing[j].get("id"),
+                            "title": existing[j].get("title"),
+                            "start": existing[j].get("start"),
+                            "end": existing[j].get("end"),
+                        }
+                        for _, _, j in index.overlapping(proposed_start, proposed_end)
+                    ]
+                    overlaps_proposed = [
+                        j
+                        for _, _, j in own_index.overlapping(
+                            proposed_start, proposed_end
+                        )
+                        if j != i
+                    ]
+                    results.append(
+                        {
+                            "index": i,
+                            "title": event.get("title"),
+                            "start": datetime.fromtimestamp(
+                                proposed_start, tz
+                            ).isoformat(),
+                            "end": datetime.fromtimestamp(proposed_end, tz).isoformat(),
+                            "conflicts": overlaps,
+                            "conflicts_with_proposed": overlaps_proposed,
+                        }
+                    )
+
+                return {
+                    "success": True,
+                    "has_conflicts": any(
+                        r["conflicts"] or r["conflicts_with_proposed"] for r in results
+                    ),
+                    "results": results,
+                }
+            except Exception as e:
+                return {"error": f"Failed to check conflicts: {str(e)}"}
+
+        @staticmethod
+        def create_events(user, events):
+            """Create multiple calendar events
+            Automatically handles timezone conversion for event times.
+            An event with a recurrence rule is created as a single series"""
+            try:
+                if isinstance(events, str):
+                    events = json.loads(events)
+                processed_events = current_time_context(user).normalize_events(events)
+                for processed_event in processed_events:
+                    if processed_event.get("recurrence"):
+                        processed_event["recurrence"] = (
+                            functions.calendar._normalize_recurrence(
+                                user, processed_event["recurrence"]
+                            )
+                        )
 
                 payload = {
                     "action": "createEvents",
@@ -303,6 +1357,7 @@ class functions:
                 }
 
                 response = requests.post(user["calendarEndpoint"], json=payload)
+                get_mirror(user["calendarEndpoint"]).invalidate()
 
                 # Check for a successful status code
                 if response.status_code != 200:
@@ -341,16 +1396,57 @@ class functions:
 
                 payload = {"action": "updateEvent", "data": data}
                 response = requests.post(user["calendarEndpoint"], json=payload)
+                get_mirror(user["calendarEndpoint"]).invalidate()
                 return response.json()
             except Exception as e:
                 return {"error": f"Failed to update event: {str(e)}"}
 
+        @staticmethod
+        def update_events(user, events):
+            """Update many calendar events in one round trip
+            Each event needs an id plus any of title, start, end, description"""
+            try:
+                context = current_time_context(user)
+                processed_events = []
+                for event in json.loads(events) if isinstance(events, str) else events:
+                    data = {"id": event.get("id")}
+                    if event.get("title"):
+                        data["title"] = event["title"]
+                    if event.get("start"):
+                        data["start"] = context.to_utc(event["start"])
+                    if event.get("end"):
+                        data["end"] = context.to_utc(event["end"], is_end=True)
+                    if event.get("description"):
+                        data["description"] = event["description"]
+                    processed_events.append(data)
+
+                payload = {"action": "updateEvents", "data": {"events": processed_events}}
+                response = requests.post(user["calendarEndpoint"], json=payload)
+                get_mirror(user["calendarEndpoint"]).invalidate()
+                return response.json()
+            except Exception as e:
+                return {"error": f"Failed to update events: {str(e)}"}
+
+        @staticmethod
+        def delete_events(user, ids):
+            """Delete many calendar events in one round trip"""
+            try:
+                if isinstance(ids, str):
+                    ids = json.loads(ids) if ids.strip().startswith("[") else [ids]
+                payload = {"action": "deleteEvents", "data": {"ids": list(ids)}}
+                response = requests.post(user["calendarEndpoint"], json=payload)
+                get_mirror(user["calendarEndpoint"]).invalidate()
+                return response.json()
+            except Exception as e:
+                return {"error": f"Failed to delete events: {str(e)}"}
+
         @staticmethod
         def delete_event(user, id):
             """Delete a calendar event"""
             try:
                 payload = {"action": "deleteEvent", "data": {"id": id}}
                 response = requests.post(user["calendarEndpoint"], json=payload)
+                get_mirror(user["calendarEndpoint"]).invalidate()
                 return response.json()
             except Exception as e:
                 return {"error": f"Failed to delete event: {str(e)}"}
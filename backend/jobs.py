@@ -0,0 +1,224 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class JobStore:
+    """SQLite-backed job table shared by the HTTP front end and the workers.
+
+    Every operation opens its own short-lived connection, so the store can be
+    used from any thread and from separate worker processes pointed at the
+    same database file.
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_job(row):
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"]) if row["progress"] else [],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def create(self, payload):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, progress, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, '[]', ?, ?)",
+                (job_id, json.dumps(payload), now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def claim_next(self, worker_id):
+        """Atomically move the oldest queued job to running and return it"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, payload FROM jobs WHERE status = 'queued' "
+                    "ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (worker_id, time.time(), row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row["id"], "payload": json.loads(row["payload"])}
+
+    def add_progress(self, job_id, step):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = json_insert(progress, '$[#]', json(?)), "
+                "updated_at = ? WHERE id = ?",
+                (json.dumps(step), time.time(), job_id),
+            )
+
+    def finish(self, job_id, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def requeue_stale(self, stale_after):
+        """Put running jobs whose worker stopped reporting back in the queue"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ?",
+                (time.time(), time.time() - stale_after),
+            )
+            return cursor.rowcount
+
+
+class WorkerPool:
+    """Threads that pull queued jobs from a JobStore and run them.
+
+    `run_job(job_id, payload, on_step)` does the actual work and returns the
+    result dict; `on_step` is called with a progress entry after every model
+    step.
+    """
+
+    def __init__(self, store, run_job, size=2, poll_interval=0.5, stale_after=600):
+        self.store = store
+        self.run_job = run_job
+        self.size = size
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.threads = []
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    def ensure_started(self):
+        with self.lock:
+            if self.threads or self.size <= 0:
+                return
+            self.store.requeue_stale(self.stale_after)
+            for i in range(self.size):
+                thread = threading.Thread(
+                    target=self._work,
+                    name=f"job-worker-{i}",
+                    args=(f"{socket.gethostname()}:{os.getpid()}:{i}",),
+                    daemon=True,
+                )
+                thread.start()
+                self.threads.append(thread)
+            print(f"=== Started {self.size} job workers on {self.store.path}")
+
+    def stop(self):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self, worker_id):
+        while not self.stopping.is_set():
+            try:
+                job = self.store.claim_next(worker_id)
+            except Exception as e:
+                print(f"=== Error claiming job: {str(e)}")
+                job = None
+
+            if job is None:
+                self.stopping.wait(self.poll_interval)
+                continue
+
+            job_id = job["id"]
+            print(f"=== Worker {worker_id} running job {job_id}")
+            try:
+                result = self.run_job(
+                    job_id,
+                    job["payload"],
+                    lambda step: self.store.add_progress(job_id, step),
+                )
+                if "error" in result:
+                    self.store.fail(job_id, result["error"])
+                else:
+                    self.store.finish(job_id, result)
+            except Exception as e:
+                import traceback
+
+                print(f"=== Job {job_id} failed: {str(e)}")
+                print(traceback.format_exc())
+                self.store.fail(job_id, str(e))
+
+
+if __name__ == "__main__":
+    # Standalone worker process: `python jobs.py`, scaled independently of
+    # the Flask front end by pointing JOB_DB_PATH at the same file.
+    size = int(os.getenv("JOB_WORKERS", "2")) or 1
+    # The pool below runs the jobs; main must not start its own on import
+    os.environ["JOB_WORKERS"] = "0"
+    from main import run_job
+
+    pool = WorkerPool(JobStore(), run_job, size=size)
+    pool.ensure_started()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Hedge every request unless the request says otherwise
+LLM_HEDGE = os.getenv("LLM_HEDGE", "").strip().lower() in ("1", "true", "yes")
+# Send the duplicate once the first call is slower than this share of recent
+# calls to the same model
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+# Calls a model needs on record before it is hedged at all
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Budget caps: duplicates per request, and as a share of recent calls overall
+HEDGE_MAX_PER_REQUEST = int(os.getenv("LLM_HEDGE_MAX_PER_REQUEST", "2"))
+HEDGE_MAX_SHARE = float(os.getenv("LLM_HEDGE_MAX_SHARE", "0.1"))
+HEDGE_WINDOW = 200
+# Threads for model calls; 0 sizes the pool from the admission limit (see
+# main.py) so abandoned calls still finishing can't starve new ones
+HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "0"))
+
+
+def _has_content(response):
+    try:
+        return bool(response.choices[0].message.content)
+    except (AttributeError, IndexError, KeyError, TypeError):
+        return False
+
+
+class HedgePolicy:
+    """Duplicate an LLM call that is running late, keep the first good answer.
+
+    The first call gets until the HEDGE_PERCENTILE latency of its model; if
+    it hasn't answered by then, an identical second call goes out and
+    whichever returns a non-empty answer first is used. The other is
+    abandoned: the blocking client can't be interrupted, so it finishes in
+    the background and its result is dropped (its latency is still
+    recorded). Duplicates are capped per request and as a share of recent
+    calls, so a slow provider can't double the traffic. The wait before
+    hedging starts when the first call starts running, not when it is queued.
+    """
+
+    def __init__(self, latencies, workers=8):
+        self.latencies = latencies
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="llm-hedge"
+        )
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=HEDGE_WINDOW)
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.skipped = {"no_history": 0, "request_cap": 0, "budget": 0}
+
+    def delay(self, model):
+        """Seconds to wait before hedging a call to `model`, None if there's
+        too little history to tell what late means"""
+        if self.latencies.count(model) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.latencies.percentile(model, HEDGE_PERCENTILE)
+
+    def _take_budget(self, slot):
+        """Count a hedge against the share of recent calls, marking `slot`
+        (this call's entry in `recent`) as hedged"""
+        with self.lock:
+            window = max(len(self.recent), HEDGE_MIN_SAMPLES)
+            if sum(hedged for (hedged,) in self.recent) + 1 > HEDGE_MAX_SHARE * window:
+                self.skipped["budget"] += 1
+                return False
+            self.fired += 1
+            # Counts against the share from the moment it is sent
+            slot[0] = True
+            return True
+
+    def _timed(self, create, model, began=None):
+        started = time.monotonic()
+        if began is not None:
+            began.append(started)
+        response = create()
+        self.latencies.record(model, time.monotonic() - started)
+        return response
+
+    def _submit(self, create, model, began=None):
+        """Future of `create()`; its start time is appended to `began`"""
+        return self.executor.submit(self._timed, create, model, began)
+
+    def complete(self, create, model, allowance):
+        """Run `create()` (one chat completion on `model`), hedged if it runs
+        late and `allowance` (duplicates left for the request) permits.
+        Returns (response, hedged, hedge_won)."""
+        slot = [False]
+        with self.lock:
+            self.calls += 1
+            self.recent.append(slot)
+        delay = self.delay(model)
+        if delay is None or allowance <= 0:
+            with self.lock:
+                self.skipped["no_history" if delay is None else "request_cap"] += 1
+            # Nothing to race, so no need to leave the caller's thread
+            return self._timed(create, model), False, False
+
+        began = []
+        primary = self._submit(create, model, began)
+        while not primary.done():
+            # Time spent queued for a thread doesn't count towards the delay
+            elapsed = time.monotonic() - began[0] if began else 0.0
+            if elapsed >= delay:
+                break
+            wait([primary], timeout=delay - elapsed)
+        if primary.done():
+            return primary.result(), False, False
+        if not self._take_budget(slot):
+            return primary.result(), False, False
+
+        print(f"=== {model} slower than {delay:.2f}s, sending a hedged request")
+        hedge = self._submit(create, model)
+        pending = {primary, hedge}
+        fallback = None
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if _has_content(response):
+                    for other in pending:
+                        other.cancel()
+                    won = future is hedge
+                    if won:
+                        with self.lock:
+                            self.won += 1
+                    return response, True, won
+                fallback = response
+        if fallback is not None:
+            return fallback, True, False
+        raise error
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "hedged": self.fired,
+                "hedge_won": self.won,
+                "fire_rate": round(self.fired / self.calls, 4) if self.calls else 0.0,
+                "win_rate": round(self.won / self.fired, 4) if self.fired else 0.0,
+                "skipped": dict(self.skipped),
+            }
@@ -1,11 +1,39 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from functions import functions
+from functions import (
+    CACHED_SHEET_FUNCTIONS,
+    ENDPOINT_SETTINGS,
+    _is_true,
+    connector_endpoints,
+    functions,
+    resolve_source,
+    with_default_endpoints,
+)
+from admission import AdmissionController, AdmissionRejected
+from jobs import JobStore, WorkerPool, TERMINAL_STATUSES
+from llm_hedging import HEDGE_MAX_PER_REQUEST, HEDGE_WORKERS, LLM_HEDGE, HedgePolicy
+from model_routing import ModelRouter, stand_in_completion, step_type
+from output_repair import extract_calls, repairs
+from checkpoints import CheckpointStore, RequestCheckpoint, RequestInProgress
+from prefetch import PREFETCH, prefetcher
+from request_state import RequestState
+from results import ToolResult, serialize_call_responses
+from sheet_index import indexes as sheet_indexes
+from versioned_cache import responses as versioned_responses
+from write_buffer import BUFFER_WRITES, WriteBuffer
+from timecontext import (
+    TimeContext,
+    current_time_context,
+    reset_time_context,
+    set_time_context,
+)
 import openai
 import dotenv
 import os
-import re
 import json
+import time
+import uuid
+from collections import Counter
 
 app = Flask(__name__)
 CORS(
@@ -25,6 +53,19 @@ openai.api_key = os.getenv("OPENAI_API_KEY", "your-api-key-here")
 with open("connections.json", "r") as f:
     connectionsDoc = f.read()
 
+admission = AdmissionController.from_env()
+model_router = ModelRouter.from_env()
+# Room for every admitted request's current call plus the duplicates and
+# abandoned calls it may have in flight
+hedging = HedgePolicy(
+    model_router.latencies,
+    workers=HEDGE_WORKERS or admission.max_active * (2 + HEDGE_MAX_PER_REQUEST),
+)
+job_store = JobStore()
+# How long a background job waits for admission before it fails
+JOB_ADMISSION_TIMEOUT = float(os.getenv("JOB_ADMISSION_TIMEOUT", "300"))
+checkpoint_store = CheckpointStore()
+
 prompt = """You are a helpful AI assistant that can interact with various functions. When a user makes a request:
 
 1. First make any necessary function calls using this EXACT XML format:
@@ -137,119 +178,31 @@ For example, to call gsheets.write_cells, only respond with:
 """
 
 
-def extract_all_calls(input_str):
-    """Extract function calls using the XML format"""
-    calls = []
-
-    # First check if there are any function_call tags
-    if "<function_call>" not in input_str:
-        print("=== No <function_call> tags found in output")
-        # Look for potential malformed XML
-        if "< function_call>" in input_str or "<function_call >" in input_str:
-            print("=== WARNING: Found malformed function_call tags with extra spaces")
-
-        # Check for JSON-style calls
-        if "<call:" in input_str:
-            print("=== Found old-style <call: format, will attempt to extract")
-            # Extract using old method
-            calls_from_old_format = extract_calls_old_format(input_str)
-            if calls_from_old_format:
-                print(
-                    f"=== Successfully extracted {len(calls_from_old_format)} calls using old format"
-                )
-                return calls_from_old_format
+def extract_all_calls(input_str, report=None, truncated=False):
+    """Extract function calls using the XML format
 
-    # Find all function call blocks
-    pattern = r"<function_call>(.*?)</function_call>"
-    function_blocks = re.findall(pattern, input_str, re.DOTALL)
+    Malformed output is repaired wherever it can be read only one way (see
+    output_repair); an unclosed last call of a `truncated` reply is dropped.
+    The repairs are added to `report` (a Counter), if given, and to the
+    process-wide repair stats.
+    """
+    found = Counter()
+    calls = extract_calls(input_str, found, truncated)
 
-    if not function_blocks:
-        print("=== No function blocks matched the regex pattern")
+    if not calls and "<call:" in input_str:
+        print("=== Found old-style <call: format, will attempt to extract")
+        calls = extract_calls_old_format(input_str)
+    if not calls:
+        print("=== No function calls found in output")
         print(
             f"=== Output snippet: {input_str[:200]}...{input_str[-200:] if len(input_str) > 400 else ''}"
         )
+    if found:
+        print(f"=== Repaired model output: {dict(found)}")
 
-    for i, block in enumerate(function_blocks):
-        try:
-            print(f"=== Processing function block {i+1}/{len(function_blocks)}")
-
-            # Extract platform
-            platform_match = re.search(
-                r"<platform>([\s\S]*?)</platform>", block, re.DOTALL
-            )
-            platform = platform_match.group(1).strip() if platform_match else ""
-
-            if not platform:
-                print(f"=== WARNING: No platform found in block: {block[:100]}...")
-                continue
-
-            # Extract function
-            function_match = re.search(
-                r"<function>([\s\S]*?)</function>", block, re.DOTALL
-            )
-            function = function_match.group(1).strip() if function_match else ""
-
-            if not function:
-                print(f"=== WARNING: No function found in block: {block[:100]}...")
-                continue
-
-            # Extract parameters
-            parameters = []
-            param_pattern = r'<parameter\s+name="([^"]+)">([\s\S]*?)</parameter>'
-            param_matches = re.findall(param_pattern, block, re.DOTALL)
-
-            if not param_matches and "<parameters>" in block:
-                print(
-                    f"=== Parameters tag exists but no parameters found in block: {block[:100]}..."
-                )
-
-            for name, value in param_matches:
-                print(f"=== Found parameter: {name}")
-                value_preview = value[:50] + ("..." if len(value) > 50 else "")
-                print(f"=== Parameter value: {value_preview}")
-
-                # Try to parse JSON values
-                try:
-                    if value.strip().startswith("{") or value.strip().startswith("["):
-                        parsed_value = json.loads(value)
-                        print(f"=== Successfully parsed parameter value as JSON")
-                        parameters.append({"name": name.strip(), "value": parsed_value})
-                    else:
-                        # Keep as string if not JSON
-                        parameters.append({"name": name.strip(), "value": value})
-                except json.JSONDecodeError as e:
-                    print(f"=== Error parsing parameter value as JSON: {str(e)}")
-                    # Try fixing common issues with escaped quotes
-                    try:
-                        fixed_value = value.replace('\\"', '"').replace('\\\\"', '\\"')
-                        parsed_value = json.loads(fixed_value)
-                        print(
-                            f"=== Successfully parsed parameter value after fixing escapes"
-                        )
-                        parameters.append({"name": name.strip(), "value": parsed_value})
-                    except:
-                        # If still failing, keep as string
-                        print(
-                            f"=== Using raw string for parameter value after JSON parsing failed"
-                        )
-                        parameters.append({"name": name.strip(), "value": value})
-
-            # Create the function call object
-            if platform and function:
-                calls.append(
-                    {
-                        "platform": platform,
-                        "function": function,
-                        "parameters": parameters,
-                    }
-                )
-                print(
-                    f"=== Successfully extracted call: {platform}.{function} with {len(parameters)} parameters"
-                )
-        except Exception as e:
-            print(f"=== Error parsing function call block: {str(e)}")
-            print(f"=== Block: {block[:100]}...")
-
+    repairs.record(found, outputs=1, calls=len(calls))
+    if report is not None:
+        report.update(found)
     print(f"=== Total extracted function calls: {len(calls)}")
     return calls
 
@@ -294,54 +247,62 @@ def extract_calls_old_format(input_str):
     return calls
 
 
-def clean_json_for_prompt(json_str):
-    """Clean up JSON to reduce redundant escaping and spacing"""
-    try:
-        if not isinstance(json_str, str):
-            return json.dumps(json_str, separators=(",", ":"))
-
-        json_str = json_str.replace('\\"', '"').replace("\\\\", "\\")
-
-        parsed = json.loads(json_str)
-        return json.dumps(parsed, separators=(",", ":"))
-    except:
-        return json_str
+def format_function_result(platform, function, result):
+    """Wrap a function result for the prompt, keeping it as a Python object
 
+    JSON strings are decoded once here; the compact prompt text is rendered
+    lazily and cached on the returned ToolResult.
+    """
+    if isinstance(result, str) and result.lstrip()[:1] in ("{", "["):
+        try:
+            result = json.loads(result)
+        except ValueError:
+            # Not valid JSON, keep as is
+            pass
+    return ToolResult(platform, function, result)
 
-def format_function_result(platform, function, result):
-    """Format function results consistently and cleanly using XML format"""
-    try:
-        # Convert to string representation
-        if isinstance(result, dict) or isinstance(result, list):
-            result_str = json.dumps(result, separators=(",", ":"))
-        elif isinstance(result, str):
-            # If it's already a string but could be JSON, try to parse and re-serialize it
-            try:
-                json_obj = json.loads(result)
-                result_str = json.dumps(json_obj, separators=(",", ":"))
-            except:
-                # Not valid JSON, keep as is
-                result_str = result
-        else:
-            # For other types, just convert to string
-            result_str = str(result)
-
-        return f"""<function_result>
-  <platform>{platform}</platform>
-  <function>{function}</function>
-  <result>{result_str}</result>
-</function_result>"""
-    except Exception as e:
-        print(f"Error formatting function result: {e}")
-        # Safe fallback
-        return f"""<function_result>
-  <platform>{platform}</platform>
-  <function>{function}</function>
-  <result>Error formatting result: {str(e)}</result>
-</function_result>"""
 
+def flush_writes(state, user, call_responses, endpoint=None):
+    """Send the write_cells calls the request's write buffer is holding back
+    (for one spreadsheet `endpoint`, or all); a batch that fails is reported
+    in `call_responses`. Returns the [(sheet_name, result)] that failed."""
+    if not state or state.writes is None or not state.writes.pending:
+        return []
 
-def handle_message(input, call_responses, user, output="", depth=0):
+    def send(endpoint, cells, sheet_name):
+        try:
+            return functions.gsheets._send_cells(
+                dict(user, gsheetsEndpoint=endpoint), cells, sheet_name
+            )
+        except Exception as e:
+            return {"error": f"Failed to write cells: {str(e)}"}
+
+    failed = state.writes.flush(send, endpoint)
+    for sheet_name, result in failed:
+        print(f"=== Buffered writes to {sheet_name or 'the first sheet'} failed: {result}")
+        call_responses.append(
+            format_function_result(
+                "gsheets",
+                "write_cells",
+                {
+                    "error": f"Buffered writes to {sheet_name or 'the first sheet'} failed",
+                    "details": result,
+                },
+            )
+        )
+    return failed
+
+
+def handle_message(
+    input,
+    call_responses,
+    user,
+    output="",
+    depth=0,
+    on_step=None,
+    checkpoint=None,
+    state=None,
+):
     function_calls_trace = []
 
     try:
@@ -349,6 +310,22 @@ def handle_message(input, call_responses, user, output="", depth=0):
         clean_connections = json.dumps(connections, separators=(",", ":"))
 
         system_prompt = prompt + clean_connections
+        time_context = current_time_context(user)
+        system_prompt += (
+            f"\nThe user's timezone is {time_context.tz}; their local time at the start "
+            f"of this request was {time_context.now.isoformat()}. Times without an "
+            f"offset are read in that timezone."
+        )
+        for platform, kind in (
+            ("gsheets", "spreadsheets"),
+            ("calendar", "calendars"),
+        ):
+            sources = connector_endpoints(user, platform)
+            if len(sources) > 1:
+                system_prompt += (
+                    f"\nThe user has several {kind}: {', '.join(sources)}. Pass "
+                    f"source to pick one; without it the first is used."
+                )
 
         messages = [
             {"role": "system", "content": system_prompt},
@@ -356,33 +333,57 @@ def handle_message(input, call_responses, user, output="", depth=0):
         ]
 
         for response in call_responses:
+            if isinstance(response, ToolResult):
+                # Rendered once when first needed, reused on every later step
+                messages.append({"role": "assistant", "content": response.text})
+                continue
+
             if '"platform":"io"' in response.replace(
                 " ", ""
             ) and '"function":"continue"' in response.replace(" ", ""):
                 continue
 
-            if "Result of" in response:
-                try:
-                    start = response.find("{")
-                    end = response.rfind("}") + 1
-                    if start >= 0 and end > start:
-                        json_part = response[start:end]
-                        cleaned_json = clean_json_for_prompt(json_part)
-                        response = response[:start] + cleaned_json + response[end:]
-                except Exception as json_error:
-                    print(
-                        f"Error cleaning JSON: {str(json_error)}, response: {response[:100]}"
-                    )
-
             messages.append({"role": "assistant", "content": response})
 
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            temperature=0.7,
+        saved_step = checkpoint.load_step(depth) if checkpoint else None
+        if saved_step and saved_step["model_output"] is not None:
+            print(f"=== Reusing checkpointed model output for step {depth}")
+            current_output = saved_step["model_output"]
+            truncated = saved_step["truncated"]
+        else:
+            step = step_type(depth, call_responses)
+            route = model_router.route(
+                step, state.request_class if state else "interactive"
+            )
+            started = time.monotonic()
+            if state and state.hedge:
+                # Records each attempt's latency itself
+                response, hedged, won = hedging.complete(
+                    lambda: openai.ChatCompletion.create(
+                        messages=messages, **route.params()
+                    ),
+                    route.model,
+                    HEDGE_MAX_PER_REQUEST - state.hedges,
+                )
+                state.hedges += hedged
+                state.hedges_won += won
+                elapsed = time.monotonic() - started
+            else:
+                response = openai.ChatCompletion.create(
+                    messages=messages, **route.params()
+                )
+                elapsed = time.monotonic() - started
+                model_router.record(route, elapsed)
+            if state:
+                state.model_calls.append((step, route.model, elapsed))
+            current_output = response.choices[0].message.content
+            # Cut off by max_tokens: a call left open may hold partial values
+            truncated = getattr(response.choices[0], "finish_reason", None) == "length"
+            if checkpoint:
+                checkpoint.save_output(depth, current_output, truncated)
+        calls = extract_all_calls(
+            current_output, state.repairs if state else None, truncated
         )
-        current_output = response.choices[0].message.content
-        calls = extract_all_calls(current_output)
 
         should_continue = False
         found_end = False
@@ -393,6 +394,7 @@ def handle_message(input, call_responses, user, output="", depth=0):
                     should_continue = True
                 elif call["function"] == "end":
                     found_end = True
+                    flush_writes(state, user, call_responses)
                 function_calls_trace.append(
                     {
                         "platform": call["platform"],
@@ -410,16 +412,28 @@ def handle_message(input, call_responses, user, output="", depth=0):
                 }
             )
 
+            saved_call = saved_step["results"].get(str(i)) if saved_step else None
+            if saved_call:
+                # Already succeeded before the failure; never run it twice
+                print(f"=== Replaying checkpointed result for call {i} at step {depth}")
+                call_responses.extend(saved_call["entries"])
+                if saved_call["continue"]:
+                    should_continue = True
+                continue
+
             execution = (
                 "functions."
                 + call["platform"]
                 + "."
                 + call["function"]
                 + "("
-                + "user=user, "
+                + "user=call_user, "
             )
             params = []
             for param in call["parameters"]:
+                if param["name"] == "source" and call["platform"] in ENDPOINT_SETTINGS:
+                    # Picks the endpoint (call_user) rather than being passed on
+                    continue
                 params.append(f"{param['name']}={repr(param['value'])}")
             execution += ", ".join(params) + ")"
 
@@ -446,12 +460,136 @@ def handle_message(input, call_responses, user, output="", depth=0):
 {parameters_xml}  </parameters>
 </function_call>"""
 
+                entries_start = len(call_responses)
+                continued = False
                 call_responses.append(call_info)
 
-                result = eval(execution)
-                result_message = format_function_result(
-                    call["platform"], call["function"], result
+                params_dict = {
+                    param["name"]: param["value"] for param in call["parameters"]
+                }
+                # `source` picks one of the user's named spreadsheets/calendars
+                call_user, call_params = resolve_source(
+                    user, call["platform"], params_dict
                 )
+                memo_hit, result = (
+                    state.memo.get(call["platform"], call["function"], params_dict)
+                    if state
+                    else (False, None)
+                )
+                if memo_hit:
+                    # The full payload is already in the prompt, just point at it
+                    print(f"=== Memo hit for {call['platform']}.{call['function']}")
+                    result_message = format_function_result(
+                        call["platform"],
+                        call["function"],
+                        f"Unchanged: identical to the earlier result of "
+                        f"{call['platform']}.{call['function']} with the same "
+                        f"parameters above.",
+                    )
+                else:
+                    writes = state.writes if state else None
+                    prefetched, result = (
+                        state.prefetch.take(
+                            call["platform"], call["function"], params_dict
+                        )
+                        if state and state.prefetch
+                        else (False, None)
+                    )
+                    cached_sheet = (
+                        state.memo.peek(
+                            "gsheets",
+                            "read_sheet",
+                            {
+                                "sheet_name": params_dict.get("sheet_name", ""),
+                                "source": params_dict.get("source", ""),
+                            },
+                        )
+                        if state
+                        and (call["platform"], call["function"])
+                        in CACHED_SHEET_FUNCTIONS
+                        else None
+                    )
+                    if prefetched:
+                        # Started alongside the first model call
+                        print(
+                            f"=== Using prefetched {call['platform']}.{call['function']}"
+                        )
+                    elif cached_sheet is not None and not cached_sheet.get("truncated"):
+                        # The whole sheet was read earlier in this request and
+                        # nothing has written to it since; answer from that copy
+                        print(
+                            f"=== Answering gsheets.{call['function']} from the cached sheet"
+                        )
+                        local = getattr(functions.gsheets, f"{call['function']}_local")
+                        result = local(
+                            cached_sheet,
+                            **{
+                                name: value
+                                for name, value in call_params.items()
+                                if name != "sheet_name"
+                            },
+                        )
+                    elif writes is not None and (
+                        call["platform"],
+                        call["function"],
+                    ) == ("gsheets", "write_cells"):
+                        result = functions.gsheets.write_cells(
+                            user=call_user, buffer=writes, **call_params
+                        )
+                    else:
+                        if (
+                            writes is not None
+                            and call["platform"] == "gsheets"
+                            and writes.needs_flush(
+                                call_user.get("gsheetsEndpoint"),
+                                call["function"],
+                                call_params,
+                            )
+                        ):
+                            print(
+                                f"=== gsheets.{call['function']} needs the buffered writes, flushing"
+                            )
+                            flush_writes(
+                                state,
+                                user,
+                                call_responses,
+                                call_user.get("gsheetsEndpoint"),
+                            )
+                        result = eval(execution)
+                        if (
+                            writes is not None
+                            and (call["platform"], call["function"])
+                            == ("gsheets", "read_sheet")
+                            and isinstance(result, dict)
+                        ):
+                            # Read-your-writes for cells still in the buffer
+                            overlaid = writes.overlay(
+                                call_user.get("gsheetsEndpoint"),
+                                params_dict.get("sheet_name", ""),
+                                result,
+                            )
+                            if overlaid is None:
+                                # Formulas may depend on the pending cells
+                                flush_writes(
+                                    state,
+                                    user,
+                                    call_responses,
+                                    call_user.get("gsheetsEndpoint"),
+                                )
+                                overlaid = eval(execution)
+                            result = overlaid
+                    if state:
+                        if state.memo.is_read_only(call["platform"], call["function"]):
+                            state.memo.put(
+                                call["platform"], call["function"], params_dict, result
+                            )
+                        else:
+                            state.memo.invalidate(call["platform"])
+                            if state.prefetch:
+                                state.prefetch.discard(call["platform"])
+                    result_message = format_function_result(
+                        call["platform"], call["function"], result
+                    )
                 call_responses.append(result_message)
 
                 if call["platform"] in connections:
@@ -466,9 +604,23 @@ def handle_message(input, call_responses, user, output="", depth=0):
 
                         if function_info.get("output") == True:
                             should_continue = True
+                            continued = True
                             call_responses.append(
                                 "<function_call><platform>io</platform><function>continue</function><parameters></parameters></function_call>"
                             )
+
+                # A buffered write isn't done until it is flushed; until then it
+                # travels in the step's checkpoint as a pending write instead
+                if checkpoint and not (
+                    isinstance(result, dict)
+                    and ("error" in result or result.get("buffered"))
+                ):
+                    checkpoint.save_call(
+                        depth,
+                        i,
+                        serialize_call_responses(call_responses[entries_start:]),
+                        continued,
+                    )
             except Exception as e:
                 error_msg = f"Error in {call['platform']}.{call['function']}: {str(e)}"
                 print(error_msg)
@@ -477,11 +629,42 @@ def handle_message(input, call_responses, user, output="", depth=0):
                 print(traceback.format_exc())
                 call_responses.append(error_msg)
 
+        if checkpoint:
+            checkpoint.complete_step(
+                depth,
+                serialize_call_responses(call_responses),
+                state.writes.snapshot() if state and state.writes is not None else None,
+            )
+
+        if on_step:
+            try:
+                on_step(
+                    {
+                        "depth": depth,
+                        "calls": [f"{c['platform']}.{c['function']}" for c in calls],
+                        "call_responses": len(call_responses),
+                    }
+                )
+            except Exception as progress_error:
+                print(f"Error reporting progress: {str(progress_error)}")
+
         if should_continue:
-            next_result = handle_message(input, call_responses, user, output, depth + 1)
+            next_result = handle_message(
+                input,
+                call_responses,
+                user,
+                output,
+                depth + 1,
+                on_step=on_step,
+                checkpoint=checkpoint,
+                state=state,
+            )
             print(f"Continuing from depth {depth} to {depth+1}")
             if "function_calls_trace" in next_result:
                 function_calls_trace.extend(next_result["function_calls_trace"])
+            if "error" in next_result:
+                next_result["function_calls_trace"] = function_calls_trace
+                return next_result
             return {
                 "output": next_result["output"],
                 "call_responses": next_result["call_responses"],
@@ -497,10 +680,22 @@ def handle_message(input, call_responses, user, output="", depth=0):
                 "function_calls_trace": function_calls_trace,
             }
 
-        next_result = handle_message(input, call_responses, user, output, depth + 1)
+        next_result = handle_message(
+            input,
+            call_responses,
+            user,
+            output,
+            depth + 1,
+            on_step=on_step,
+            checkpoint=checkpoint,
+            state=state,
+        )
         print(f"Moving to next step from depth {depth} to {depth+1}")
         if "function_calls_trace" in next_result:
             function_calls_trace.extend(next_result["function_calls_trace"])
+        if "error" in next_result:
+            next_result["function_calls_trace"] = function_calls_trace
+            return next_result
         return {
             "output": next_result["output"],
             "call_responses": next_result["call_responses"],
@@ -521,6 +716,130 @@ def handle_message(input, call_responses, user, output="", depth=0):
         }
 
 
+def build_user_input(data):
+    """Prepend the conversation history, if any, to the current input"""
+    user_input = data["input"]
+
+    # Get conversation history if available
+    conversation_history = data.get("conversation_history", [])
+
+    # Format previous messages for context if available
+    context = ""
+    if (
+        conversation_history and len(conversation_history) > 1
+    ):  # More than just the current message
+        # Format the last few messages as context (excluding the current message)
+        context = "Previous conversation:\n"
+        for i, msg in enumerate(conversation_history[:-1]):  # All except the last one
+            role = "User" if msg.get("role") == "user" else "Assistant"
+            context += f"{role}: {msg.get('content', '')}\n"
+
+        context += "\nCurrent request:\n"
+
+        # Prepend context to the current input
+        user_input = context + user_input
+
+    return user_input
+
+
+def run_request(
+    data,
+    user,
+    on_step=None,
+    request_id=None,
+    resume=False,
+    request_class="interactive",
+):
+    """Run the full handle_message loop for a /message-style payload
+
+    With a request_id every step is checkpointed; with resume=True the loop
+    picks up after the last completed step instead of starting over.
+    `request_class` (overridden by the payload's) selects model routes;
+    the payload's `hedge` turns hedged model calls on or off.
+    """
+    checkpoint = None
+    depth = 0
+    call_responses = []
+    pending_writes = []
+    if request_id:
+        checkpoint = RequestCheckpoint(checkpoint_store, request_id)
+        if resume:
+            checkpoint_store.claim(request_id)
+            depth, call_responses, pending_writes = checkpoint_store.resume_point(
+                request_id
+            )
+            print(f"Resuming request {request_id} at step {depth}")
+        else:
+            checkpoint_store.begin(request_id, data)
+
+    user_input = build_user_input(data)
+    print(f"Processing request with input: {user_input[:50]}...")
+    user = with_default_endpoints(user)
+
+    state = RequestState(
+        buffer_writes=_is_true(data.get("buffer_writes", BUFFER_WRITES)),
+        request_class=data.get("request_class") or request_class,
+        hedge=_is_true(data.get("hedge", LLM_HEDGE)),
+    )
+    if pending_writes:
+        # Acknowledged as buffered before the stop but never sent
+        if state.writes is None:
+            state.writes = WriteBuffer()
+        state.writes.restore(pending_writes)
+    time_token = set_time_context(TimeContext.for_user(user))
+    try:
+        if not call_responses and _is_true(data.get("prefetch", PREFETCH)):
+            # Likely first reads run while the first model call is in flight
+            state.prefetch = prefetcher.start(
+                user, user_input, state.memo, admission=admission
+            )
+        result = handle_message(
+            user_input,
+            call_responses,
+            user=user,
+            depth=depth,
+            on_step=on_step,
+            checkpoint=checkpoint,
+            state=state,
+        )
+        while not result.get("complete", False):
+            result = handle_message(
+                user_input,
+                result.get("call_responses", []),
+                user=user,
+                output=result.get("output", ""),
+                on_step=on_step,
+                state=state,
+            )
+    except Exception:
+        if checkpoint:
+            # Resumable right away rather than once the run goes stale
+            checkpoint_store.set_status(request_id, "failed")
+        raise
+    finally:
+        reset_time_context(time_token)
+
+    # Writes still held back when the chain stopped without io.end or failed
+    failed_writes = flush_writes(state, user, result.get("call_responses", []))
+    if failed_writes and "error" in result:
+        # No call_responses come back with an error; say what wasn't written
+        result["error"] += "; buffered writes not saved to " + ", ".join(
+            sheet_name or "the first sheet" for sheet_name, _ in failed_writes
+        )
+
+    if state.prefetch:
+        state.prefetch.finish(result.get("function_calls_trace", []))
+
+    result["stats"] = state.stats()
+    print(f"Request stats: {json.dumps(result['stats'])}")
+
+    if checkpoint:
+        checkpoint_store.set_status(
+            request_id, "failed" if "error" in result else "done"
+        )
+    return result
+
+
 @app.route("/message", methods=["POST", "OPTIONS"])
 def handle_request():
     if request.method == "OPTIONS":
@@ -529,53 +848,71 @@ def handle_request():
     try:
         data = request.get_json()
 
+        resume = bool(data and data.get("resume"))
+        if resume:
+            if not data.get("request_id"):
+                return jsonify({"error": "Missing 'request_id' to resume"}), 400
+            saved = checkpoint_store.load_request(data["request_id"])
+            if saved is None:
+                return jsonify({"error": "No checkpoint found for request"}), 404
+            if saved["status"] == "done":
+                return jsonify({"error": "Request already completed"}), 409
+            if saved["live"]:
+                return jsonify({"error": "Request is still running"}), 409
+            # Endpoints may have been fixed since the failure, prefer the new ones
+            data = {**saved["payload"], **data}
+
         if not data or "input" not in data:
             return jsonify({"error": "Missing 'input' in JSON body"}), 400
 
-        user_input = data["input"]
         user = data["user"]
+        request_id = data.get("request_id") or uuid.uuid4().hex
 
-        # Get conversation history if available
-        conversation_history = data.get("conversation_history", [])
-
-        # Format previous messages for context if available
-        context = ""
-        if (
-            conversation_history and len(conversation_history) > 1
-        ):  # More than just the current message
-            # Format the last few messages as context (excluding the current message)
-            context = "Previous conversation:\n"
-            for i, msg in enumerate(
-                conversation_history[:-1]
-            ):  # All except the last one
-                role = "User" if msg.get("role") == "user" else "Assistant"
-                context += f"{role}: {msg.get('content', '')}\n"
-
-            context += "\nCurrent request:\n"
-
-            # Prepend context to the current input
-            user_input = context + user_input
-
-        print(f"Processing request with input: {user_input[:50]}...")
-
-        result = handle_message(user_input, [], user=user)
-        while not result.get("complete", False):
-            result = handle_message(
-                user_input,
-                result.get("call_responses", []),
-                user=user,
-                output=result.get("output", ""),
+        try:
+            ticket = admission.admit(user, openai.api_key)
+        except AdmissionRejected as e:
+            print(f"Rejected request ({e.reason}), retry after {e.retry_after}s")
+            response = jsonify(
+                {
+                    "error": f"Server busy: {e.reason}",
+                    "retry_after": e.retry_after,
+                }
             )
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response, 429
+
+        try:
+            with ticket:
+                result = run_request(
+                    data, user, request_id=request_id, resume=resume
+                )
+        except RequestInProgress:
+            return jsonify({"error": "Request is still running"}), 409
 
         if "error" in result:
             error_msg = result["error"]
             print(f"ERROR in handle_message: {error_msg}")
-            return jsonify({"error": error_msg}), 500
+            # Send {"request_id": ..., "resume": true} to continue from here
+            return (
+                jsonify(
+                    {
+                        "error": error_msg,
+                        "request_id": request_id,
+                        "resumable": True,
+                        "stats": result.get("stats", {}),
+                    }
+                ),
+                500,
+            )
 
         return jsonify(
             {
                 "output": result["output"],
-                "call_responses": result.get("call_responses", []),
+                "call_responses": serialize_call_responses(
+                    result.get("call_responses", [])
+                ),
+                "request_id": request_id,
+                "stats": result.get("stats", {}),
             }
         )
     except Exception as e:
@@ -587,5 +924,130 @@ def handle_request():
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 
+def admit_job(user):
+    """Admission ticket for a background job. Unlike /message, a job that is
+    turned away waits out the retry-after hint and tries again, up to
+    JOB_ADMISSION_TIMEOUT seconds (below the workers' stale-job cutoff)."""
+    deadline = time.monotonic() + JOB_ADMISSION_TIMEOUT
+    while True:
+        try:
+            return admission.admit(user, openai.api_key)
+        except AdmissionRejected as e:
+            if time.monotonic() + e.retry_after > deadline:
+                raise
+            print(f"=== Job held back ({e.reason}), retrying in {e.retry_after}s")
+            time.sleep(e.retry_after)
+
+
+def run_job(job_id, payload, on_step):
+    """Worker entry point for background jobs. Steps are checkpointed under
+    the job id, so a job requeued after its worker died replays the calls
+    that already ran instead of making them again."""
+    try:
+        ticket = admit_job(payload["user"])
+    except AdmissionRejected as e:
+        return {"error": f"Server busy: {e.reason}"}
+    # A checkpoint means an earlier worker got part of the way through
+    resume = checkpoint_store.load_request(job_id) is not None
+    try:
+        with ticket:
+            result = run_request(
+                payload,
+                payload["user"],
+                on_step=on_step,
+                request_id=job_id,
+                resume=resume,
+                request_class="background",
+            )
+    except RequestInProgress:
+        # Send {"request_id": <job id>, "resume": true} to /message once the
+        # other run has stopped
+        return {"error": "Job is still running elsewhere or already finished"}
+    if "error" in result:
+        return {"error": result["error"]}
+    return {
+        "output": result["output"],
+        "call_responses": serialize_call_responses(result.get("call_responses", [])),
+        "function_calls_trace": result.get("function_calls_trace", []),
+        "stats": result.get("stats", {}),
+    }
+
+
+# In-process workers; set JOB_WORKERS=0 and run `python jobs.py` to scale
+# them separately from the HTTP front end.
+job_workers = WorkerPool(job_store, run_job, size=int(os.getenv("JOB_WORKERS", "2")))
+
+
+@app.route("/jobs", methods=["POST", "OPTIONS"])
+def handle_create_job():
+    if request.method == "OPTIONS":
+        return "", 200
+
+    data = request.get_json()
+    if not data or "input" not in data or "user" not in data:
+        return jsonify({"error": "Missing 'input' or 'user' in JSON body"}), 400
+
+    job_id = job_store.create(data)
+    print(f"Queued job {job_id} with input: {data['input'][:50]}...")
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def handle_get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def handle_job_events(job_id):
+    """Server-sent events stream of job progress until the job finishes"""
+    if job_store.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        last_update = None
+        while True:
+            job = job_store.get(job_id)
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype="text/event-stream")
+
+
+@app.route("/metrics", methods=["GET"])
+def handle_metrics():
+    return jsonify(
+        {
+            "admission": admission.metrics(),
+            "versions": versioned_responses.metrics(),
+            "prefetch": prefetcher.metrics(),
+            "sheet_indexes": sheet_indexes.metrics(),
+            "models": model_router.metrics(),
+            "hedging": hedging.metrics(),
+            "output_repairs": repairs.metrics(),
+        }
+    )
+
+
+@app.route("/standin/v1/chat/completions", methods=["POST"])
+def handle_standin_completion():
+    """Stand-in OpenAI chat endpoint for trying model routes offline; point a
+    route's api_base at http://<host>:5001/standin/v1. Only served when
+    STANDIN_MODEL is set."""
+    if not _is_true(os.getenv("STANDIN_MODEL", "")):
+        return jsonify({"error": "Stand-in model is disabled"}), 404
+    return jsonify(stand_in_completion(request.get_json() or {}))
+
+
+# Jobs left queued (or stranded running) by a restart don't wait for a new POST
+job_workers.ensure_started()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001, debug=True)
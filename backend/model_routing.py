@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Kinds of model step handle_message makes
+STEP_TYPES = ("plan", "continue", "recover")
+RULE_KEYS = {
+    "step",
+    "request_class",
+    "model",
+    "temperature",
+    "max_tokens",
+    "api_base",
+    "latency_budget",
+}
+# What every step used before routing existed
+DEFAULT_RULES = [{"model": "gpt-3.5-turbo", "temperature": 0.7}]
+# Latencies kept per model for the percentiles; older ones are forgotten so
+# a model passed over for being slow gets tried again
+LATENCY_WINDOW = 200
+LATENCY_MAX_AGE = 600
+# Samples a model needs before its latency counts against a budget
+MIN_LATENCY_SAMPLES = 5
+
+
+def step_type(depth, call_responses):
+    """plan for the first model call of a request, recover right after a
+    failed call, continue otherwise"""
+    if depth == 0 and not call_responses:
+        return "plan"
+    for entry in reversed(call_responses):
+        if isinstance(entry, str) and "<function>continue</function>" in entry:
+            continue
+        value = getattr(entry, "value", None)
+        if (isinstance(entry, str) and entry.startswith("Error in ")) or (
+            isinstance(value, dict) and "error" in value
+        ):
+            return "recover"
+        break
+    return "continue"
+
+
+class LatencyTracker:
+    """Recent call latencies per model"""
+
+    def __init__(self, window=LATENCY_WINDOW, max_age=LATENCY_MAX_AGE):
+        self.window = window
+        self.max_age = max_age
+        self.samples = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self.lock:
+            samples = self.samples.setdefault(model, deque(maxlen=self.window))
+            samples.append((time.monotonic(), seconds))
+            self.calls[model] = self.calls.get(model, 0) + 1
+
+    def _recent(self, model):
+        samples = self.samples.get(model)
+        if not samples:
+            return []
+        cutoff = time.monotonic() - self.max_age
+        while samples and samples[0][0] < cutoff:
+            samples.popleft()
+        return sorted(seconds for _, seconds in samples)
+
+    def count(self, model):
+        with self.lock:
+            return len(self._recent(model))
+
+    def percentile(self, model, p):
+        """Latency below which a fraction `p` of recent calls finished, or None"""
+        with self.lock:
+            samples = self._recent(model)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def metrics(self):
+        with self.lock:
+            models = {model: self._recent(model) for model in self.samples}
+            calls = dict(self.calls)
+
+        def at(samples, p):
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 4)
+
+        return {
+            model: {
+                "calls": calls[model],
+                "avg": round(sum(samples) / len(samples), 4),
+                "p50": at(samples, 0.5),
+                "p90": at(samples, 0.9),
+                "p99": at(samples, 0.99),
+            }
+            for model, samples in models.items()
+            if samples
+        }
+
+
+class Route:
+    """The model and parameters chosen for one step"""
+
+    def __init__(self, rule):
+        self.model = rule["model"]
+        self.temperature = rule.get("temperature", 0.7)
+        self.max_tokens = rule.get("max_tokens")
+        self.api_base = rule.get("api_base")
+
+    def params(self):
+        """Keyword arguments for openai.ChatCompletion.create"""
+        params = {"model": self.model, "temperature": self.temperature}
+        if self.max_tokens:
+            params["max_tokens"] = self.max_tokens
+        if self.api_base:
+            params["api_base"] = self.api_base
+        return params
+
+
+class ModelRouter:
+    """Picks the model for each step from an ordered list of rules.
+
+    A rule matches on `step` and `request_class` (a value or a list; absent
+    means any) and names a `model` with its `temperature`, `max_tokens` and
+    `api_base`. The first matching rule wins, except that a rule with a
+    `latency_budget` (seconds) is passed over while its model's recent p90
+    latency is above the budget. When every match is over budget, the first
+    match is used anyway.
+    """
+
+    def __init__(self, rules=None, latencies=None):
+        self.rules = [self._validate(rule) for rule in (rules or DEFAULT_RULES)]
+        self.latencies = latencies or LatencyTracker()
+
+    @classmethod
+    def from_env(cls):
+        """Rules from MODEL_ROUTES: a JSON list, or the path of a file with one"""
+        config = os.getenv("MODEL_ROUTES", "").strip()
+        if not config:
+            return cls()
+        if not config.startswith("["):
+            with open(config, "r") as f:
+                config = f.read()
+        return cls(json.loads(config))
+
+    @staticmethod
+    def _validate(rule):
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown model route keys {sorted(unknown)}")
+        if not rule.get("model"):
+            raise ValueError(f"Model route without a model: {rule}")
+        steps = rule.get("step")
+        for step in steps if isinstance(steps, list) else [steps]:
+            if step is not None and step not in STEP_TYPES:
+                raise ValueError(
+                    f"Unknown step type {step!r}, choose from {STEP_TYPES}"
+                )
+        return rule
+
+    @staticmethod
+    def _matches(rule, key, value):
+        wanted = rule.get(key)
+        if wanted is None:
+            return True
+        return value in wanted if isinstance(wanted, list) else value == wanted
+
+    def _within_budget(self, rule):
+        budget = rule.get("latency_budget")
+        if budget is None:
+            return True
+        if self.latencies.count(rule["model"]) < MIN_LATENCY_SAMPLES:
+            return True
+        return self.latencies.percentile(rule["model"], 0.9) <= budget
+
+    def route(self, step, request_class):
+        matches = [
+            rule
+            for rule in self.rules
+            if self._matches(rule, "step", step)
+            and self._matches(rule, "request_class", request_class)
+        ]
+        if not matches:
+            return Route(DEFAULT_RULES[0])
+        for rule in matches:
+            if self._within_budget(rule):
+                return Route(rule)
+        return Route(matches[0])
+
+    def record(self, route, seconds):
+        """Note how long a completion on `route` took"""
+        self.latencies.record(route.model, seconds)
+
+    def metrics(self):
+        return {"rules": len(self.rules), "latency": self.latencies.metrics()}
+
+
+def stand_in_completion(payload, latencies=None):
+    """OpenAI-shaped reply for the stand-in chat endpoint.
+
+    Sleeps for the model's entry in STANDIN_LATENCY ({"model": seconds}) and
+    answers by ending the request, so routing rules can be exercised
+    without a real model.
+    """
+    model = payload.get("model", "stand-in")
+    latencies = latencies or json.loads(os.getenv("STANDIN_LATENCY", "{}") or "{}")
+    time.sleep(float(latencies.get(model, 0)))
+    content = (
+        f"Stand-in reply from {model}.\n"
+        "<function_call>\n"
+        "  <platform>io</platform>\n"
+        "  <function>end</function>\n"
+        "  <parameters></parameters>\n"
+        "</function_call>"
+    )
+    return {
+        "id": f"standin-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
@@ -0,0 +1,358 @@
+import ast
+import json
+import re
+import threading
+from collections import Counter
+
+# Tags of the call format, with any stray spaces the model put in them
+_SPACED_TAG = re.compile(
+    r"<\s*(/?)\s*(function_call|parameters|platform|function)\s*(/?)\s*>"
+)
+_PARAMETER_OPEN = re.compile(
+    r"""<\s*parameter\s+name\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))\s*>"""
+)
+_PARAMETER_CLOSE = re.compile(r"<\s*/\s*parameter\s*>")
+_CANONICAL_OPEN = re.compile(r'<parameter name="([^"]*)">')
+_NAME = re.compile(r"[A-Za-z_]\w*")
+_FENCE = re.compile(r"^```[\w-]*\s*\n?([\s\S]*?)\n?\s*```$")
+_PYTHON_WORDS = re.compile(r"\b(True|False|None)\b")
+# Left over after a complete JSON value when the model fumbled its quoting
+_STRAY_TAIL = re.compile(r"""^[\s"'`}\]]*$""")
+_ESCAPED = re.compile(r'\\(["\\])')
+# Outcomes counted that are not repairs
+FAILURES = ("dropped_block", "unparsed_json", "truncated_json", "truncated_call")
+
+
+class TruncatedJSON(json.JSONDecodeError):
+    """JSON that stops with brackets (or a string) still open. Closing them
+    would guess where a possibly cut-off value ended, so it is refused
+    unless the surrounding tags show the value is complete."""
+
+
+def normalize_tags(text, report):
+    """Canonical spelling of the call tags: `< function_call >`,
+    `<parameter name='x'>`, `<parameter name=x>` and `</ parameter>` all
+    become the form the prompt asks for"""
+
+    def tag(match):
+        closing, name, self_closing = match.groups()
+        canonical = f"<{closing}{name}>"
+        if self_closing and not closing and name == "parameters":
+            # <parameters/>: no parameters
+            canonical = "<parameters></parameters>"
+        if match.group(0) != canonical:
+            report["tag_syntax"] += 1
+        return canonical
+
+    def parameter(match):
+        name = next(group for group in match.groups() if group is not None)
+        canonical = f'<parameter name="{name.strip()}">'
+        if match.group(0) != canonical:
+            report["tag_syntax"] += 1
+        return canonical
+
+    def parameter_close(match):
+        if match.group(0) != "</parameter>":
+            report["tag_syntax"] += 1
+        return "</parameter>"
+
+    text = _SPACED_TAG.sub(tag, text)
+    text = _PARAMETER_OPEN.sub(parameter, text)
+    return _PARAMETER_CLOSE.sub(parameter_close, text)
+
+
+def _blocks(text, report):
+    """(body, closed) of every <function_call>; an unclosed one runs to the
+    next <function_call> or the end of the output"""
+    starts = [m.start() for m in re.finditer("<function_call>", text)]
+    blocks = []
+    for i, start in enumerate(starts):
+        body_start = start + len("<function_call>")
+        limit = starts[i + 1] if i + 1 < len(starts) else len(text)
+        end = text.find("</function_call>", body_start, limit)
+        if end == -1:
+            report["unclosed_call"] += 1
+            blocks.append((text[body_start:limit], False))
+        else:
+            blocks.append((text[body_start:end], True))
+    return blocks
+
+
+def _tag_value(block, tag, report):
+    match = re.search(rf"<{tag}>([\s\S]*?)</{tag}>", block)
+    if match and match.group(1).strip():
+        return match.group(1).strip()
+    # <platform>gsheets followed by the next tag: the name is all there is
+    match = re.search(rf"<{tag}>\s*({_NAME.pattern}(?:\.{_NAME.pattern})?)", block)
+    if not match:
+        return ""
+    report["unclosed_tag"] += 1
+    return match.group(1)
+
+
+def _looks_like_json(value):
+    text = value.strip()
+    if text[:1] in ("{", "[") or text.startswith("```"):
+        return True
+    return text[:1] == '"' and text[1:].lstrip()[:1] in ("{", "[")
+
+
+def _parameters(block, closed, report):
+    opens = list(_CANONICAL_OPEN.finditer(block))
+    section_end = block.find("</parameters>")
+    parameters = []
+    for i, match in enumerate(opens):
+        start = match.end()
+        if i + 1 < len(opens):
+            limit = opens[i + 1].start()
+        elif section_end > start:
+            limit = section_end
+        else:
+            limit = len(block)
+        close = block.find("</parameter>", start, limit)
+        if close != -1:
+            value = block[start:close]
+        else:
+            report["unclosed_tag"] += 1
+            value = block[start:limit].strip()
+            if limit == len(block) and not closed and not _looks_like_json(value):
+                # Runs into whatever prose followed a truncated call
+                value = value.split("\n", 1)[0].strip()
+
+        if _looks_like_json(value):
+            try:
+                # Only close brackets when the tags show nothing was cut off
+                value = repair_json(value, report, closed and close != -1)
+            except TruncatedJSON as e:
+                print(f"=== Parameter {match.group(1)} looks cut off: {e}")
+                report["truncated_json"] += 1
+            except json.JSONDecodeError as e:
+                print(f"=== Could not repair parameter {match.group(1)}: {e}")
+                report["unparsed_json"] += 1
+        parameters.append({"name": match.group(1).strip(), "value": value})
+    return parameters
+
+
+def extract_calls(text, report, truncated=False):
+    """Calls in a model reply, repairing what can be read only one way:
+    misspelled tags, missing closing tags, a platform written into the
+    function name and malformed JSON parameters (see repair_json).
+    Everything outside <function_call> blocks is ignored. A `truncated`
+    reply (it hit the token limit) loses its last call if that was never
+    closed. Repairs made are counted in `report`."""
+    text = normalize_tags(text, report)
+    blocks = _blocks(text, report)
+    if truncated and blocks and not blocks[-1][1]:
+        print("=== Reply was cut off inside its last call, dropping it")
+        report["truncated_call"] += 1
+        blocks.pop()
+    calls = []
+    for block, closed in blocks:
+        platform = _tag_value(block, "platform", report)
+        function = _tag_value(block, "function", report)
+        if "." in function and platform in ("", function.split(".", 1)[0]):
+            # <function>gsheets.read_sheet</function>
+            report["qualified_name"] += 1
+            platform, function = function.split(".", 1)
+        if not platform or not function:
+            print(f"=== WARNING: No platform or function in block: {block[:100]}...")
+            report["dropped_block"] += 1
+            continue
+        calls.append(
+            {
+                "platform": platform,
+                "function": function,
+                "parameters": _parameters(block, closed, report),
+            }
+        )
+    return calls
+
+
+def _scan(text):
+    """Walk JSON text outside strings. Returns (text with trailing commas
+    dropped, closers missing at the end, whether it ends inside a string),
+    or None when brackets are mismatched"""
+    out = []
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return None
+            # A trailing comma before this closer
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+        out.append(char)
+    return "".join(out), "".join(reversed(stack)), in_string
+
+
+def _unescape(text):
+    """JSON escaped one level too many, {\\"A1\\": ...}: drop one level of
+    backslashes before quotes and backslashes"""
+    return _ESCAPED.sub(r"\1", text)
+
+
+def _decode(text, report):
+    try:
+        value, end = json.JSONDecoder().raw_decode(text)
+    except json.JSONDecodeError:
+        return None
+    if end < len(text):
+        if not _STRAY_TAIL.match(text[end:]):
+            return None
+        report["stray_text"] += 1
+    return (value,)
+
+
+def _structural(text, report, close_open):
+    """Parse `text` after dropping trailing commas and, with `close_open`,
+    closing what was left open at the end. Notes `truncated_json` in
+    `report` when the text stops with something still open."""
+    decoded = _decode(text, report)
+    if decoded:
+        return decoded
+    scanned = _scan(text)
+    if scanned is None:
+        return None
+    fixed, missing, in_string = scanned
+    if fixed != text:
+        decoded = _decode(fixed, report)
+        if decoded:
+            report["trailing_comma"] += 1
+            return decoded
+    if missing or in_string:
+        if in_string or not close_open:
+            report["truncated_json"] += 1
+            return None
+        decoded = _decode(fixed.rstrip().rstrip(",") + missing, report)
+        if decoded:
+            report["unclosed_json"] += 1
+            return decoded
+    return None
+
+
+def repair_json(text, report=None, close_open=False):
+    """Parse a JSON object or array as a model tends to mangle it.
+
+    Tried in order until one parses: as is; without ``` fences; without
+    quotes around the whole value (or JSON-encoded a second time); with
+    trailing commas dropped and, if `close_open` (the caller knows the
+    value is complete), brackets left open at the end closed; with quotes
+    that were escaped once too often unescaped; and as a Python literal
+    (single quotes, True/None). Each repair is counted in `report`.
+    Raises TruncatedJSON when the text stops with brackets or a string
+    still open, the original json.JSONDecodeError when nothing works.
+    """
+    report = Counter() if report is None else report
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+    else:
+        if isinstance(value, str) and _looks_like_json(value):
+            report["outer_quotes"] += 1
+            return repair_json(value, report, close_open)
+        return value
+
+    found = Counter()
+    candidate = text.strip()
+    fence = _FENCE.match(candidate)
+    if fence:
+        found["code_fence"] += 1
+        candidate = fence.group(1).strip()
+    if (
+        len(candidate) > 1
+        and candidate[0] == candidate[-1] == '"'
+        and candidate[1:].lstrip()[:1] in ("{", "[")
+    ):
+        found["outer_quotes"] += 1
+        candidate = candidate[1:-1].strip()
+
+    attempts = [(candidate, None)]
+    if '\\"' in candidate:
+        attempts.append((_unescape(candidate), "escaped_quotes"))
+    truncated = False
+    for attempt, kind in attempts:
+        steps = Counter()
+        decoded = _structural(attempt, steps, close_open)
+        if decoded:
+            if kind:
+                steps[kind] += 1
+            steps.pop("truncated_json", None)
+            report.update(found + steps)
+            value = decoded[0]
+            if isinstance(value, str) and _looks_like_json(value):
+                report["outer_quotes"] += 1
+                return repair_json(value, report, close_open)
+            return value
+        truncated = truncated or bool(steps["truncated_json"])
+
+    if "'" in candidate or _PYTHON_WORDS.search(candidate):
+        try:
+            value = ast.literal_eval(candidate)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            value = None
+        if isinstance(value, (dict, list)):
+            # Round trip so only JSON types come out
+            value = json.loads(json.dumps(value, default=str))
+            report.update(found)
+            report["python_literal"] += 1
+            return value
+    if truncated:
+        raise TruncatedJSON(
+            "Value stops with brackets or a string still open", error.doc, error.pos
+        )
+    raise error
+
+
+class RepairStats:
+    """Repairs made to model output across requests"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outputs = 0
+        self.repaired_outputs = 0
+        self.calls = 0
+        self.counts = Counter()
+
+    def record(self, report, outputs=0, calls=0):
+        with self.lock:
+            self.outputs += outputs
+            self.calls += calls
+            if outputs and any(
+                count for kind, count in report.items() if kind not in FAILURES
+            ):
+                self.repaired_outputs += outputs
+            self.counts.update(report)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "outputs": self.outputs,
+                "repaired_outputs": self.repaired_outputs,
+                "calls": self.calls,
+                "repairs": {
+                    kind: count
+                    for kind, count in self.counts.items()
+                    if kind not in FAILURES
+                },
+                "failures": {kind: self.counts[kind] for kind in FAILURES},
+            }
+
+
+repairs = RepairStats()
@@ -0,0 +1,231 @@
+import contextvars
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from admission import AdmissionController
+from functions import functions, resolve_source
+from request_state import CallMemo
+
+# Start likely reads while the first model call is still running (opt-in: the
+# reads cost Apps Script quota even when the model never asks for them)
+PREFETCH = os.getenv("PREFETCH", "").strip().lower() in ("1", "true", "yes")
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+# Longest a tool call waits on an in-flight prefetch before running itself
+PREFETCH_WAIT = float(os.getenv("PREFETCH_WAIT", "5"))
+# A call whose recent prefetches were used less often than this stops being
+# prefetched on keywords alone (the user's own history still triggers it)
+PREFETCH_MIN_HIT_RATE = float(os.getenv("PREFETCH_MIN_HIT_RATE", "0.25"))
+PREFETCH_MIN_SAMPLES = 20
+# Requests remembered per user, and users remembered, for the history rule
+HISTORY_LENGTH = 8
+HISTORY_USERS = 1024
+
+# Calls worth starting early, with the words in a request that suggest them.
+# Parameters are the defaults the model uses when it calls them bare, so a
+# prefetched result matches the memo key of that call.
+CANDIDATES = OrderedDict(
+    [
+        (
+            ("datetime", "get_current_time"),
+            r"\b(now|today|tonight|tomorrow|yesterday|time|date|week|month|"
+            r"monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+        ),
+        (
+            ("gsheets", "list_sheets"),
+            r"\b(sheets?|spreadsheets?|tabs?|workbook)\b",
+        ),
+        (
+            ("gsheets", "read_sheet"),
+            r"\b(sheets?|spreadsheets?|rows?|columns?|cells?|table|budget|expenses?|"
+            r"totals?|invoices?)\b",
+        ),
+        (
+            ("calendar", "list_events"),
+            r"\b(calendar|events?|meetings?|schedule|appointments?|agenda|busy|free|"
+            r"plans?|this week|next week)\b",
+        ),
+    ]
+)
+_PATTERNS = {call: re.compile(pattern, re.I) for call, pattern in CANDIDATES.items()}
+_ENDPOINTS = {"gsheets": "gsheetsEndpoint", "calendar": "calendarEndpoint"}
+
+
+class RequestPrefetch:
+    """Prefetched calls of one request, keyed like the request's CallMemo"""
+
+    def __init__(self, prefetcher, user_key, memo):
+        self.prefetcher = prefetcher
+        self.user_key = user_key
+        self.memo = memo
+        self.futures = {}
+        self.started = 0
+        self.used = set()
+
+    def take(self, platform, function, params):
+        """(True, result) if this call was prefetched successfully, waiting
+        for it if it is still running; (False, None) otherwise"""
+        future = self.futures.pop(self.memo.key(platform, function, params), None)
+        if future is None:
+            return False, None
+        try:
+            result = future.result(timeout=PREFETCH_WAIT)
+        except TimeoutError:
+            future.cancel()
+            self.prefetcher.record((platform, function), False)
+            return False, None
+        except Exception as e:
+            print(f"=== Prefetch of {platform}.{function} failed: {str(e)}")
+            self.prefetcher.record((platform, function), False)
+            return False, None
+        used = not (isinstance(result, dict) and "error" in result)
+        self.prefetcher.record((platform, function), used)
+        if used:
+            self.used.add((platform, function))
+        return used, result if used else None
+
+    def discard(self, platform):
+        """Drop prefetches of `platform`, which a write may have made stale"""
+        for key in [k for k in self.futures if k[0] == platform]:
+            self.futures.pop(key).cancel()
+            self.prefetcher.record(key[:2], False)
+
+    def finish(self, trace):
+        """Count what was never asked for as waste and remember which candidate
+        calls the request made, from its function_calls_trace"""
+        for key, future in self.futures.items():
+            future.cancel()
+            self.prefetcher.record(key[:2], False)
+        self.futures.clear()
+        called = set()
+        for call in trace:
+            if (call["platform"], call["function"]) in CANDIDATES:
+                params = {p["name"]: p["value"] for p in call["parameters"]}
+                called.add(self.memo.key(call["platform"], call["function"], params))
+        self.prefetcher.remember(self.user_key, called)
+
+    def stats(self):
+        return {
+            "started": self.started,
+            "used": len(self.used),
+            "wasted": self.started - len(self.used),
+        }
+
+
+class Prefetcher:
+    """Decides which reads to start before the model asks for them, and keeps
+    the hit/waste record that decides whether it is still worth it"""
+
+    def __init__(self, workers=PREFETCH_WORKERS):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="prefetch"
+        )
+        self.lock = threading.Lock()
+        self.recent = {call: deque(maxlen=50) for call in CANDIDATES}
+        self.totals = {call: [0, 0] for call in CANDIDATES}
+        # Prefetches not started because the endpoint's rate bucket was empty
+        self.throttled = {call: 0 for call in CANDIDATES}
+        self.history = OrderedDict()
+
+    def record(self, call, used):
+        with self.lock:
+            self.recent[call].append(used)
+            self.totals[call][0] += 1
+            self.totals[call][1] += used
+
+    def remember(self, user_key, called):
+        with self.lock:
+            self.history.setdefault(user_key, deque(maxlen=HISTORY_LENGTH)).append(
+                called
+            )
+            self.history.move_to_end(user_key)
+            while len(self.history) > HISTORY_USERS:
+                self.history.popitem(last=False)
+
+    def _hit_rate(self, call):
+        recent = self.recent[call]
+        if len(recent) < PREFETCH_MIN_SAMPLES:
+            return None
+        return sum(recent) / len(recent)
+
+    def choose(self, user_key, text):
+        """(platform, function, params) to prefetch for a request: calls made,
+        with the same parameters, by at least half of the user's last requests,
+        plus bare calls its text points at unless those are mostly wasted lately"""
+        with self.lock:
+            past = list(self.history.get(user_key, ()))
+            rates = {call: self._hit_rate(call) for call in CANDIDATES}
+
+        chosen = OrderedDict()
+        if len(past) >= 2:
+            counts = {}
+            for keys in past:
+                for key in keys:
+                    counts[key] = counts.get(key, 0) + 1
+            for key, count in counts.items():
+                if 2 * count >= len(past):
+                    chosen[key] = json.loads(key[2])
+        for (platform, function), pattern in _PATTERNS.items():
+            rate = rates[(platform, function)]
+            if pattern.search(text) and (rate is None or rate >= PREFETCH_MIN_HIT_RATE):
+                bare = (platform, function, CallMemo.canonical_params({}))
+                chosen.setdefault(bare, {})
+        return [(key[0], key[1], params) for key, params in chosen.items()]
+
+    def start(self, user, text, memo, admission=None):
+        """Start the chosen calls in the background; run with the request's
+        context so they see its time context. With `admission`, each call to
+        an Apps Script endpoint needs a token from that endpoint's bucket."""
+        user_key = AdmissionController.user_key(user)
+        prefetch = RequestPrefetch(self, user_key, memo)
+        if not isinstance(user, dict):
+            return prefetch
+        for platform, function, params in self.choose(user_key, text):
+            # Remembered calls may name a source, resolved as main.py does
+            try:
+                call_user, call_params = resolve_source(user, platform, params)
+            except ValueError:
+                continue
+            setting = _ENDPOINTS.get(platform)
+            endpoint = call_user.get(setting) if setting else None
+            if setting and not endpoint:
+                continue
+            if endpoint and admission is not None and not admission.try_take(endpoint):
+                with self.lock:
+                    self.throttled[(platform, function)] += 1
+                continue
+            call = getattr(getattr(functions, platform), function)
+            context = contextvars.copy_context()
+            # Keyed by the model-facing params (source included), like take()
+            prefetch.futures[memo.key(platform, function, params)] = self.executor.submit(
+                context.run, call, call_user, **call_params
+            )
+        prefetch.started = len(prefetch.futures)
+        if prefetch.futures:
+            print(
+                "=== Prefetching "
+                + ", ".join(f"{k[0]}.{k[1]}" for k in prefetch.futures)
+            )
+        return prefetch
+
+    def metrics(self):
+        with self.lock:
+            metrics = {}
+            for (platform, function), (started, used) in self.totals.items():
+                recent = self.recent[(platform, function)]
+                metrics[f"{platform}.{function}"] = {
+                    "started": started,
+                    "used": used,
+                    "wasted": started - used,
+                    "throttled": self.throttled[(platform, function)],
+                    "recent_hit_rate": round(sum(recent) / len(recent), 3)
+                    if recent
+                    else None,
+                }
+            return metrics
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,101 @@
+import json
+from collections import Counter
+
+from functions import READ_ONLY_FUNCTIONS
+from write_buffer import WriteBuffer
+
+
+class CallMemo:
+    """Per-request memo of read-only connector calls.
+
+    Keyed by (platform, function, canonical params). A mutating call on a
+    platform drops that platform's entries so later reads see fresh data.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def canonical_params(params):
+        canonical = {}
+        for name, value in params.items():
+            if isinstance(value, str):
+                value = value.strip()
+            if value in ("", None):
+                # An empty optional parameter means the same as leaving it out
+                continue
+            canonical[name.strip()] = value
+        return json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+
+    def key(self, platform, function, params):
+        return (platform, function, self.canonical_params(params))
+
+    @staticmethod
+    def is_read_only(platform, function):
+        return (platform, function) in READ_ONLY_FUNCTIONS
+
+    def get(self, platform, function, params):
+        """Return (True, result) on a hit, (False, None) otherwise"""
+        if not self.is_read_only(platform, function):
+            return False, None
+        key = self.key(platform, function, params)
+        if key in self.entries:
+            self.hits += 1
+            return True, self.entries[key]
+        self.misses += 1
+        return False, None
+
+    def peek(self, platform, function, params):
+        """The memoized result or None, without counting a hit or miss"""
+        return self.entries.get(self.key(platform, function, params))
+
+    def put(self, platform, function, params, result):
+        if not self.is_read_only(platform, function):
+            return
+        if isinstance(result, dict) and "error" in result:
+            return
+        self.entries[self.key(platform, function, params)] = result
+
+    def invalidate(self, platform):
+        for key in [k for k in self.entries if k[0] == platform]:
+            del self.entries[key]
+
+
+class RequestState:
+    """State shared by every step of one request, threaded through handle_message"""
+
+    def __init__(self, buffer_writes=False, request_class="interactive", hedge=False):
+        self.memo = CallMemo()
+        # Picks the model routing rules that apply to this request
+        self.request_class = request_class
+        # (step type, model, seconds) of every model call
+        self.model_calls = []
+        # Opt-in: model calls duplicated when slow, and how many of those won
+        self.hedge = hedge
+        self.hedges = 0
+        self.hedges_won = 0
+        # Fixes made to malformed model output, by kind
+        self.repairs = Counter()
+        # Opt-in: write_cells calls held back and sent as one batch per sheet
+        self.writes = WriteBuffer() if buffer_writes else None
+        # Reads started speculatively alongside the first model call
+        self.prefetch = None
+
+    def stats(self):
+        stats = {"memo": {"hits": self.memo.hits, "misses": self.memo.misses}}
+        if self.writes is not None:
+            stats["write_buffer"] = self.writes.stats()
+        if self.prefetch is not None:
+            stats["prefetch"] = self.prefetch.stats()
+        if self.model_calls:
+            stats["model_calls"] = [
+                {"step": step, "model": model, "seconds": round(seconds, 3)}
+                for step, model, seconds in self.model_calls
+            ]
+        if self.hedges:
+            stats["hedging"] = {"hedged": self.hedges, "hedge_won": self.hedges_won}
+        if self.repairs:
+            stats["output_repairs"] = dict(self.repairs)
+        return stats
@@ -0,0 +1,50 @@
+import json
+
+
+class ToolResult:
+    """A connector result kept as a Python object through the agent loop.
+
+    The prompt-ready <function_result> text is rendered once, on first use,
+    and cached, so later steps reuse it instead of parsing and re-serializing
+    the payload again. The decoded value is released once rendered; only the
+    text is needed from then on.
+    """
+
+    __slots__ = ("platform", "function", "value", "_text")
+
+    def __init__(self, platform, function, value):
+        self.platform = platform
+        self.function = function
+        self.value = value
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._render()
+            self.value = None
+        return self._text
+
+    def _render(self):
+        try:
+            if isinstance(self.value, (dict, list)):
+                result_str = json.dumps(self.value, separators=(",", ":"))
+            else:
+                result_str = str(self.value)
+        except Exception as e:
+            print(f"Error formatting function result: {e}")
+            result_str = f"Error formatting result: {str(e)}"
+
+        return f"""<function_result>
+  <platform>{self.platform}</platform>
+  <function>{self.function}</function>
+  <result>{result_str}</result>
+</function_result>"""
+
+    def __str__(self):
+        return self.text
+
+
+def serialize_call_responses(call_responses):
+    """Plain-string view of call_responses for JSON responses and checkpoints"""
+    return [str(entry) for entry in call_responses]
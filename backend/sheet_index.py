@@ -0,0 +1,202 @@
+import os
+import threading
+from collections import OrderedDict
+
+from sheet_query import (
+    DEFAULT_LIMIT,
+    QueryError,
+    SheetQuery,
+    column_letter,
+    grid_has_header,
+    is_number,
+    parse_date,
+    sheet_grid,
+)
+
+# Sheet versions whose schema and key indexes are kept, oldest dropped first
+INDEX_CACHE_SIZE = int(os.getenv("SHEET_INDEX_CACHE_SIZE", "16"))
+SAMPLE_SIZE = 3
+
+
+def index_key(value):
+    """Hash key under which a cell value is indexed and looked up: text is
+    matched case- and whitespace-insensitively, and 1043, 1043.0 and "1043"
+    are the same key"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if is_number(value):
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+    text = str(value).strip().lower()
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    if number != number or number in (float("inf"), float("-inf")):
+        return text
+    return str(int(number)) if number.is_integer() else repr(number)
+
+
+def _column_type(values):
+    if not values:
+        return "empty"
+    if all(is_number(v) for v in values):
+        return "number"
+    if all(isinstance(v, bool) for v in values):
+        return "boolean"
+    if all(parse_date(v) for v in values):
+        return "date"
+    return "string"
+
+
+class SheetIndex:
+    """Schema of one sheet version and hash indexes on its columns.
+
+    The schema (header, column types, row count, key candidates) is worked
+    out once; a column's index, {index_key(value): [body positions]}, is
+    built the first time rows are looked up by it.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.has_header = grid_has_header(grid)
+        self.body = grid[1:] if self.has_header else grid
+        header = grid[0] if self.has_header else []
+        width = max((len(row) for row in grid), default=0)
+        self.names = [
+            str(header[i]).strip() if i < len(header) and header[i] not in ("", None)
+            else column_letter(i)
+            for i in range(width)
+        ]
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self._schema = None
+
+    @classmethod
+    def from_sheet(cls, sheet):
+        return cls(sheet_grid(sheet))
+
+    def column(self, name):
+        """0-based index of a column named by header text or letter"""
+        col = SheetQuery._resolve(self.names, name)
+        if col >= len(self.names):
+            raise QueryError(f"Unknown column {name!r}; columns are {self.names}")
+        return col
+
+    def _values(self, col):
+        return [row[col] if col < len(row) else "" for row in self.body]
+
+    def schema(self):
+        if self._schema is None:
+            columns = []
+            for col, name in enumerate(self.names):
+                filled = [v for v in self._values(col) if v not in ("", None)]
+                keys = {index_key(v) for v in filled}
+                columns.append(
+                    {
+                        "name": name,
+                        "letter": column_letter(col),
+                        "type": _column_type(filled),
+                        "filled": len(filled),
+                        "distinct": len(keys),
+                        # Every row has its own value: usable as a lookup key
+                        "unique": bool(filled) and len(keys) == len(self.body),
+                        "sample": filled[:SAMPLE_SIZE],
+                    }
+                )
+            self._schema = {
+                "success": True,
+                "rows": len(self.body),
+                "hasHeader": self.has_header,
+                "columns": columns,
+            }
+        return self._schema
+
+    def index(self, col):
+        with self.lock:
+            index = self.indexes.get(col)
+            if index is None:
+                index = {}
+                for position, value in enumerate(self._values(col)):
+                    if value not in ("", None):
+                        index.setdefault(index_key(value), []).append(position)
+                self.indexes[col] = index
+            return index
+
+    def lookup(self, column, values, select=None, limit=DEFAULT_LIMIT):
+        """Rows whose `column` holds one of `values`, in sheet order"""
+        col = self.column(column)
+        if not isinstance(values, list):
+            values = [values]
+        wanted = (
+            [self.column(name) for name in select]
+            if select
+            else list(range(len(self.names)))
+        )
+        index = self.index(col)
+
+        positions = set()
+        missing = []
+        for value in values:
+            found = index.get(index_key(value))
+            if found:
+                positions.update(found)
+            else:
+                missing.append(value)
+        positions = sorted(positions)
+
+        first_row = 2 if self.has_header else 1
+        result = {
+            "success": True,
+            "columns": [self.names[i] for i in wanted],
+            "rows": [
+                [self.body[p][i] if i < len(self.body[p]) else "" for i in wanted]
+                for p in positions[:limit]
+            ],
+            # Sheet row numbers, e.g. for write_cells
+            "rowNumbers": [p + first_row for p in positions[:limit]],
+            "matched": len(positions),
+        }
+        if missing:
+            result["missing"] = missing
+        return result
+
+
+class IndexCache:
+    """SheetIndex per (endpoint, sheet name, version token); a new version of
+    a sheet gets a new index, so a cached one never goes stale"""
+
+    def __init__(self, size=INDEX_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, endpoint, sheet_name, version, sheet):
+        key = (endpoint, sheet_name or "", version)
+        if version:
+            with self.lock:
+                index = self.entries.get(key)
+                if index is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return index
+        index = SheetIndex.from_sheet(sheet)
+        with self.lock:
+            self.builds += 1
+            if version:
+                self.entries[key] = index
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return index
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "builds": self.builds,
+            }
+
+
+indexes = IndexCache()
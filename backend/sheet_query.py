@@ -0,0 +1,359 @@
+import json
+import re
+from datetime import datetime
+
+# Mirrors runQuery() in sheets.gs so a query gives the same answer whether it
+# runs inside Apps Script or locally over sheet data we already hold.
+
+OPERATORS = ("=", "!=", ">", ">=", "<", "<=", "contains", "startswith", "in")
+AGGREGATES = ("sum", "avg", "count", "min", "max")
+# Rows returned by row-listing tools (analyze, lookup_rows) unless asked for more
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 500
+
+
+def is_number(value):
+    """True for int and float cell values, not for booleans"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def parse_limit(limit):
+    """Row limit from a tool parameter, DEFAULT_LIMIT when absent"""
+    if limit in (None, ""):
+        return DEFAULT_LIMIT
+    return max(1, min(int(limit), MAX_LIMIT))
+
+
+def column_index(name):
+    """0-based index for a column letter, e.g. "C" -> 2"""
+    index = 0
+    for char in name.upper():
+        index = index * 26 + (ord(char) - 64)
+    return index - 1
+
+
+def column_letter(index):
+    """Column letter for a 0-based index"""
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def cells_to_grid(cells):
+    """Turn read_sheet's {"A1": {"value": ...}} map into a list of row lists"""
+    positions = []
+    columns = {}
+    max_row = max_col = -1
+    for a1, cell in cells.items():
+        letters = a1.rstrip("0123456789")
+        if not letters or len(letters) == len(a1) or not letters.isalpha():
+            continue
+        col = columns.get(letters)
+        if col is None:
+            col = columns[letters] = column_index(letters)
+        row = int(a1[len(letters):]) - 1
+        positions.append(
+            (row, col, cell.get("value") if isinstance(cell, dict) else cell)
+        )
+        if row > max_row:
+            max_row = row
+        if col > max_col:
+            max_col = col
+
+    grid = [[""] * (max_col + 1) for _ in range(max_row + 1)]
+    for row, col, value in positions:
+        grid[row][col] = value
+    return grid
+
+
+def sheet_grid(sheet):
+    """Row lists for a read_sheet result, either decoded straight into rows or
+    in the A1 cell-map form read_sheets returns"""
+    if "rows" in sheet:
+        return sheet["rows"]
+    return cells_to_grid(sheet.get("data", {}))
+
+
+def grid_has_header(grid):
+    """True if the first row of a grid reads as a header: all text, and either
+    at least one column below it is not, or its values never repeat in their
+    columns"""
+    if len(grid) < 2:
+        return False
+    first = [v for v in grid[0] if v not in ("", None)]
+    if not first or not all(isinstance(v, str) for v in first):
+        return False
+    body = grid[1:]
+    for col, title in enumerate(grid[0]):
+        below = [row[col] for row in body if col < len(row) and row[col] not in ("", None)]
+        if below and not all(isinstance(v, str) for v in below):
+            return True
+    # All-text sheet: a header whose labels never reappear below it
+    return all(
+        title not in (row[col] for row in body if col < len(row))
+        for col, title in enumerate(grid[0])
+        if title not in ("", None)
+    )
+
+
+def parse_date(value):
+    """Naive UTC datetime for an ISO date(time) string, None for anything else"""
+    if not isinstance(value, str) or len(value) < 10 or value[4:5] != "-":
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+    return parsed
+
+
+def _parse_spec(value, default):
+    if value in (None, ""):
+        return default
+    if isinstance(value, str):
+        text = value.strip()
+        if text[:1] in ("[", "{"):
+            return json.loads(text)
+        return [part.strip() for part in text.split(",") if part.strip()]
+    return value
+
+
+class QueryError(ValueError):
+    pass
+
+
+class SheetQuery:
+    """select / where / group_by / aggregate / order_by / limit over a grid
+    whose first row is the header. Columns are named by header text or letter."""
+
+    def __init__(
+        self,
+        select=None,
+        where=None,
+        group_by=None,
+        aggregate=None,
+        order_by=None,
+        limit=None,
+    ):
+        self.select = _parse_spec(select, [])
+        self.where = _parse_spec(where, [])
+        if isinstance(self.where, dict):
+            self.where = [self.where]
+        self.group_by = _parse_spec(group_by, [])
+        self.aggregate = _parse_spec(aggregate, [])
+        if isinstance(self.aggregate, dict):
+            self.aggregate = [self.aggregate]
+        self.order_by = _parse_spec(order_by, None)
+        if isinstance(self.order_by, list):
+            self.order_by = self.order_by[0] if self.order_by else None
+        if isinstance(self.order_by, str):
+            self.order_by = {"column": self.order_by}
+        if self.order_by is not None and (
+            not isinstance(self.order_by, dict) or "column" not in self.order_by
+        ):
+            raise QueryError(
+                f"Bad order_by {self.order_by!r}; expected a column name or "
+                '{"column": "Amount", "desc": true}'
+            )
+        self.limit = int(limit) if limit not in (None, "") else None
+
+        for condition in self.where:
+            if not isinstance(condition, dict) or "column" not in condition:
+                raise QueryError(
+                    f"Bad where condition {condition!r}; expected objects like "
+                    '{"column": "Category", "op": "=", "value": "Food"}'
+                )
+            if condition.get("op", "=") not in OPERATORS:
+                raise QueryError(f"Unknown operator {condition.get('op')!r}")
+        for aggregate in self.aggregate:
+            if not isinstance(aggregate, dict):
+                raise QueryError(
+                    f"Bad aggregate {aggregate!r}; expected objects like "
+                    '{"op": "sum", "column": "Amount"}'
+                )
+            if aggregate.get("op") not in AGGREGATES:
+                raise QueryError(f"Unknown aggregate {aggregate.get('op')!r}")
+
+    def to_params(self):
+        """JSON-ready form sent to sheets.gs"""
+        return {
+            "select": self.select,
+            "where": self.where,
+            "groupBy": self.group_by,
+            "aggregate": self.aggregate,
+            "orderBy": self.order_by,
+            "limit": self.limit,
+        }
+
+    @staticmethod
+    def _resolve(header, name, width=None):
+        """Index of a column named by header text or letter; with `width`, a
+        letter past the last column is unknown too"""
+        name = str(name).strip()
+        for i, title in enumerate(header):
+            if str(title).strip().lower() == name.lower():
+                return i
+        if re.fullmatch(r"[A-Za-z]{1,3}", name):
+            index = column_index(name)
+            if width is None or index < width:
+                return index
+        raise QueryError(f"Unknown column {name!r}")
+
+    @staticmethod
+    def _title(header, i):
+        if i < len(header) and header[i] != "":
+            return str(header[i])
+        return column_letter(i)
+
+    def _order_index(self, header, width, columns, sources):
+        """Result column to sort on: one named like the order_by column, else
+        the first one computed from that sheet column (`sources` holds each
+        result column's sheet column)"""
+        name = str(self.order_by["column"]).strip()
+        lowered = [str(c).strip().lower() for c in columns]
+        if name.lower() in lowered:
+            return lowered.index(name.lower())
+        source = self._resolve(header, name, width)
+        if source in sources:
+            return sources.index(source)
+        raise QueryError(f"Cannot order by {name!r}; result columns are {columns}")
+
+    @classmethod
+    def _compare(cls, left, op, right):
+        if op == "in":
+            options = right if isinstance(right, list) else [right]
+            return any(cls._compare(left, "=", option) for option in options)
+        if op == "contains":
+            return str(right).lower() in str(left).lower()
+        if op == "startswith":
+            return str(left).lower().startswith(str(right).lower())
+
+        if is_number(left) and not is_number(right):
+            try:
+                right = float(right)
+            except (TypeError, ValueError):
+                pass
+        if not (is_number(left) and is_number(right)):
+            left, right = str(left), str(right)
+
+        if op == "=":
+            return left == right
+        if op == "!=":
+            return left != right
+        if op == ">":
+            return left > right
+        if op == ">=":
+            return left >= right
+        if op == "<":
+            return left < right
+        return left <= right
+
+    @classmethod
+    def _aggregate(cls, op, values):
+        if op == "count":
+            return len([v for v in values if v != ""])
+        numbers = [v for v in values if is_number(v)]
+        if not numbers:
+            return None
+        if op == "sum":
+            return sum(numbers)
+        if op == "avg":
+            return sum(numbers) / len(numbers)
+        if op == "min":
+            return min(numbers)
+        return max(numbers)
+
+    def run(self, grid):
+        if not grid:
+            return {"success": True, "columns": [], "rows": [], "matched": 0}
+        header, body = grid[0], grid[1:]
+        width = max(len(row) for row in grid)
+
+        conditions = [
+            (
+                self._resolve(header, c["column"], width),
+                c.get("op", "="),
+                c.get("value"),
+            )
+            for c in self.where
+        ]
+        matched = [
+            row
+            for row in body
+            if all(
+                self._compare(row[i] if i < len(row) else "", op, value)
+                for i, op, value in conditions
+            )
+        ]
+
+        if self.aggregate or self.group_by:
+            group_columns = [
+                self._resolve(header, name, width) for name in self.group_by
+            ]
+            aggregates = [
+                (
+                    a["op"],
+                    self._resolve(header, a["column"], width)
+                    if a.get("column")
+                    else None,
+                )
+                for a in self.aggregate
+            ]
+            sources = group_columns + [index for _, index in aggregates]
+            groups = {}
+            for row in matched:
+                key = tuple(row[i] if i < len(row) else "" for i in group_columns)
+                groups.setdefault(key, []).append(row)
+            if not group_columns and not groups:
+                groups[()] = []
+
+            columns = [self._title(header, i) for i in group_columns] + [
+                a.get("as")
+                or (f"{a['op']}({a['column']})" if a.get("column") else a["op"])
+                for a in self.aggregate
+            ]
+            rows = []
+            for key, group_rows in groups.items():
+                values = list(key)
+                for op, index in aggregates:
+                    column_values = (
+                        [r[index] if index < len(r) else "" for r in group_rows]
+                        if index is not None
+                        else [1] * len(group_rows)
+                    )
+                    values.append(self._aggregate(op, column_values))
+                rows.append(values)
+        else:
+            indexes = (
+                [self._resolve(header, name, width) for name in self.select]
+                if self.select
+                else list(range(len(header)))
+            )
+            sources = indexes
+            columns = [self._title(header, i) for i in indexes]
+            rows = [[row[i] if i < len(row) else "" for i in indexes] for row in matched]
+
+        if self.order_by:
+            index = self._order_index(header, width, columns, sources)
+            rows.sort(
+                key=lambda r: (
+                    r[index] is None,
+                    (0, r[index]) if is_number(r[index]) else (1, str(r[index])),
+                ),
+                reverse=bool(self.order_by.get("desc")),
+            )
+
+        if self.limit is not None:
+            rows = rows[: self.limit]
+
+        return {
+            "success": True,
+            "columns": columns,
+            "rows": rows,
+            "matched": len(matched),
+        }
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+from sheet_query import column_index
+
+# Sheets whose last known contents are kept for diffing writes
+SNAPSHOT_LIMIT = 16
+
+
+def _split_a1(a1):
+    letters = a1.rstrip("0123456789")
+    if not letters or len(letters) == len(a1) or not letters.isalpha():
+        return None
+    return int(a1[len(letters):]) - 1, column_index(letters)
+
+
+def _same_value(left, right):
+    # Sheets tells 1, "1" and TRUE apart, so compare kinds as well as values;
+    # only ints and floats (5 vs 5.0 after a JSON round trip) mix
+    numbers = (int, float)
+    if (
+        isinstance(left, numbers)
+        and isinstance(right, numbers)
+        and not isinstance(left, bool)
+        and not isinstance(right, bool)
+    ):
+        return left == right
+    return type(left) is type(right) and left == right
+
+
+class SheetSnapshot:
+    """Cell values and formulas of one sheet at a version token.
+
+    Cells written since the read keep their new formula but an unknown value,
+    since the sheet recalculates it; a formula cell only ever matches a write
+    of the same formula, so a stale computed value can't cause a skip.
+    """
+
+    def __init__(self, version, rows, formulas):
+        self.version = version
+        self.rows = rows
+        self.formulas = dict(formulas)
+        self.written = {}
+
+    @staticmethod
+    def normalize(a1):
+        return a1.replace("$", "").strip().upper()
+
+    def cell(self, a1):
+        """(value, formula) for an A1 address; blank cells are ("", None)"""
+        a1 = self.normalize(a1)
+        if a1 in self.written:
+            return self.written[a1]
+        position = _split_a1(a1)
+        if position is None:
+            return None
+        row, col = position
+        value = ""
+        if row < len(self.rows) and col < len(self.rows[row]):
+            value = self.rows[row][col]
+        return value, self.formulas.get(a1)
+
+    def unchanged(self, a1, data):
+        """True if writing `data` ({"value"} or {"formula"}) to `a1` is a no-op"""
+        current = self.cell(a1)
+        if current is None:
+            return False
+        value, formula = current
+        if data.get("formula"):
+            return formula == data["formula"]
+        return formula is None and _same_value(value, data.get("value", ""))
+
+    def apply(self, cells, version):
+        for a1, data in cells.items():
+            a1 = self.normalize(a1)
+            if data.get("formula"):
+                self.written[a1] = (object(), data["formula"])
+            else:
+                self.written[a1] = (data.get("value", ""), None)
+        self.version = version
+
+
+class SnapshotStore:
+    """Latest snapshot per (endpoint, sheet name), fed by reads and writes"""
+
+    def __init__(self, limit=SNAPSHOT_LIMIT):
+        self.limit = limit
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, sheet_name, version, result):
+        """Remember a full read of a sheet (rows + formulas) at `version`"""
+        if not version or result.get("truncated") or "rows" not in result:
+            return
+        snapshot = SheetSnapshot(version, result["rows"], result.get("formulas", {}))
+        with self.lock:
+            self.entries[(endpoint, sheet_name or "")] = snapshot
+            self.entries.move_to_end((endpoint, sheet_name or ""))
+            while len(self.entries) > self.limit:
+                self.entries.popitem(last=False)
+
+    def get(self, endpoint, sheet_name):
+        with self.lock:
+            return self.entries.get((endpoint, sheet_name or ""))
+
+    def discard(self, endpoint, sheet_name):
+        with self.lock:
+            self.entries.pop((endpoint, sheet_name or ""), None)
+
+
+snapshots = SnapshotStore()
@@ -0,0 +1,315 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from sheet_query import (
+    column_letter,
+    grid_has_header,
+    is_number,
+    parse_date,
+    parse_limit,
+    sheet_grid,
+)
+
+OPERATIONS = ("describe", "sum", "mean", "min", "max", "count", "group_by", "sort", "top_k")
+PERIODS = {"day": "datetime64[D]", "month": "datetime64[M]", "year": "datetime64[Y]"}
+
+
+class AnalyzeError(ValueError):
+    pass
+
+
+class Column:
+    """One typed column: float64 for numbers, datetime64[s] for dates and an
+    object array for everything else. Blank cells are NaN / NaT / ""."""
+
+    def __init__(self, name, values):
+        self.name = name
+        non_blank = [v for v in values if v not in ("", None)]
+
+        if non_blank and all(is_number(v) for v in non_blank):
+            self.type = "number"
+            self.data = np.array(
+                [v if is_number(v) else np.nan for v in values], dtype=np.float64
+            )
+            self.valid = ~np.isnan(self.data)
+            return
+
+        # Sample first so text columns don't pay for parsing every value
+        if non_blank and all(parse_date(v) for v in non_blank[:50]):
+            parsed = [parse_date(v) for v in values]
+            if all(p is not None or v in ("", None) for p, v in zip(parsed, values)):
+                self.type = "date"
+                self.data = np.array(
+                    [p if p is not None else "NaT" for p in parsed],
+                    dtype="datetime64[s]",
+                )
+                self.valid = ~np.isnat(self.data)
+                return
+
+        self.type = "string"
+        self.data = np.array(
+            ["" if v is None else str(v) for v in values], dtype=object
+        )
+        self.valid = self.data != ""
+
+    def export(self, value):
+        """Plain JSON value for one element of this column"""
+        if self.type == "number":
+            value = float(value)
+            if np.isnan(value):
+                return None
+            return int(value) if value.is_integer() else round(value, 6)
+        if self.type == "date":
+            if np.isnat(value):
+                return None
+            day = value.astype("datetime64[D]")
+            return str(day) if day == value else str(value)
+        return value
+
+
+class SheetTable:
+    """Columnar, typed view of a sheet for local analysis.
+
+    The first row is taken as the header when grid_has_header() says so;
+    otherwise columns are named by letter.
+    """
+
+    def __init__(self, columns, row_count):
+        self.columns = columns
+        self.row_count = row_count
+        self._by_name = {}
+        for i, column in enumerate(columns):
+            self._by_name.setdefault(column.name.strip().lower(), column)
+            self._by_name.setdefault(column_letter(i).lower(), column)
+
+    @classmethod
+    def from_grid(cls, grid):
+        width = max((len(row) for row in grid), default=0)
+        if grid_has_header(grid):
+            header, body = grid[0], grid[1:]
+        else:
+            header, body = [], grid
+        names = [
+            str(header[i]).strip() if i < len(header) and header[i] not in ("", None)
+            else column_letter(i)
+            for i in range(width)
+        ]
+        columns = [
+            Column(names[i], [row[i] if i < len(row) else "" for row in body])
+            for i in range(width)
+        ]
+        return cls(columns, len(body))
+
+    @classmethod
+    def from_sheet(cls, sheet):
+        """Build from a read_sheet result"""
+        return cls.from_grid(sheet_grid(sheet))
+
+    def column(self, name):
+        if name in (None, ""):
+            raise AnalyzeError("A column is required for this operation")
+        column = self._by_name.get(str(name).strip().lower())
+        if column is None:
+            raise AnalyzeError(
+                f"Unknown column {name!r}; columns are {[c.name for c in self.columns]}"
+            )
+        return column
+
+    def numeric(self, name):
+        column = self.column(name)
+        if column.type != "number":
+            raise AnalyzeError(f"Column {column.name!r} is {column.type}, not numeric")
+        return column
+
+    def describe(self):
+        summary = []
+        for column in self.columns:
+            info = {
+                "name": column.name,
+                "type": column.type,
+                "count": int(column.valid.sum()),
+            }
+            if column.type in ("number", "date") and info["count"]:
+                values = column.data[column.valid]
+                info["min"] = column.export(values.min())
+                info["max"] = column.export(values.max())
+                if column.type == "number":
+                    info["mean"] = column.export(values.mean())
+            elif column.type == "string":
+                info["distinct"] = len(np.unique(column.data[column.valid]))
+            summary.append(info)
+        return {"rows": self.row_count, "columns": summary}
+
+    def reduce(self, operation, name):
+        if operation == "count":
+            column = self.column(name) if name else None
+            return int(column.valid.sum()) if column else self.row_count
+        column = self.numeric(name)
+        values = column.data[column.valid]
+        if values.size == 0:
+            return None
+        reducer = {"sum": np.sum, "mean": np.mean, "min": np.min, "max": np.max}
+        return column.export(reducer[operation](values))
+
+    def _group_keys(self, column, period):
+        if period:
+            if column.type != "date":
+                raise AnalyzeError(f"period needs a date column, {column.name!r} is {column.type}")
+            if period not in PERIODS:
+                raise AnalyzeError(f"period must be one of {sorted(PERIODS)}")
+            return column.data.astype(PERIODS[period])
+        return column.data
+
+    def group_by(self, by, name=None, aggregate="sum", period=None):
+        key_column = self.column(by)
+        keys = self._group_keys(key_column, period)
+        valid = key_column.valid
+        uniques, inverse = np.unique(keys[valid], return_inverse=True)
+        groups = len(uniques)
+
+        if aggregate == "count" and not name:
+            results = np.bincount(inverse, minlength=groups)
+            value_column = None
+        else:
+            value_column = self.numeric(name) if aggregate != "count" else self.column(name)
+            present = value_column.valid[valid]
+            if aggregate == "count":
+                results = np.bincount(inverse[present], minlength=groups)
+            else:
+                values = value_column.data[valid]
+                if aggregate in ("sum", "mean"):
+                    sums = np.bincount(inverse[present], weights=values[present], minlength=groups)
+                    hits = np.bincount(inverse[present], minlength=groups)
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        results = sums if aggregate == "sum" else sums / hits
+                    results = np.where(hits > 0, results, np.nan)
+                elif aggregate in ("min", "max"):
+                    fill = np.inf if aggregate == "min" else -np.inf
+                    results = np.full(groups, fill)
+                    ufunc = np.minimum if aggregate == "min" else np.maximum
+                    ufunc.at(results, inverse[present], values[present])
+                    results[np.isinf(results)] = np.nan
+                else:
+                    raise AnalyzeError("aggregate must be one of sum, mean, min, max, count")
+
+        label = f"{aggregate}({value_column.name})" if value_column else "count"
+        key_label = f"{key_column.name} ({period})" if period else key_column.name
+        if aggregate == "count":
+            exported = [int(v) for v in results]
+        else:
+            exported = [value_column.export(v) for v in results]
+        keys_out = [str(k) if period else key_column.export(k) for k in uniques]
+        return [key_label, label], [[k, v] for k, v in zip(keys_out, exported)]
+
+    def order(self, name, descending=False):
+        """Row positions sorted by a column, blanks last"""
+        column = self.column(name)
+        data = column.data
+        valid_rows = np.flatnonzero(column.valid)
+        keys = data[valid_rows]
+        if column.type == "string":
+            keys = keys.astype(str)
+        order = np.argsort(keys, kind="stable")
+        if descending:
+            order = order[::-1]
+        return np.concatenate([valid_rows[order], np.flatnonzero(~column.valid)])
+
+    def top_k(self, name, k, descending=True):
+        """Row positions of the k largest (or smallest) values, in order"""
+        column = self.numeric(name)
+        valid_rows = np.flatnonzero(column.valid)
+        values = column.data[valid_rows]
+        k = min(k, len(values))
+        if k == 0:
+            return valid_rows[:0]
+        keyed = -values if descending else values
+        if k < len(values):
+            part = np.argpartition(keyed, k - 1)[:k]
+        else:
+            part = np.arange(len(values))
+        part = part[np.argsort(keyed[part], kind="stable")]
+        return valid_rows[part]
+
+    def rows(self, positions, select=None):
+        columns = [self.column(name) for name in select] if select else self.columns
+        return [c.name for c in columns], [
+            [c.export(c.data[i]) for c in columns] for i in positions
+        ]
+
+    def analyze(
+        self,
+        operation,
+        column=None,
+        by=None,
+        aggregate="sum",
+        period=None,
+        n=None,
+        descending=None,
+        select=None,
+    ):
+        if operation not in OPERATIONS:
+            raise AnalyzeError(f"operation must be one of {list(OPERATIONS)}")
+        limit = parse_limit(n)
+
+        if operation == "describe":
+            return {"success": True, **self.describe()}
+        if operation in ("sum", "mean", "min", "max", "count"):
+            return {
+                "success": True,
+                "operation": operation,
+                "column": column,
+                "value": self.reduce(operation, column),
+            }
+        if operation == "group_by":
+            columns, rows = self.group_by(by, column, aggregate, period)
+            if descending is not None:
+                present = [r for r in rows if r[1] is not None]
+                present.sort(key=lambda r: r[1], reverse=bool(descending))
+                rows = present + [r for r in rows if r[1] is None]
+            return {
+                "success": True,
+                "columns": columns,
+                "rows": rows[:limit],
+                "groups": len(rows),
+            }
+
+        if operation == "sort":
+            positions = self.order(column, bool(descending))[:limit]
+        else:
+            positions = self.top_k(column, limit, descending is not False)
+        names, rows = self.rows(positions, select)
+        return {
+            "success": True,
+            "columns": names,
+            "rows": rows,
+            "total": self.row_count,
+        }
+
+
+class TableCache:
+    """A few recently built tables, keyed by the read_sheet result they came
+    from so repeated analyses of one read don't rebuild the columns"""
+
+    def __init__(self, size=4):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, sheet):
+        key = id(sheet)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is sheet:
+                self.entries.move_to_end(key)
+                return entry[1]
+        table = SheetTable.from_sheet(sheet)
+        with self.lock:
+            # Holding the sheet keeps its id from being reused while cached
+            self.entries[key] = (sheet, table)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return table
+
+
+tables = TableCache()
@@ -12,7 +12,11 @@ function doGet(e) {
     case 'listSheets':
       return handleListSheets();
     case 'readSheet':
-      return handleReadSheet(sheetName);
+      return handleReadSheet(sheetName, e.parameter.ifVersion);
+    case 'query':
+      return handleQuery(sheetName, e.parameter.query, e.parameter.ifVersion);
+    case 'readSheets':
+      return handleReadSheets(e.parameter.sheets, e.parameter.ifVersion);
     default:
       return jsonResponse({ error: 'Unknown action' });
   }
@@ -27,12 +31,20 @@ function doPost(e) {
     const action = payload.action;
     const data = payload.data;
     
+    let response;
     switch (action) {
       case 'writeCells':
+        // Replaces the version marker itself so it can report the new one
         return handleWriteCells(data);
+      case 'appendRows':
+        response = handleAppendRows(data);
+        break;
       default:
         return jsonResponse({ error: 'Unknown action' });
     }
+    // After the write, so no reader can pair the new token with old data
+    bumpVersion();
+    return response;
   } catch (error) {
     return jsonResponse({ error: 'Invalid request: ' + error.message });
   }
@@ -44,6 +56,58 @@ function jsonResponse(data) {
     .setMimeType(ContentService.MimeType.JSON);
 }
 
+// Version tokens. Every read returns a `version`; a caller that sends it back
+// as ifVersion gets { notModified: true } instead of the data when nothing
+// changed. With installVersionTriggers() run once, the token is a marker in
+// CacheService replaced on every edit, so an unchanged read is answered
+// without touching the sheet. Without the triggers, edits made in the UI
+// can't be seen, so the token is a hash of the response content instead.
+const VERSION_KEY = 'sheetsVersion';
+const VERSION_TTL = 21600;
+
+function currentMarker() {
+  if (!PropertiesService.getScriptProperties().getProperty('versionTriggers')) {
+    return null;
+  }
+  const cache = CacheService.getScriptCache();
+  let marker = cache.get(VERSION_KEY);
+  if (!marker) {
+    marker = 'm' + Utilities.getUuid();
+    cache.put(VERSION_KEY, marker, VERSION_TTL);
+  }
+  return marker;
+}
+
+function bumpVersion() {
+  CacheService.getScriptCache().remove(VERSION_KEY);
+}
+
+function contentHash(text) {
+  const digest = Utilities.computeDigest(Utilities.DigestAlgorithm.MD5, text);
+  return 'h' + Utilities.base64EncodeWebSafe(digest);
+}
+
+// Send `payload` with its version, or a notModified reply if the caller has it
+function versionedResponse(payload, marker, ifVersion) {
+  const version = marker || contentHash(JSON.stringify(payload));
+  if (ifVersion && ifVersion === version) {
+    return jsonResponse({ notModified: true, version: version });
+  }
+  payload.version = version;
+  return jsonResponse(payload);
+}
+
+// Run once from the editor to have spreadsheet edits replace the version marker
+function installVersionTriggers() {
+  ScriptApp.newTrigger('onSpreadsheetChanged').forSpreadsheet(SPREADSHEET_ID).onEdit().create();
+  ScriptApp.newTrigger('onSpreadsheetChanged').forSpreadsheet(SPREADSHEET_ID).onChange().create();
+  PropertiesService.getScriptProperties().setProperty('versionTriggers', 'true');
+}
+
+function onSpreadsheetChanged() {
+  bumpVersion();
+}
+
 // Get A1 notation for a cell
 function getA1Notation(row, col) {
   let a1 = '';
@@ -77,8 +141,31 @@ function handleListSheets() {
   }
 }
 
-function handleReadSheet(sheetName) {
+// The readSheet payload for a sheet; its hash is the sheet's content version
+function readSheetPayload(sheet) {
+  const lastRow = sheet.getLastRow();
+  const lastCol = sheet.getLastColumn();
+  return {
+    success: true,
+    sheetName: sheet.getName(),
+    data: lastRow === 0 || lastCol === 0
+      ? {}
+      : cellDataFor(sheet.getRange(1, 1, lastRow, lastCol))
+  };
+}
+
+function sheetVersion(sheet, marker) {
+  return marker || contentHash(JSON.stringify(readSheetPayload(sheet)));
+}
+
+function handleReadSheet(sheetName, ifVersion) {
   try {
+    // Read the marker before the cells so an edit in between can only make
+    // the token stale, never the data
+    const marker = currentMarker();
+    if (marker && marker === ifVersion) {
+      return jsonResponse({ notModified: true, version: marker });
+    }
     const ss = SpreadsheetApp.openById(SPREADSHEET_ID);
     const sheet = sheetName ? ss.getSheetByName(sheetName) : ss.getSheets()[0];
     
@@ -86,42 +173,289 @@ function handleReadSheet(sheetName) {
       return jsonResponse({ error: 'Sheet not found' });
     }
     
+    return versionedResponse(readSheetPayload(sheet), marker, ifVersion);
+  } catch (error) {
+    return jsonResponse({ error: 'Failed to read sheet: ' + error.message });
+  }
+}
+
+// Cell dictionary (A1 -> {value, formula}) for a range, keyed by the cells'
+// positions in the sheet
+function cellDataFor(range) {
+  const values = range.getValues();
+  const formulas = range.getFormulas();
+  const firstRow = range.getRow();
+  const firstCol = range.getColumn();
+
+  const cellData = {};
+  for (let row = 0; row < values.length; row++) {
+    for (let col = 0; col < values[row].length; col++) {
+      const a1Notation = getA1Notation(firstRow + row, firstCol + col);
+      const hasFormula = formulas[row][col] !== '';
+      cellData[a1Notation] = {
+        value: values[row][col],
+        ...(hasFormula && { formula: formulas[row][col] })
+      };
+    }
+  }
+  return cellData;
+}
+
+// Read several sheets (or ranges of them) in one execution. The response is
+// newline-delimited JSON: a header line, then one line per requested sheet,
+// so the caller can decode it part by part.
+function handleReadSheets(sheetsJson, ifVersion) {
+  let requested;
+  try {
+    requested = JSON.parse(sheetsJson || '[]');
+  } catch (error) {
+    return jsonResponse({ error: 'Invalid sheets list: ' + error.message });
+  }
+  if (!Array.isArray(requested) || requested.length === 0) {
+    return jsonResponse({ error: 'A list of sheets is required' });
+  }
+
+  const lines = [];
+  let marker;
+  try {
+    marker = currentMarker();
+    if (marker && marker === ifVersion) {
+      return jsonResponse({ notModified: true, version: marker });
+    }
+    const ss = SpreadsheetApp.openById(SPREADSHEET_ID);
+
+    for (const item of requested) {
+      const name = item.name || '';
+      const sheet = name ? ss.getSheetByName(name) : ss.getSheets()[0];
+      if (!sheet) {
+        lines.push(JSON.stringify({ sheetName: name, error: 'Sheet not found' }));
+        continue;
+      }
+      try {
+        let range = null;
+        if (item.range) {
+          range = sheet.getRange(item.range);
+        } else if (sheet.getLastRow() > 0 && sheet.getLastColumn() > 0) {
+          range = sheet.getRange(1, 1, sheet.getLastRow(), sheet.getLastColumn());
+        }
+        lines.push(JSON.stringify({
+          sheetName: sheet.getName(),
+          ...(item.range && { range: range.getA1Notation() }),
+          data: range ? cellDataFor(range) : {}
+        }));
+      } catch (error) {
+        lines.push(JSON.stringify({ sheetName: sheet.getName(), error: error.message }));
+      }
+    }
+  } catch (error) {
+    return jsonResponse({ error: 'Failed to read sheets: ' + error.message });
+  }
+
+  // The header carries the version of all the parts that follow it
+  const version = marker || contentHash(lines.join('\n'));
+  if (ifVersion && ifVersion === version) {
+    return jsonResponse({ notModified: true, version: version });
+  }
+  lines.unshift(JSON.stringify({ success: true, count: requested.length, version: version }));
+  return ContentService.createTextOutput(lines.join('\n'))
+    .setMimeType(ContentService.MimeType.TEXT);
+}
+
+// Query pushdown: filter, project and aggregate next to the data so only the
+// answer crosses the wire. Keep in sync with sheet_query.py.
+function handleQuery(sheetName, queryJson, ifVersion) {
+  try {
+    const marker = currentMarker();
+    if (marker && marker === ifVersion) {
+      return jsonResponse({ notModified: true, version: marker });
+    }
+    const spec = queryJson ? JSON.parse(queryJson) : {};
+    const ss = SpreadsheetApp.openById(SPREADSHEET_ID);
+    const sheet = sheetName ? ss.getSheetByName(sheetName) : ss.getSheets()[0];
+
+    if (!sheet) {
+      return jsonResponse({ error: 'Sheet not found' });
+    }
+
     const lastRow = sheet.getLastRow();
     const lastCol = sheet.getLastColumn();
-    
-    if (lastRow === 0 || lastCol === 0) {
-      return jsonResponse({
-        success: true,
-        sheetName: sheet.getName(),
-        data: {}
-      });
+    const values = lastRow === 0 || lastCol === 0
+      ? []
+      : sheet.getRange(1, 1, lastRow, lastCol).getValues().map(row =>
+          row.map(value => value instanceof Date ? value.toISOString() : value));
+
+    const result = runQuery(values, spec);
+    result.sheetName = sheet.getName();
+    return versionedResponse(result, marker, ifVersion);
+  } catch (error) {
+    return jsonResponse({ error: 'Failed to query sheet: ' + error.message });
+  }
+}
+
+function columnIndex(letters) {
+  let index = 0;
+  for (const char of letters.toUpperCase()) {
+    index = index * 26 + (char.charCodeAt(0) - 64);
+  }
+  return index - 1;
+}
+
+function resolveColumn(header, name) {
+  name = String(name).trim();
+  for (let i = 0; i < header.length; i++) {
+    if (String(header[i]).trim().toLowerCase() === name.toLowerCase()) {
+      return i;
     }
-    
-    const range = sheet.getRange(1, 1, lastRow, lastCol);
-    const values = range.getValues();
-    const formulas = range.getFormulas();
-    
-    // Create a clean dictionary format
-    const cellData = {};
-    for (let row = 0; row < values.length; row++) {
-      for (let col = 0; col < values[row].length; col++) {
-        const a1Notation = getA1Notation(row + 1, col + 1);
-        const hasFormula = formulas[row][col] !== '';
-        cellData[a1Notation] = {
-          value: values[row][col],
-          ...(hasFormula && { formula: formulas[row][col] })
-        };
+  }
+  // Letters past the last column are unknown too
+  if (/^[A-Za-z]{1,3}$/.test(name) && columnIndex(name) < header.length) {
+    return columnIndex(name);
+  }
+  throw new Error('Unknown column ' + name);
+}
+
+function columnTitle(header, i) {
+  return i < header.length && header[i] !== ''
+    ? String(header[i])
+    : getA1Notation(1, i + 1).replace(/\d+$/, '');
+}
+
+function isNumber(value) {
+  return typeof value === 'number';
+}
+
+function compareValues(left, op, right) {
+  if (op === 'in') {
+    const options = Array.isArray(right) ? right : [right];
+    return options.some(option => compareValues(left, '=', option));
+  }
+  if (op === 'contains') {
+    return String(left).toLowerCase().includes(String(right).toLowerCase());
+  }
+  if (op === 'startswith') {
+    return String(left).toLowerCase().startsWith(String(right).toLowerCase());
+  }
+
+  if (isNumber(left) && !isNumber(right) && right !== '' && right !== null && !isNaN(Number(right))) {
+    right = Number(right);
+  }
+  if (!(isNumber(left) && isNumber(right))) {
+    left = String(left);
+    right = String(right);
+  }
+
+  switch (op) {
+    case '=': return left === right;
+    case '!=': return left !== right;
+    case '>': return left > right;
+    case '>=': return left >= right;
+    case '<': return left < right;
+    case '<=': return left <= right;
+    default: throw new Error('Unknown operator ' + op);
+  }
+}
+
+function aggregateValues(op, values) {
+  if (op === 'count') {
+    return values.filter(v => v !== '').length;
+  }
+  const numbers = values.filter(isNumber);
+  if (numbers.length === 0) {
+    return null;
+  }
+  switch (op) {
+    case 'sum': return numbers.reduce((a, b) => a + b, 0);
+    case 'avg': return numbers.reduce((a, b) => a + b, 0) / numbers.length;
+    case 'min': return numbers.reduce((a, b) => Math.min(a, b));
+    case 'max': return numbers.reduce((a, b) => Math.max(a, b));
+    default: throw new Error('Unknown aggregate ' + op);
+  }
+}
+
+function runQuery(values, spec) {
+  if (values.length === 0) {
+    return { success: true, columns: [], rows: [], matched: 0 };
+  }
+  const header = values[0];
+  const cell = (row, i) => i < row.length ? row[i] : '';
+
+  const conditions = (spec.where || []).map(c =>
+    [resolveColumn(header, c.column), c.op || '=', c.value]);
+  const matched = values.slice(1).filter(row =>
+    conditions.every(([i, op, value]) => compareValues(cell(row, i), op, value)));
+
+  let columns;
+  let rows;
+  // Sheet column each result column comes from, for orderBy
+  let sources;
+  const aggregates = spec.aggregate || [];
+  const groupBy = spec.groupBy || [];
+
+  if (aggregates.length > 0 || groupBy.length > 0) {
+    const groupColumns = groupBy.map(name => resolveColumn(header, name));
+    const resolved = aggregates.map(a =>
+      [a.op, a.column ? resolveColumn(header, a.column) : null]);
+    const groups = new Map();
+    for (const row of matched) {
+      const key = groupColumns.map(i => cell(row, i));
+      const id = JSON.stringify(key);
+      if (!groups.has(id)) {
+        groups.set(id, { key: key, rows: [] });
       }
+      groups.get(id).rows.push(row);
     }
-    
-    return jsonResponse({
-      success: true,
-      sheetName: sheet.getName(),
-      data: cellData
+    if (groupColumns.length === 0 && groups.size === 0) {
+      groups.set('[]', { key: [], rows: [] });
+    }
+
+    sources = groupColumns.concat(resolved.map(([, index]) => index));
+    columns = groupColumns.map(i => columnTitle(header, i)).concat(aggregates.map(a =>
+      a.as || (a.column ? a.op + '(' + a.column + ')' : a.op)));
+    rows = [];
+    for (const group of groups.values()) {
+      const out = group.key.slice();
+      for (const [op, index] of resolved) {
+        const columnValues = index !== null
+          ? group.rows.map(r => cell(r, index))
+          : group.rows.map(() => 1);
+        out.push(aggregateValues(op, columnValues));
+      }
+      rows.push(out);
+    }
+  } else {
+    const indexes = (spec.select && spec.select.length > 0)
+      ? spec.select.map(name => resolveColumn(header, name))
+      : header.map((_, i) => i);
+    sources = indexes;
+    columns = indexes.map(i => columnTitle(header, i));
+    rows = matched.map(row => indexes.map(i => cell(row, i)));
+  }
+
+  if (spec.orderBy) {
+    const name = String(spec.orderBy.column).trim();
+    const lowered = columns.map(c => String(c).trim().toLowerCase());
+    let index = lowered.indexOf(name.toLowerCase());
+    if (index === -1) {
+      index = sources.indexOf(resolveColumn(header, name));
+    }
+    if (index === -1) {
+      throw new Error('Cannot order by ' + name + '; result columns are ' + columns.join(', '));
+    }
+    const sortKey = v => v === null ? [2, ''] : isNumber(v) ? [0, v] : [1, String(v)];
+    const direction = spec.orderBy.desc ? -1 : 1;
+    rows.sort((a, b) => {
+      const ka = sortKey(a[index]);
+      const kb = sortKey(b[index]);
+      if (ka[0] !== kb[0]) return (ka[0] - kb[0]) * direction;
+      return (ka[1] < kb[1] ? -1 : ka[1] > kb[1] ? 1 : 0) * direction;
     });
-  } catch (error) {
-    return jsonResponse({ error: 'Failed to read sheet: ' + error.message });
   }
+
+  if (spec.limit !== null && spec.limit !== undefined) {
+    rows = rows.slice(0, spec.limit);
+  }
+
+  return { success: true, columns: columns, rows: rows, matched: matched.length };
 }
 
 function handleWriteCells(data) {
@@ -137,6 +471,15 @@ function handleWriteCells(data) {
       return jsonResponse({ error: 'Sheet not found' });
     }
     
+    // Cells diffed against a snapshot: only safe if the sheet is still at the
+    // snapshot's version, otherwise the caller resends everything
+    if (data.baseVersion) {
+      const current = sheetVersion(sheet, currentMarker());
+      if (current !== data.baseVersion) {
+        return jsonResponse({ error: 'Sheet changed since snapshot', stale: true });
+      }
+    }
+    
     // Process each cell update
     const updates = [];
     for (const [a1Notation, cellData] of Object.entries(data.cells)) {
@@ -148,16 +491,71 @@ function handleWriteCells(data) {
       }
       updates.push(a1Notation);
     }
+    if (updates.length > 0) {
+      SpreadsheetApp.flush();
+      bumpVersion();
+    }
     
+    // Without version triggers the token is a hash of the whole sheet, so
+    // only compute it for a diffed write whose caller asks for it to keep
+    // its snapshot
+    const marker = currentMarker();
+    const wantVersion = data.baseVersion && (marker || data.returnVersion);
     return jsonResponse({
       success: true,
-      updatedCells: updates
+      updatedCells: updates,
+      ...(wantVersion && { version: sheetVersion(sheet, marker) })
     });
   } catch (error) {
     return jsonResponse({ error: 'Failed to write cells: ' + error.message });
   }
 }
 
+// Append rows below the last used row in one setValues call. The script lock
+// serializes concurrent appends so two requests never pick the same row.
+function handleAppendRows(data) {
+  if (!Array.isArray(data.rows) || data.rows.length === 0) {
+    return jsonResponse({ error: 'Rows array is required' });
+  }
+
+  const lock = LockService.getScriptLock();
+  try {
+    lock.waitLock(20000);
+  } catch (error) {
+    return jsonResponse({ error: 'Sheet is busy, try again: ' + error.message });
+  }
+
+  try {
+    const ss = SpreadsheetApp.openById(SPREADSHEET_ID);
+    const sheet = data.sheetName ? ss.getSheetByName(data.sheetName) : ss.getSheets()[0];
+
+    if (!sheet) {
+      return jsonResponse({ error: 'Sheet not found' });
+    }
+
+    const width = data.rows.reduce((max, row) => Math.max(max, row.length), 0);
+    const values = data.rows.map(row =>
+      row.concat(new Array(width - row.length).fill('')));
+
+    const startRow = sheet.getLastRow() + 1;
+    sheet.getRange(startRow, 1, values.length, width).setValues(values);
+    SpreadsheetApp.flush();
+
+    const endRow = startRow + values.length - 1;
+    return jsonResponse({
+      success: true,
+      sheetName: sheet.getName(),
+      range: getA1Notation(startRow, 1) + ':' + getA1Notation(endRow, width),
+      startRow: startRow,
+      rowsAppended: values.length
+    });
+  } catch (error) {
+    return jsonResponse({ error: 'Failed to append rows: ' + error.message });
+  } finally {
+    lock.releaseLock();
+  }
+}
+
 // Simple test function
 function testSheetOperations() {
   Logger.log('Starting sheet operations test...');
@@ -0,0 +1,264 @@
+import codecs
+import json
+import os
+import re
+
+from sheet_query import column_index
+
+# Characters of connector output allowed into the prompt from one read;
+# larger responses are cut off (and the rest never downloaded)
+PROMPT_BUDGET = int(os.getenv("PROMPT_BUDGET_CHARS", "60000"))
+CHUNK_SIZE = 64 * 1024
+
+# The C scanner behind json.loads, called per value without loads' wrapping
+_scan_once = json.JSONDecoder().scan_once
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class ObjectStream:
+    """Incremental decoder for a JSON object whose one large member (an object
+    or array) should be consumed item by item.
+
+    Feeds on text chunks and only keeps the undecoded tail of the input, so
+    memory tracks the largest single item rather than the whole body.
+    Iterating yields ("item", key, value) for members of `stream_key`
+    (key is the index for arrays); every other top-level member is collected
+    in `fields`. Stopping iteration early leaves the rest unread.
+    """
+
+    def __init__(self, chunks, stream_key):
+        self.chunks = iter(chunks)
+        self.stream_key = stream_key
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.done = False
+        self.fields = {}
+
+    def _fill(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            if self.done:
+                raise ValueError("Response ended in the middle of a JSON document")
+            self.done = True
+            chunk = self.utf8.decode(b"", final=True)
+        elif isinstance(chunk, bytes):
+            # A multi-byte character may straddle two chunks
+            chunk = self.utf8.decode(chunk)
+        # Drop what has been consumed before growing the buffer
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def _peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self._fill()
+            if self.done and self.pos >= len(self.buffer):
+                raise ValueError("Unexpected end of JSON response")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(
+                f"Expected {char!r} at offset {self.pos}, found {self.buffer[self.pos]!r}"
+            )
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _scan_once(self.buffer, self.pos)
+            except (StopIteration, json.JSONDecodeError) as error:
+                if self.done:
+                    raise ValueError(f"Invalid JSON at offset {self.pos}") from error
+                self._fill()
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.done and not isinstance(
+                value, (dict, list, str)
+            ):
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def _separator(self, close):
+        """Consume a comma; True if the container ends here instead"""
+        char = self._peek()
+        if char == ",":
+            self.pos += 1
+            return False
+        if char == close:
+            self.pos += 1
+            return True
+        raise ValueError(f"Expected ',' or {close!r} at offset {self.pos}")
+
+    def _batch(self, opening, close):
+        """Decode every whole member already in the buffer with one C-level
+        parse, or return None if no member boundary could be found.
+
+        A prefix ending just before a comma only parses as a complete
+        container when that comma separates two members: cutting inside a
+        string leaves it unterminated and cutting inside a nested value leaves
+        it unbalanced. Only the last few commas are tried.
+        """
+        end = self.buffer.rfind(",", self.pos)
+        for _ in range(4):
+            if end <= self.pos:
+                return None
+            text = opening + self.buffer[self.pos:end] + close
+            try:
+                value, stop = _scan_once(text, 0)
+            except (StopIteration, json.JSONDecodeError):
+                value, stop = None, -1
+            if stop == len(text):
+                self.pos = end
+                return value
+            end = self.buffer.rfind(",", self.pos, end)
+        return None
+
+    def _members(self, close):
+        """Yield (key, value) for an object or (index, value) for an array
+        whose opening bracket was just consumed"""
+        opening = "{" if close == "}" else "["
+        if self._peek() == close:
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            batch = self._batch(opening, close)
+            if batch:
+                for key, value in batch.items() if close == "}" else enumerate(batch, index):
+                    yield key, value
+                index += len(batch)
+            else:
+                # No whole member buffered yet; decode one, reading more input
+                if close == "}":
+                    key = self._value()
+                    self._expect(":")
+                else:
+                    key = index
+                yield key, self._value()
+                index += 1
+            if self._separator(close):
+                return
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            opening = self._peek()
+            if key == self.stream_key and opening in "{[":
+                self.pos += 1
+                for item_key, value in self._members("}" if opening == "{" else "]"):
+                    yield "item", item_key, value
+            else:
+                self.fields[key] = self._value()
+            if self._separator("}"):
+                return
+
+
+def decode_sheet(chunks, budget=None):
+    """Build a readSheet response straight into row lists.
+
+    Cells arrive row by row as {"A1": {"value": ..., "formula": ...}}; they go
+    into `rows` (row 1 first, column A first) and formulas into a separate
+    {A1: formula} map, without materializing the per-cell objects of the
+    whole sheet. With a `budget`, decoding stops after the last whole row
+    that fits, and the rest of the response is never read.
+    """
+    stream = ObjectStream(chunks, "data")
+    rows = []
+    formulas = {}
+    columns = {}
+    size = 0
+    truncated = False
+
+    for _, a1, cell in stream:
+        letters = a1.rstrip("0123456789")
+        col = columns.get(letters)
+        if col is None:
+            col = columns[letters] = column_index(letters)
+        row = int(a1[len(letters):]) - 1
+
+        value = cell.get("value", "") if isinstance(cell, dict) else cell
+        size += value_size(value)
+        formula = cell.get("formula") if isinstance(cell, dict) else None
+        if formula:
+            size += len(formula) + len(a1) + 6
+
+        if budget is not None and size > budget:
+            # Keep only complete rows
+            truncated = True
+            del rows[row:]
+            for key in [k for k in formulas if int(k.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")) > row]:
+                del formulas[key]
+            break
+
+        while len(rows) <= row:
+            rows.append([])
+        cells = rows[row]
+        if len(cells) <= col:
+            cells.extend([""] * (col + 1 - len(cells)))
+        cells[col] = value
+        if formula:
+            formulas[a1] = formula
+
+    if "notModified" in stream.fields or "error" in stream.fields:
+        return dict(stream.fields)
+
+    result = {
+        "success": stream.fields.get("success", True),
+        "sheetName": stream.fields.get("sheetName"),
+        "rows": rows,
+        "formulas": formulas,
+    }
+    if truncated:
+        result["truncated"] = True
+    elif "version" in stream.fields:
+        result["version"] = stream.fields["version"]
+    return result
+
+
+def decode_rows(chunks, key, budget=None):
+    """Decode a response holding a large array under `key` (listEvents rows,
+    syncEvents events), optionally stopping once `budget` is spent"""
+    stream = ObjectStream(chunks, key)
+    items = []
+    size = 0
+    truncated = False
+    for _, _, item in stream:
+        size += value_size(item)
+        if budget is not None and size > budget:
+            truncated = True
+            break
+        items.append(item)
+
+    result = dict(stream.fields)
+    if "notModified" in result or "error" in result:
+        return result
+    result[key] = items
+    if truncated:
+        result["truncated"] = True
+        # Fields after the array were never read and may be stale guesses
+        result.pop("version", None)
+    return result
+
+
+def value_size(value):
+    """Rough size of a value once rendered as compact JSON"""
+    if isinstance(value, str):
+        return len(value) + 3
+    if isinstance(value, (list, dict)):
+        return len(json.dumps(value, separators=(",", ":"), default=str)) + 1
+    return len(str(value)) + 1
+
+
+def response_chunks(response):
+    return response.iter_content(chunk_size=CHUNK_SIZE, decode_unicode=False)
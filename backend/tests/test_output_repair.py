@@ -0,0 +1,223 @@
+import json
+from collections import Counter
+
+import pytest
+
+from output_repair import (
+    FAILURES,
+    RepairStats,
+    TruncatedJSON,
+    extract_calls,
+    repair_json,
+)
+
+
+def call(body, platform="gsheets", function="write_cells"):
+    return (
+        "<function_call>"
+        f"<platform>{platform}</platform><function>{function}</function>"
+        f"<parameters>{body}</parameters>"
+        "</function_call>"
+    )
+
+
+def extract(text, truncated=False):
+    report = Counter()
+    return extract_calls(text, report, truncated), report
+
+
+def params(found):
+    return {p["name"]: p["value"] for p in found["parameters"]}
+
+
+def test_well_formed_output_needs_no_repair():
+    calls, report = extract(
+        "Writing it now.\n"
+        + call('<parameter name="cells">{"A1": {"value": 1}}</parameter>')
+        + "\nDone."
+    )
+    assert calls == [
+        {
+            "platform": "gsheets",
+            "function": "write_cells",
+            "parameters": [{"name": "cells", "value": {"A1": {"value": 1}}}],
+        }
+    ]
+    assert not report
+
+
+def test_plain_parameter_values_are_kept_as_is():
+    calls, _ = extract(call('<parameter name="sheet_name"> Sheet 1 </parameter>'))
+    assert params(calls[0]) == {"sheet_name": " Sheet 1 "}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "< function_call ><platform>gsheets</platform><function>read_sheet</function>"
+        "<parameters><parameter name='sheet_name'>Data</ parameter></parameters>"
+        "</function_call >",
+        "<function_call><platform>gsheets</platform><function>read_sheet</function>"
+        "<parameters><parameter name=sheet_name>Data</parameter></parameters>"
+        "</function_call>",
+    ],
+)
+def test_tag_syntax(text):
+    calls, report = extract(text)
+    assert params(calls[0]) == {"sheet_name": "Data"}
+    assert report["tag_syntax"] >= 1
+
+
+def test_self_closing_parameters():
+    calls, report = extract(
+        "<function_call><platform>io</platform><function>end</function>"
+        "<parameters/></function_call>"
+    )
+    assert calls == [{"platform": "io", "function": "end", "parameters": []}]
+    assert report["tag_syntax"] == 1
+
+
+def test_unclosed_call_followed_by_another_call():
+    calls, report = extract(
+        "<function_call><platform>io</platform><function>continue</function>"
+        "<parameters></parameters>\nsome prose\n"
+        + call("", platform="io", function="end")
+    )
+    assert [c["function"] for c in calls] == ["continue", "end"]
+    assert report["unclosed_call"] == 1
+
+
+def test_unclosed_tags_and_parameter():
+    calls, report = extract(
+        "<function_call><platform>gsheets\n<function>read_sheet</function>"
+        '<parameters><parameter name="sheet_name">Data\n'
+        '<parameter name="limit">5</parameter></parameters></function_call>'
+    )
+    assert calls[0]["platform"] == "gsheets"
+    assert params(calls[0]) == {"sheet_name": "Data", "limit": "5"}
+    assert report["unclosed_tag"] == 2
+
+
+def test_qualified_function_name():
+    calls, report = extract(
+        "<function_call><function>gsheets.list_sheets</function>"
+        "<parameters></parameters></function_call>"
+    )
+    assert calls[0]["platform"] == "gsheets"
+    assert calls[0]["function"] == "list_sheets"
+    assert report["qualified_name"] == 1
+
+
+def test_block_without_function_is_dropped():
+    calls, report = extract(
+        "<function_call><platform>gsheets</platform></function_call>"
+    )
+    assert calls == []
+    assert report["dropped_block"] == 1
+
+
+@pytest.mark.parametrize(
+    "text, expected, kinds",
+    [
+        ('```json\n{"A1": {"value": 1}}\n```', {"A1": {"value": 1}}, {"code_fence"}),
+        ('"{"A1": {"value": 1}}"', {"A1": {"value": 1}}, {"outer_quotes"}),
+        ('"{\\"A1\\": {\\"value\\": 1}}"', {"A1": {"value": 1}}, {"outer_quotes"}),
+        ('{"A1": {"value": 1}}}', {"A1": {"value": 1}}, {"stray_text"}),
+        ('{"A1": {"value": 1}}"', {"A1": {"value": 1}}, {"stray_text"}),
+        ('{"A1": {"value": [1, 2,]},}', {"A1": {"value": [1, 2]}}, {"trailing_comma"}),
+        (
+            '{\\"A1\\": {\\"value\\": \\"say \\\\\\"hi\\\\\\"\\"}}',
+            {"A1": {"value": 'say "hi"'}},
+            {"escaped_quotes"},
+        ),
+        ("{'A1': {'value': True, 'note': None}}", {"A1": {"value": True, "note": None}}, {"python_literal"}),
+    ],
+)
+def test_repair_json_kinds(text, expected, kinds):
+    report = Counter()
+    assert repair_json(text, report) == expected
+    assert set(report) == kinds
+
+
+def test_unclosed_json_is_closed_only_when_allowed():
+    report = Counter()
+    assert repair_json("[1, 2, 3", report, close_open=True) == [1, 2, 3]
+    assert report == Counter(unclosed_json=1)
+    with pytest.raises(TruncatedJSON):
+        repair_json("[1, 2, 3")
+
+
+def test_open_string_is_never_closed():
+    with pytest.raises(TruncatedJSON):
+        repair_json('{"A1": {"value": "hel', close_open=True)
+
+
+def test_unrepairable_json_raises_the_original_error():
+    with pytest.raises(json.JSONDecodeError) as raised:
+        repair_json('{"A1": nope}')
+    assert not isinstance(raised.value, TruncatedJSON)
+
+
+def test_json_closed_inside_complete_tags():
+    calls, report = extract(call('<parameter name="rows">[[1, 2], [3, 4]</parameter>'))
+    assert params(calls[0]) == {"rows": [[1, 2], [3, 4]]}
+    assert report["unclosed_json"] == 1
+
+
+def test_brace_text_that_is_not_json_stays_a_string():
+    calls, report = extract(
+        call(
+            '<parameter name="title">{tbd} sync</parameter>'
+            '<parameter name="note">[1, 2] apples</parameter>',
+            platform="calendar",
+            function="create_event",
+        )
+    )
+    assert params(calls[0]) == {"title": "{tbd} sync", "note": "[1, 2] apples"}
+    assert report["unparsed_json"] == 2
+
+
+CUT_OFF = (
+    "<function_call><platform>gsheets</platform><function>write_cells</function>"
+    '<parameters><parameter name="cells">{"A1": {"value": 1250'
+)
+
+
+def test_cut_off_value_is_not_completed():
+    calls, report = extract(CUT_OFF)
+    # Left as the raw text, which write_cells then rejects
+    assert params(calls[0]) == {"cells": '{"A1": {"value": 1250'}
+    assert report["truncated_json"] == 1
+    assert "unclosed_json" not in report
+
+
+def test_cut_off_array_is_not_shortened():
+    calls, report = extract(
+        "<function_call><platform>gsheets</platform><function>append_rows</function>"
+        '<parameters><parameter name="rows">[[1, 2, 3]'
+    )
+    assert params(calls[0]) == {"rows": "[[1, 2, 3]"}
+    assert report["truncated_json"] == 1
+
+
+def test_truncated_reply_drops_its_unclosed_last_call():
+    calls, report = extract(call("", platform="io", function="continue") + CUT_OFF, True)
+    assert [c["function"] for c in calls] == ["continue"]
+    assert report["truncated_call"] == 1
+
+
+def test_truncated_reply_keeps_closed_calls():
+    calls, report = extract(call("", platform="io", function="end"), True)
+    assert len(calls) == 1
+    assert "truncated_call" not in report
+
+
+def test_stats_separate_repairs_from_failures():
+    stats = RepairStats()
+    stats.record(Counter(tag_syntax=2), outputs=1, calls=1)
+    stats.record(Counter(truncated_call=1), outputs=1, calls=0)
+    metrics = stats.metrics()
+    assert metrics["outputs"] == 2
+    assert metrics["repaired_outputs"] == 1
+    assert metrics["repairs"] == {"tag_syntax": 2}
+    assert metrics["failures"] == {kind: int(kind == "truncated_call") for kind in FAILURES}
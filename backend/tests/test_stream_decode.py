@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+from stream_decode import ObjectStream, decode_rows, decode_sheet
+
+
+def pieces(body, size):
+    """`body` as UTF-8 chunks of `size` bytes, cutting anywhere"""
+    data = body.encode("utf-8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def every_split(body):
+    """`body` cut into two chunks at every byte offset"""
+    data = body.encode("utf-8")
+    for i in range(1, len(data)):
+        yield [data[:i], data[i:]]
+
+
+def read(chunks, stream_key):
+    stream = ObjectStream(chunks, stream_key)
+    items = [(key, value) for _, key, value in stream]
+    return items, stream.fields
+
+
+DOCUMENT = {
+    "success": True,
+    "data": {
+        "A1": {"value": 'say "hi" \\ back'},
+        "B1": {"value": "café – \U0001f600"},
+        "A2": {"value": 12345.678e-2},
+        "B2": {"value": "", "formula": "=SUM(A1:A2)"},
+        "A3": {"value": "line\nbreak\ttab"},
+    },
+    "version": "v7",
+}
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_object_members_survive_any_chunk_boundary(ensure_ascii):
+    # ensure_ascii=True puts \uXXXX escapes in the text, False raw multi-byte
+    # characters; either way every byte offset must be a safe place to cut
+    body = json.dumps(DOCUMENT, ensure_ascii=ensure_ascii)
+    expected = list(DOCUMENT["data"].items())
+    for chunks in every_split(body):
+        items, fields = read(chunks, "data")
+        assert items == expected
+        assert fields == {"success": True, "version": "v7"}
+
+
+def test_array_members_in_small_chunks():
+    rows = [[i, f"row \"{i}\"", {"nested": [i, None]}, -i / 4] for i in range(50)]
+    body = json.dumps({"rows": rows, "next": None})
+    for size in (1, 2, 3, 7, 64):
+        items, fields = read(pieces(body, size), "rows")
+        assert [value for _, value in items] == rows
+        assert [key for key, _ in items] == list(range(50))
+        assert fields == {"next": None}
+
+
+def test_number_cut_at_the_end_of_a_chunk():
+    items, _ = read([b'{"rows": [12', b"34, 5", b"6]}"], "rows")
+    assert items == [(0, 1234), (1, 56)]
+
+
+def test_text_chunks_are_accepted():
+    items, _ = read(['{"rows": ["a\\', '"b"]}'], "rows")
+    assert items == [(0, 'a"b')]
+
+
+def test_empty_stream_member():
+    items, fields = read([b'{"rows": [], "version": 1}'], "rows")
+    assert items == []
+    assert fields == {"version": 1}
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        '{"rows": [1, 2',
+        '{"rows": ["unterminated',
+        '{"rows": ["escape \\',
+        '{"rows": [1, 2]',
+        '{"rows": [1, 2], "version": ',
+        "",
+    ],
+)
+def test_truncated_body_raises(body):
+    for chunks in [[body.encode()], pieces(body, 1)]:
+        with pytest.raises(ValueError):
+            read(chunks, "rows")
+
+
+def test_invalid_body_raises():
+    with pytest.raises(ValueError):
+        read([b'{"rows": [1 2]}'], "rows")
+
+
+def test_decode_sheet_builds_rows_and_formulas():
+    result = decode_sheet(pieces(json.dumps(dict(DOCUMENT, sheetName="Data")), 5))
+    assert result == {
+        "success": True,
+        "sheetName": "Data",
+        "rows": [
+            ['say "hi" \\ back', "café – \U0001f600"],
+            [123.45678, ""],
+            ["line\nbreak\ttab"],
+        ],
+        "formulas": {"B2": "=SUM(A1:A2)"},
+        "version": "v7",
+    }
+
+
+def test_decode_sheet_budget_keeps_whole_rows():
+    cells = {f"{col}{row}": {"value": "x" * 10} for row in (1, 2, 3) for col in "AB"}
+    cells["A3"]["formula"] = "=A1"
+    body = json.dumps({"success": True, "data": cells, "version": "v1"})
+    result = decode_sheet(pieces(body, 8), budget=60)
+    assert result["rows"] == [["x" * 10] * 2, ["x" * 10] * 2]
+    assert result["formulas"] == {}
+    assert result["truncated"] is True
+    assert "version" not in result
+
+
+def test_decode_sheet_passes_not_modified_through():
+    assert decode_sheet([b'{"notModified": true, "version": "v1"}']) == {
+        "notModified": True,
+        "version": "v1",
+    }
+
+
+def test_decode_rows_budget():
+    body = json.dumps({"rows": [["event"] * 3] * 10, "version": "v2"})
+    result = decode_rows(pieces(body, 4), "rows", budget=60)
+    assert result["rows"] == [["event"] * 3] * 2
+    assert result["truncated"] is True
+    assert "version" not in result
@@ -0,0 +1,103 @@
+import contextvars
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from tzlocal import get_localzone
+
+_current = contextvars.ContextVar("time_context", default=None)
+_LAST_SECOND = timedelta(hours=23, minutes=59, seconds=59)
+
+
+class TimeContext:
+    """Timezone and "now" resolved once per request.
+
+    Naive datetimes are read in the user's zone (from their settings, falling
+    back to the server's). Ambiguous local times during a DST fall-back pick
+    the first occurrence and times skipped by a spring-forward are shifted
+    past the gap, following zoneinfo's fold semantics.
+    """
+
+    def __init__(self, tz, now=None):
+        self.tz = tz
+        self.now = now or datetime.now(tz)
+        # UTC offset per local day (ordinal) without a DST transition, so a
+        # bulk import does one zone lookup per day instead of one per value
+        self._offsets = {}
+
+    @classmethod
+    def for_user(cls, user, timezone_name=None):
+        name = timezone_name or (
+            user.get("timezone") if isinstance(user, dict) else None
+        )
+        if name:
+            try:
+                return cls(ZoneInfo(name))
+            except (ZoneInfoNotFoundError, ValueError):
+                print(f"=== Unknown timezone {name!r}, using the server's")
+        return cls(get_localzone())
+
+    def _offset(self, naive):
+        day = naive.toordinal()
+        offset = self._offsets.get(day)
+        if offset is not None:
+            return offset
+
+        midnight = datetime.fromordinal(day)
+        offset = self.tz.utcoffset(midnight)
+        if offset == self.tz.utcoffset(midnight + _LAST_SECOND):
+            self._offsets[day] = offset
+            return offset
+        # A transition falls on this day; resolve this time on its own
+        return self.tz.utcoffset(naive)
+
+    def parse_utc(self, value, is_end=False):
+        """Naive UTC datetime for an ISO string, date or None (now / now + 1h)"""
+        if not value:
+            dt = self.now + timedelta(hours=1) if is_end else self.now
+            return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+        if "T" not in value:
+            value = f"{value}T{'23:59:59' if is_end else '00:00:00'}"
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+        if dt.tzinfo is None:
+            return dt - self._offset(dt)
+        return dt.replace(tzinfo=None) - dt.utcoffset()
+
+    def to_utc(self, value, is_end=False):
+        """UTC string in the "%Y-%m-%dT%H:%M:%SZ" form calendar.gs expects"""
+        utc = self.parse_utc(value, is_end)
+        if utc.microsecond:
+            return utc.isoformat(timespec="seconds") + "Z"
+        return utc.isoformat() + "Z"
+
+    def normalize_events(self, events, fields=(("start", False), ("end", True))):
+        """Copy of `events` with every start/end converted to UTC in one pass"""
+        normalized = []
+        to_utc = self.to_utc
+        for event in events:
+            event = dict(event)
+            for field, is_end in fields:
+                event[field] = to_utc(event.get(field), is_end)
+            normalized.append(event)
+        return normalized
+
+    def local_iso(self, timestamp):
+        return datetime.fromtimestamp(timestamp, self.tz).isoformat()
+
+
+def current_time_context(user, timezone_name=None):
+    """The request's TimeContext, or a fresh one when outside a request
+    or when a specific zone is asked for"""
+    context = _current.get()
+    if context is None or timezone_name:
+        return TimeContext.for_user(user, timezone_name)
+    return context
+
+
+def set_time_context(context):
+    return _current.set(context)
+
+
+def reset_time_context(token):
+    _current.reset(token)
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import requests
+
+from stream_decode import response_chunks
+
+# Reads kept (across requests) for conditional re-reads, oldest dropped first
+VERSION_CACHE_SIZE = int(os.getenv("VERSION_CACHE_SIZE", "32"))
+
+
+class VersionedCache:
+    """Last result and version token per (endpoint, read parameters).
+
+    The Apps Script endpoints tag every read with a `version`. Sending it back
+    as `ifVersion` gets a tiny {"notModified": true} reply when nothing
+    changed, in which case the stored result is served instead.
+    """
+
+    def __init__(self, size=VERSION_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.not_modified = 0
+        self.downloads = 0
+
+    @staticmethod
+    def key(endpoint, params, variant=None):
+        return (
+            endpoint,
+            json.dumps(params, sort_keys=True, separators=(",", ":")),
+            variant,
+        )
+
+    def lookup(self, key):
+        """(version, result), or (None, None) when nothing is stored"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, None
+            self.entries.move_to_end(key)
+            return entry
+
+    def store(self, key, version, result):
+        with self.lock:
+            self.entries[key] = (version, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "not_modified": self.not_modified,
+                "downloads": self.downloads,
+            }
+
+    def get(self, endpoint, params, decode=None, variant=None):
+        """GET `params` from `endpoint`, revalidating a stored copy if there is one.
+        Returns the parsed result without its version token."""
+        return self.get_versioned(endpoint, params, decode, variant)[1]
+
+    def get_versioned(self, endpoint, params, decode=None, variant=None):
+        """(version, result) for a conditional GET; version is None when the
+        endpoint didn't send one.
+
+        `decode` turns the streamed body (an iterator of byte chunks) into the
+        result instead of response.json(); `variant` separates stored copies
+        of the same read decoded differently (e.g. under a size budget).
+        """
+        key = self.key(endpoint, params, variant)
+        version, cached = self.lookup(key)
+
+        request_params = dict(params)
+        if version:
+            request_params["ifVersion"] = version
+        if decode is None:
+            result = requests.get(endpoint, params=request_params).json()
+        else:
+            with requests.get(endpoint, params=request_params, stream=True) as response:
+                result = decode(response_chunks(response))
+
+        if result.get("notModified") and cached is not None:
+            with self.lock:
+                self.not_modified += 1
+            return version, cached
+
+        with self.lock:
+            self.downloads += 1
+        new_version = result.pop("version", None)
+        if new_version and "error" not in result:
+            self.store(key, new_version, result)
+        else:
+            self.discard(key)
+        return new_version, result
+
+
+responses = VersionedCache()
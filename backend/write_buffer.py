@@ -0,0 +1,152 @@
+import os
+from collections import OrderedDict
+
+from sheet_query import column_index
+from sheet_snapshot import SheetSnapshot
+
+# Buffer write_cells for every request unless the request says otherwise
+BUFFER_WRITES = os.getenv("BUFFER_WRITES", "").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Sheet functions that never look at cell contents, so pending writes can wait
+_CONTENT_BLIND = {"list_sheets", "write_cells"}
+
+
+def _is_formula(data):
+    # A plain value starting with "=" is turned into a formula by Sheets too
+    return bool(data.get("formula")) or str(data.get("value", "")).startswith("=")
+
+
+class WriteBuffer:
+    """write_cells calls of one request, merged per (endpoint, sheet) and sent
+    at the end.
+
+    Every buffered call is acknowledged right away and its cells merged into
+    the sheet's pending batch, a later write to a cell replacing an earlier
+    one. read_sheet of a sheet whose pending cells are all plain values is
+    answered by laying those cells over the remote read; anything that needs
+    the sheet as Apps Script will see it (formulas, query, append_rows, ...)
+    flushes first. Whatever is left goes out when the request ends. Pending
+    batches are checkpointed with each step, so a resumed request still
+    sends them.
+    """
+
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.calls_buffered = 0
+        self.cells_buffered = 0
+        self.calls_sent = 0
+        # (sheet name, result) of every batch that failed to send
+        self.failed = []
+
+    def add(self, endpoint, sheet_name, cells):
+        sheet_cells = self.pending.setdefault(
+            (endpoint, sheet_name or ""), OrderedDict()
+        )
+        for a1, data in cells.items():
+            sheet_cells[SheetSnapshot.normalize(a1)] = data
+        self.calls_buffered += 1
+        self.cells_buffered += len(cells)
+        return {
+            "success": True,
+            "buffered": True,
+            "cellsBuffered": len(cells),
+            "note": "Queued; written together with this request's other writes when "
+            "the request ends. Reads of these cells already see the new values.",
+        }
+
+    def _pending_for(self, endpoint):
+        return [key for key in self.pending if key[0] == endpoint]
+
+    def _overlays(self, endpoint, sheet_name):
+        """True if pending writes can be laid over a read of `sheet_name`
+        instead of being flushed first"""
+        key = (endpoint, sheet_name or "")
+        if self._pending_for(endpoint) != [key]:
+            # Writes to other sheets, or to the first sheet under another name
+            return False
+        return not any(_is_formula(data) for data in self.pending[key].values())
+
+    def needs_flush(self, endpoint, function, params):
+        """True if gsheets.<function> on `endpoint` must see the pending
+        writes remotely"""
+        if not self._pending_for(endpoint) or function in _CONTENT_BLIND:
+            return False
+        if function == "read_sheet":
+            return not self._overlays(endpoint, params.get("sheet_name", ""))
+        return True
+
+    def overlay(self, endpoint, sheet_name, result):
+        """A read_sheet result with the pending cells of `sheet_name` applied,
+        leaving the (cached) original untouched. None if the sheet has
+        formulas, whose values only Sheets can recalculate, or a pending
+        address can't be placed."""
+        cells = self.pending.get((endpoint, sheet_name or ""))
+        if not cells or "rows" not in result:
+            return result
+        if result.get("formulas"):
+            return None
+        truncated = result.get("truncated")
+        rows = list(result["rows"])
+        for a1, data in cells.items():
+            letters = a1.rstrip("0123456789")
+            if not letters.isalpha() or len(letters) == len(a1):
+                # Not a plain A1 address (a range, another sheet); let Sheets decide
+                return None
+            row = int(a1[len(letters):]) - 1
+            col = column_index(letters)
+            if row >= len(rows):
+                if truncated:
+                    # Past the cut-off; the model never sees that part anyway
+                    continue
+                rows.extend([] for _ in range(row + 1 - len(rows)))
+            cells_row = rows[row] = list(rows[row])
+            if len(cells_row) <= col:
+                cells_row.extend([""] * (col + 1 - len(cells_row)))
+            cells_row[col] = data.get("value", "")
+        return dict(result, rows=rows)
+
+    def flush(self, send, endpoint=None):
+        """Send the pending batches (of just `endpoint`, if given) through
+        `send(endpoint, cells, sheet_name)`; returns [(sheet_name, result)] for
+        the batches that failed"""
+        failed = []
+        keys = self._pending_for(endpoint) if endpoint else list(self.pending)
+        for key in keys:
+            cells = self.pending.pop(key)
+            result = send(key[0], dict(cells), key[1])
+            self.calls_sent += 1
+            if not isinstance(result, dict) or "error" in result:
+                failed.append((key[1], result))
+        self.failed.extend(failed)
+        return failed
+
+    def snapshot(self):
+        """The pending batches as JSON-ready [endpoint, sheet_name, cells]"""
+        return [[key[0], key[1], dict(cells)] for key, cells in self.pending.items()]
+
+    def restore(self, batches):
+        """Queue batches from `snapshot` again, e.g. when resuming a request"""
+        for endpoint, sheet_name, cells in batches:
+            sheet_cells = self.pending.setdefault((endpoint, sheet_name), OrderedDict())
+            sheet_cells.update(cells)
+            # Counted as one call each, whatever it took to build them
+            self.calls_buffered += 1
+            self.cells_buffered += len(cells)
+
+    def stats(self):
+        stats = {
+            "calls_buffered": self.calls_buffered,
+            "cells_buffered": self.cells_buffered,
+            "apps_script_calls": self.calls_sent,
+            "calls_saved": self.calls_buffered - self.calls_sent,
+        }
+        if self.failed:
+            stats["failed"] = [
+                {"sheet_name": sheet_name, "result": result}
+                for sheet_name, result in self.failed
+            ]
+        return stats
@@ -0,0 +1,27 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+// Returns the status, progress and (once finished) result of a background job
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ id: string }> }
+) {
+  try {
+    const { id } = await params;
+
+    const flaskResponse = await fetch(
+      `http://localhost:5001/jobs/${encodeURIComponent(id)}`
+    );
+
+    const data = await flaskResponse.json();
+    return NextResponse.json(data, { status: flaskResponse.status });
+  } catch (error) {
+    console.error('[Jobs API] Error:', error);
+    return NextResponse.json(
+      {
+        error: 'Internal server error',
+        details: error instanceof Error ? error.message : 'Unknown error'
+      },
+      { status: 500 }
+    );
+  }
+}
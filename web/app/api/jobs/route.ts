@@ -0,0 +1,32 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+// Starts a background job on the Flask server. Long multi-step requests run
+// there without being bound by this route's HTTP timeout; poll
+// /api/jobs/[id] for progress and the final result.
+export async function POST(request: NextRequest) {
+  try {
+    const body = await request.json();
+
+    console.log('🔄 [Jobs API] Submitting background job to Flask server');
+
+    const flaskResponse = await fetch('http://localhost:5001/jobs', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
+    });
+
+    const data = await flaskResponse.json();
+    return NextResponse.json(data, { status: flaskResponse.status });
+  } catch (error) {
+    console.error('[Jobs API] Error:', error);
+    return NextResponse.json(
+      {
+        error: 'Internal server error',
+        details: error instanceof Error ? error.message : 'Unknown error'
+      },
+      { status: 500 }
+    );
+  }
+}
@@ -8,7 +8,16 @@ export async function POST(request: NextRequest) {
     console.log('📦 Request body preview:', JSON.stringify(body).substring(0, 100) + '...');
 
     // Check if user endpoints are configured
-    if (!body.user || (!body.user.calendarEndpoint && !body.user.gsheetsEndpoint)) {
+    const user = body.user;
+    const hasNamed = (endpoints?: Record<string, string>) =>
+      !!endpoints && Object.keys(endpoints).length > 0;
+    if (
+      !user ||
+      (!user.calendarEndpoint &&
+        !user.gsheetsEndpoint &&
+        !hasNamed(user.calendarEndpoints) &&
+        !hasNamed(user.gsheetsEndpoints))
+    ) {
       console.warn('⚠️ [Proxy API] No endpoints configured in user settings');
     }
 
@@ -23,13 +32,18 @@ export async function POST(request: NextRequest) {
     if (!flaskResponse.ok) {
       const errorText = await flaskResponse.text();
       console.error(`❌ [Proxy API] Flask server error ${flaskResponse.status}: ${errorText}`);
+      // Pass the backend's backoff hint through when it sheds load
+      const retryAfter = flaskResponse.headers.get('Retry-After');
       
       return NextResponse.json(
         { 
           error: `Flask server error: ${flaskResponse.status}`,
           details: errorText
         }, 
-        { status: flaskResponse.status }
+        {
+          status: flaskResponse.status,
+          headers: retryAfter ? { 'Retry-After': retryAfter } : undefined,
+        }
       );
     }
 
@@ -38,6 +38,7 @@ export default function Home() {
         JSON.stringify({
           calendarEndpoint: "",
           gsheetsEndpoint: "",
+          timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
         })
       )
     }
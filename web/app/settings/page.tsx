@@ -3,17 +3,50 @@
 import { useEffect, useState } from "react"
 import { useRouter } from "next/navigation"
 
+type NamedEndpoints = Record<string, string>
+
+// One "name = URL" line per extra endpoint
+const formatEndpoints = (endpoints?: NamedEndpoints) =>
+  Object.entries(endpoints || {})
+    .map(([name, url]) => `${name} = ${url}`)
+    .join("\n")
+
+const parseEndpoints = (text: string): NamedEndpoints => {
+  const endpoints: NamedEndpoints = {}
+  for (const line of text.split("\n")) {
+    const separator = line.indexOf("=")
+    if (separator === -1) continue
+    const name = line.slice(0, separator).trim()
+    const url = line.slice(separator + 1).trim()
+    if (name && url) endpoints[name] = url
+  }
+  return endpoints
+}
+
 export default function Settings() {
   const router = useRouter()
   const [user, setUser] = useState({
     calendarEndpoint: "",
     gsheetsEndpoint: "",
+    timezone: "",
+  })
+  const [extraEndpoints, setExtraEndpoints] = useState({
+    calendarEndpoints: "",
+    gsheetsEndpoints: "",
   })
 
   useEffect(() => {
     const storedUser = localStorage.getItem("user")
+    const browserTimezone = Intl.DateTimeFormat().resolvedOptions().timeZone
     if (storedUser) {
-      setUser(JSON.parse(storedUser))
+      const parsed = JSON.parse(storedUser)
+      setUser({ timezone: browserTimezone, ...parsed })
+      setExtraEndpoints({
+        calendarEndpoints: formatEndpoints(parsed.calendarEndpoints),
+        gsheetsEndpoints: formatEndpoints(parsed.gsheetsEndpoints),
+      })
+    } else {
+      setUser((prev) => ({ ...prev, timezone: browserTimezone }))
     }
   }, [])
 
@@ -22,8 +55,20 @@ export default function Settings() {
     setUser((prev) => ({ ...prev, [name]: value }))
   }
 
+  const handleExtraChange = (e: React.ChangeEvent<HTMLTextAreaElement>) => {
+    const { name, value } = e.target
+    setExtraEndpoints((prev) => ({ ...prev, [name]: value }))
+  }
+
   const handleSave = () => {
-    localStorage.setItem("user", JSON.stringify(user))
+    localStorage.setItem(
+      "user",
+      JSON.stringify({
+        ...user,
+        calendarEndpoints: parseEndpoints(extraEndpoints.calendarEndpoints),
+        gsheetsEndpoints: parseEndpoints(extraEndpoints.gsheetsEndpoints),
+      })
+    )
     router.push("/")
   }
 
@@ -44,6 +89,18 @@ export default function Settings() {
             />
           </div>
 
+          <div>
+            <label className="block mb-1 text-sm">Other Calendars</label>
+            <textarea
+              name="calendarEndpoints"
+              value={extraEndpoints.calendarEndpoints}
+              onChange={handleExtraChange}
+              rows={2}
+              placeholder="work = https://script.google.com/..."
+              className="w-full p-2 rounded bg-gray-800 border border-gray-700 text-white focus:outline-none focus:ring-2 focus:ring-gray-600"
+            />
+          </div>
+
           <div>
             <label className="block mb-1 text-sm">Google Sheets Endpoint</label>
             <input
@@ -55,6 +112,30 @@ export default function Settings() {
             />
           </div>
 
+          <div>
+            <label className="block mb-1 text-sm">Other Spreadsheets</label>
+            <textarea
+              name="gsheetsEndpoints"
+              value={extraEndpoints.gsheetsEndpoints}
+              onChange={handleExtraChange}
+              rows={2}
+              placeholder="budget = https://script.google.com/..."
+              className="w-full p-2 rounded bg-gray-800 border border-gray-700 text-white focus:outline-none focus:ring-2 focus:ring-gray-600"
+            />
+          </div>
+
+          <div>
+            <label className="block mb-1 text-sm">Timezone</label>
+            <input
+              type="text"
+              name="timezone"
+              value={user.timezone}
+              onChange={handleChange}
+              placeholder="America/Los_Angeles"
+              className="w-full p-2 rounded bg-gray-800 border border-gray-700 text-white focus:outline-none focus:ring-2 focus:ring-gray-600"
+            />
+          </div>
+
           <button
             onClick={handleSave}
             className="w-full py-2 px-4 rounded bg-gray-700 hover:bg-gray-600 text-white transition-colors"